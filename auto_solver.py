@@ -0,0 +1,234 @@
+import json
+import math
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+
+import solver
+
+DEFAULT_MODEL = "solver_model.json"
+FALLBACK_ALGORITHM = "pi"       # used until a cost model has been fitted, the fastest in most check_others sizes
+
+# features the cost model is fitted on, see get_maze_features
+FEATURE_NAMES = ["states", "components", "reward_density", "discount_factor"]
+TERM_NAMES = ["intercept", "log_states", "log_components", "reward_density", "log_horizon"]
+
+def count_components(state_space):
+    """
+    Counts the strongly connected components of the graph between decision states (same count as UtilityAgent.get_state_components)
+      - Whenever a move leads from s to a neighbouring s', the opposite move leads back, so the strongly connected components
+        are just the connected components, found here by min-label hooking + pointer jumping instead of a Python DFS
+
+    Returns:
+        int
+    """
+    num_decision = state_space.num_decision
+    states = np.repeat(np.arange(num_decision), state_space.next_states.shape[1] * state_space.next_states.shape[2])
+    next_states = state_space.next_states[:num_decision].ravel()
+    edges = (next_states != states) & (next_states < num_decision)
+    sources, targets = states[edges], next_states[edges]
+
+    labels = np.arange(num_decision)
+    while(True):
+        source_labels, target_labels = labels[sources], labels[targets]
+        if(np.array_equal(source_labels, target_labels)):
+            break
+        # hook every label onto the smallest label it is connected to, then shortcut the chains to their roots
+        np.minimum.at(labels, source_labels, target_labels)
+        np.minimum.at(labels, target_labels, source_labels)
+        while(True):
+            roots = labels[labels]
+            if(np.array_equal(roots, labels)):
+                break
+            labels = roots
+
+    return int(np.count_nonzero(labels == np.arange(num_decision)))
+
+def get_maze_features(maze, discount_factor=0.99, state_space=None):
+    """
+    Gets the cheap maze features the cost model picks a solver by
+
+    Params:
+        maze: Custom Maze type with helper functions to describe the cells present in the given maze
+        discount_factor: Gamma value the maze is going to be solved with
+        state_space: Already compiled StateSpace of the maze, compiled here if None
+
+    Returns:
+        Dictionary with the FEATURE_NAMES: number of decision states, number of their components,
+        share of the non-wall cells that are reward / punishment cells and the discount factor
+    """
+    space = solver.compile_maze(maze) if state_space is None else state_space
+    return {
+        "states": int(space.num_decision),
+        "components": count_components(space),
+        "reward_density": float((space.num_states - space.num_decision) / max(1, space.num_states)),
+        "discount_factor": float(discount_factor),
+    }
+
+def get_terms(features):
+    """
+    Turns maze features into the terms of the (log exec time) linear cost model, see TERM_NAMES
+    """
+    return np.array([
+        1.0,
+        math.log1p(features["states"]),
+        math.log1p(features["components"]),
+        features["reward_density"],
+        -math.log(max(1e-12, 1 - features["discount_factor"])),     # log of the effective horizon 1 / (1 - y)
+    ])
+
+class CostModel:
+    def __init__(self, weights, samples=None, errors=None, fitted_at=None):
+        """
+        Predicts the exec time of every benchmarked solver from maze features: log(time) = terms . weights
+
+        Params:
+            weights: Dictionary of algorithm name (see benchmark.ALGORITHMS) -> weights per TERM_NAMES
+            samples: Dictionary of algorithm -> number of benchmark results it was fitted on
+            errors: Dictionary of algorithm -> RMS error of the fit in log(time)
+            fitted_at: ISO timestamp of the fit
+        """
+        self.weights = {algorithm: np.asarray(values, dtype=float) for algorithm, values in weights.items()}
+        self.samples = samples or {}
+        self.errors = errors or {}
+        self.fitted_at = fitted_at
+
+    @classmethod
+    def fit(cls, results):
+        """
+        Fits one least squares model per algorithm
+          - Terms that don't vary over the results of an algorithm can't be told apart from the intercept, their weight is fixed
+            at 0 (e.g. log_horizon when every result was solved with the same gamma, see 'benchmark.py run --discount')
+
+        Params:
+            results: Iterable of (algorithm, features, exec_time)
+
+        Returns:
+            CostModel, algorithms with fewer results than fitted terms are left out
+        """
+        rows = {}
+        for algorithm, features, exec_time in results:
+            rows.setdefault(algorithm, []).append((get_terms(features), math.log(max(exec_time, 1e-7))))
+
+        weights, samples, errors = {}, {}, {}
+        for algorithm, pairs in rows.items():
+            terms = np.stack([row for row, _ in pairs])
+            log_times = np.array([log_time for _, log_time in pairs])
+            varying = np.ptp(terms, axis=0) > 1e-9
+            varying[0] = True       # intercept
+            if(len(pairs) < np.count_nonzero(varying)):
+                continue
+            weights[algorithm] = np.zeros(len(TERM_NAMES))
+            weights[algorithm][varying] = np.linalg.lstsq(terms[:, varying], log_times, rcond=None)[0]
+            samples[algorithm] = len(pairs)
+            errors[algorithm] = float(np.sqrt(np.mean((terms @ weights[algorithm] - log_times) ** 2)))
+
+        return cls(weights, samples, errors, datetime.now(timezone.utc).isoformat(timespec="seconds"))
+
+    def predict(self, features):
+        """
+        Returns:
+            Dictionary of algorithm -> predicted exec time in seconds
+        """
+        terms = get_terms(features)
+        return {algorithm: float(np.exp(terms @ weights)) for algorithm, weights in self.weights.items()}
+
+    def choose(self, features, candidates=None):
+        """
+        Picks the algorithm with the lowest predicted exec time
+
+        Params:
+            features: Dictionary from get_maze_features
+            candidates: Algorithms to pick from, defaults to every algorithm of the model
+
+        Returns:
+            algorithm: Name, FALLBACK_ALGORITHM if the model knows none of the candidates
+            predictions: Dictionary of algorithm -> predicted seconds for the candidates
+        """
+        predictions = {algorithm: seconds for algorithm, seconds in self.predict(features).items() if candidates is None or algorithm in candidates}
+        if(not predictions):
+            return FALLBACK_ALGORITHM, predictions
+        return min(predictions, key=predictions.get), predictions
+
+    def save(self, path=DEFAULT_MODEL):
+        model = {
+            "terms": TERM_NAMES,
+            "fitted_at": self.fitted_at,
+            "weights": {algorithm: weights.tolist() for algorithm, weights in self.weights.items()},
+            "samples": self.samples,
+            "errors": self.errors,
+        }
+        with open(path, "w") as file:
+            json.dump(model, file, indent=2)
+
+    @classmethod
+    def load(cls, path=DEFAULT_MODEL):
+        """
+        Reads a model written by save, None if there is no model file yet
+        """
+        if(not os.path.exists(path)):
+            return None
+        with open(path) as file:
+            model = json.load(file)
+        if(model["terms"] != TERM_NAMES):
+            raise ValueError(f"Cost model {path} was fitted on other terms, refit it with 'python benchmark.py fit'")
+
+        return cls(model["weights"], model["samples"], model["errors"], model["fitted_at"])
+
+def fit_from_store(store, path=DEFAULT_MODEL):
+    """
+    Refits the cost model on every benchmark result that has its maze features recorded and saves it
+
+    Params:
+        store: benchmark.BenchmarkStore
+        path: Model file to write
+
+    Returns:
+        CostModel
+    """
+    model = CostModel.fit(store.get_feature_results())
+    model.save(path)
+    return model
+
+def format_model(model):
+    """
+    Formats the fitted weights and errors of a CostModel as a small table
+    """
+    lines = [f"{'algo':<8}{'samples':>9}{'rms(log)':>10}" + "".join(f"{name:>16}" for name in TERM_NAMES)]
+    for algorithm, weights in sorted(model.weights.items()):
+        lines.append(f"{algorithm:<8}{model.samples.get(algorithm, 0):>9}{model.errors.get(algorithm, 0):>10.3f}" + "".join(f"{weight:>16.4f}" for weight in weights))
+    return "\n".join(lines)
+
+def choose_solver(maze, discount_factor=0.99, threshold=0.0001, model_path=DEFAULT_MODEL, candidates=None):
+    """
+    Picks the solver of a maze by the predicted exec time of the fitted cost model and builds its agent
+      - Falls back to FALLBACK_ALGORITHM when there is no model file yet (see 'python benchmark.py fit')
+
+    Params:
+        maze: Custom Maze type with helper functions to describe the cells present in the given maze
+        discount_factor, threshold: Hyperparams of the agent
+        model_path: Cost model file written by fit_from_store
+        candidates: Names from benchmark.ALGORITHMS to pick from, defaults to all of them but RTDP (it only plans from one start state)
+
+    Returns:
+        agent: UtilityAgent / ValueAgent of the picked algorithm
+        algorithm: Picked name from benchmark.ALGORITHMS, see benchmark.get_solve
+    """
+    from benchmark import ALGORITHMS, make_agent      # benchmark imports this module to fit the model
+
+    candidates = list(candidates or (algorithm for algorithm in ALGORITHMS if algorithm != "rtdp"))
+    model = CostModel.load(model_path)
+    features = get_maze_features(maze, discount_factor)
+    if(model is None):
+        algorithm, predictions = FALLBACK_ALGORITHM, {}
+        print(f"No cost model at {model_path}, run 'python benchmark.py fit' to calibrate one!")
+    else:
+        algorithm, predictions = model.choose(features, candidates)
+
+    print(f"Auto solver picked {algorithm} for {features['states']} states in {features['components']} components "
+          f"(reward density {features['reward_density']:.2f}, y = {discount_factor})")
+    for name, seconds in sorted(predictions.items(), key=lambda item: item[1]):
+        print(f"  {name:<8} predicted {seconds:.4f}s")
+
+    return make_agent(algorithm, maze, discount_factor, threshold), algorithm
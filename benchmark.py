@@ -0,0 +1,477 @@
+import argparse
+import contextlib
+import copy
+import functools
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+from auto_solver import DEFAULT_MODEL, fit_from_store, format_model, get_maze_features
+from grid_plotter import plot_data_per_trial
+from helper import MazeCell
+from rtdp import RTDPAgent
+from util_agent import UtilityAgent
+from val_agent import ValueAgent
+
+DEFAULT_DATABASE = "benchmarks.sqlite"
+
+# benchmarked solvers: recorded algorithm name -> (agent, solve method, options of the solve method)
+#   - the q_ ones run the ValueAgent Q-table formulation
+#   - rtdp only plans from a single start state (see get_start_state), so it is never picked for a full solve
+ALGORITHMS = {
+    "vi": ("utility", "value_iteration", {}),
+    "pi": ("utility", "policy_iteration", {}),
+    "q_vi": ("value", "value_iteration", {}),
+    "q_pi": ("value", "policy_iteration", {}),
+    "scc_vi": ("utility", "decomposed_value_iteration", {}),
+    "ae_vi": ("utility", "value_iteration", {"action_elimination": True}),
+    "sor_vi": ("utility", "value_iteration", {"acceleration": "sor"}),
+    "and_vi": ("utility", "value_iteration", {"acceleration": "anderson"}),
+    "inc_pi": ("utility", "policy_iteration", {"incremental": True}),
+    "rtdp": ("rtdp", "solve", {}),
+}
+# solve methods that take the profile / checkpoint options
+PROFILED_METHODS = ("value_iteration", "policy_iteration")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at TEXT NOT NULL,
+    git_commit TEXT NOT NULL,
+    git_dirty INTEGER NOT NULL,
+    machine TEXT NOT NULL,
+    label TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    algorithm TEXT NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    seed INTEGER,
+    trial INTEGER NOT NULL,
+    iterations INTEGER NOT NULL,
+    exec_time REAL NOT NULL,
+    peak_memory INTEGER,
+    stats TEXT
+);
+CREATE INDEX IF NOT EXISTS results_by_size ON results (algorithm, width, height, run_id);
+"""
+
+def get_git_commit():
+    """
+    Returns:
+        commit: Hash of the checked out commit ("unknown" outside a git checkout)
+        dirty: Bool, whether tracked files have uncommitted changes
+    """
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=cwd, capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=cwd, capture_output=True, text=True, check=True).stdout
+        return commit, bool(status.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+
+def get_machine_info():
+    """
+    Returns:
+        Dictionary describing the machine and software the benchmark runs on
+    """
+    return {
+        "hostname": platform.node(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+    }
+
+def measure_solve(solve, *args, **kwargs):
+    """
+    Runs a solve while tracking its peak Python / NumPy heap usage with tracemalloc
+      - Tracing slows every allocation down (1.2 - 3.5x on the check_others solves), don't time the solve run here
+
+    Returns:
+        result: Whatever the solve returned
+        peak_memory: Peak traced bytes during the solve
+    """
+    already_tracing = tracemalloc.is_tracing()
+    if(not already_tracing):
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        result = solve(*args, **kwargs)
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        if(not already_tracing):
+            tracemalloc.stop()
+
+    return result, peak_memory
+
+def make_agent(algorithm, maze, discount_factor=0.99, threshold=0.0001):
+    """
+    Builds the agent that runs one of the ALGORITHMS (RTDP samples its trials with a fixed seed)
+    """
+    agent_name = ALGORITHMS[algorithm][0]
+    if(agent_name == "rtdp"):
+        return RTDPAgent(maze=maze, discount_factor=discount_factor, threshold=threshold, seed=0)
+    agents = {"utility": UtilityAgent, "value": ValueAgent}
+    return agents[agent_name](maze=maze, discount_factor=discount_factor, threshold=threshold)
+
+def get_solve(agent, algorithm, max_steps=10000):
+    """
+    Gets the solve of one of the ALGORITHMS with its options bound, call it with any extra options (e.g. profile)
+      - RTDP plans from get_start_state, max_steps caps its number of trials
+    """
+    agent_name, method, options = ALGORITHMS[algorithm]
+    if(agent_name == "rtdp"):
+        return functools.partial(agent.solve, get_start_state(agent.maze), max_trials=max_steps, **options)
+    return functools.partial(getattr(agent, method), max_steps=max_steps, **options)
+
+def get_start_state(maze):
+    """
+    Gets the (row, col) the RTDP benchmark plans from: the first floor cell in row-major order
+    """
+    return next((rowIdx, colIdx) for rowIdx in range(maze.height) for colIdx in range(maze.width) if maze.grid[rowIdx][colIdx] == MazeCell.FLOOR.value)
+
+def count_iterations(algorithm, agent, result):
+    """
+    Gets the iterations recorded for a solve: the loops / sweeps of the sweeping solvers, the trials of RTDP
+    """
+    if(ALGORITHMS[algorithm][0] == "rtdp"):
+        return agent.stats["trials"]
+    return agent.stats.get("sweeps", len(result[0]))     # decomposed VI returns one history entry per component
+
+def benchmark_solve(agent, algorithm, max_steps=10000, profile=False, measure_memory=True):
+    """
+    Runs one solve of an agent and measures its peak memory
+      - The timed solve runs without tracemalloc, the peak memory comes from a second (silent) solve of a copy of the
+        agent taken before the timed one, so the recorded exec times are not inflated by the tracing
+
+    Params:
+        agent: Agent of the algorithm, see make_agent
+        algorithm: Name from ALGORITHMS
+        max_steps: Max. iterations of the solve
+        profile: Bool to profile every phase of the solve (see profiler.SolveProfiler), much slower. Only the PROFILED_METHODS support it
+        measure_memory: Bool to run the traced solve for the peak memory, skipping it halves the benchmark time
+
+    Returns:
+        result: (utilities, policy, exec_time) as returned by the solve
+        peak_memory: Peak traced bytes, None without measure_memory
+        stats: {"profile": ...} to record with the result when profiling, else None
+    """
+    if(profile):
+        if(ALGORITHMS[algorithm][1] not in PROFILED_METHODS):
+            raise ValueError(f"{algorithm} can't be profiled, only the solvers running {' / '.join(PROFILED_METHODS)} can")
+        result = get_solve(agent, algorithm, max_steps)(profile=True)
+        return result, agent.stats["profile"]["peak_bytes"], {"profile": agent.stats["profile"]}
+
+    memory_agent = copy.deepcopy(agent) if measure_memory else None
+    if(tracemalloc.is_tracing()):
+        print("tracemalloc is already tracing, the benchmarked exec times include its overhead!")
+    result = get_solve(agent, algorithm, max_steps)()
+
+    peak_memory = None
+    if(memory_agent is not None):
+        with contextlib.redirect_stdout(io.StringIO()):     # the solve already printed its messages once
+            _, peak_memory = measure_solve(get_solve(memory_agent, algorithm, max_steps))
+    return result, peak_memory, None
+
+class BenchmarkStore:
+    def __init__(self, path=DEFAULT_DATABASE):
+        """
+        SQLite store of benchmark results, one row per solve, grouped into runs tagged with the git commit and machine
+
+        Params:
+            path: Database file, created with its tables on first use
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def start_run(self, label=None):
+        """
+        Opens a new run for the current git commit and machine
+
+        Returns:
+            run_id: int
+        """
+        commit, dirty = get_git_commit()
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (started_at, git_commit, git_dirty, machine, label) VALUES (?, ?, ?, ?, ?)",
+                (datetime.now(timezone.utc).isoformat(timespec="seconds"), commit, int(dirty), json.dumps(get_machine_info()), label),
+            )
+        return cursor.lastrowid
+
+    def record(self, run_id, algorithm, width, height, seed, trial, iterations, exec_time, peak_memory=None, stats=None):
+        """
+        Stores the result of one solve
+
+        Params:
+            run_id: Run from start_run
+            algorithm: Name of the solver, e.g. "vi" / "pi"
+            width, height: Maze size
+            seed: Seed the maze was generated from (None if unknown)
+            trial: Trial index within the size
+            iterations: Number of iterations of the solve
+            exec_time: Time taken by the solve
+            peak_memory: Peak traced bytes, see measure_solve
+            stats: Optional JSON serializable dictionary of extra solver stats
+        """
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO results (run_id, algorithm, width, height, seed, trial, iterations, exec_time, peak_memory, stats) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_id, algorithm, width, height, seed, trial, int(iterations), float(exec_time), peak_memory,
+                 None if stats is None else json.dumps(stats, default=float)),
+            )
+
+    def get_runs(self):
+        """
+        Returns:
+            List of (run_id, started_at, git_commit, git_dirty, hostname, label), oldest first
+        """
+        rows = self.connection.execute("SELECT id, started_at, git_commit, git_dirty, machine, label FROM runs ORDER BY id").fetchall()
+        return [(run_id, started_at, commit, bool(dirty), json.loads(machine)["hostname"], label) for run_id, started_at, commit, dirty, machine, label in rows]
+
+    def get_size_summary(self, algorithm=None):
+        """
+        Aggregates the trials of every run per algorithm and maze size
+
+        Returns:
+            List of dictionaries with run_id, git_commit, algorithm, width, height, trials, iterations, exec_time (means),
+            peak_memory (max) and discount_factor (from the recorded maze features, None if unknown), ordered by algorithm, size and run
+        """
+        query = (
+            "SELECT r.run_id, runs.git_commit, r.algorithm, r.width, r.height, COUNT(*), AVG(r.iterations), AVG(r.exec_time), MAX(r.peak_memory), "
+            "MAX(json_extract(r.stats, '$.features.discount_factor')) "
+            "FROM results r JOIN runs ON runs.id = r.run_id "
+            + ("WHERE r.algorithm = ? " if algorithm is not None else "")
+            + "GROUP BY r.run_id, r.algorithm, r.width, r.height ORDER BY r.algorithm, r.width * r.height, r.width, r.run_id"
+        )
+        rows = self.connection.execute(query, (algorithm,) if algorithm is not None else ()).fetchall()
+        columns = ["run_id", "git_commit", "algorithm", "width", "height", "trials", "iterations", "exec_time", "peak_memory", "discount_factor"]
+        return [dict(zip(columns, row)) for row in rows]
+
+    def find_regressions(self, tolerance=1.2, metric="exec_time"):
+        """
+        Compares the latest run of every algorithm and size against the run before it with the same discount factor
+
+        Params:
+            tolerance: Ratio latest / previous above which the size is reported
+            metric: "exec_time", "iterations" or "peak_memory"
+
+        Returns:
+            List of dictionaries with algorithm, width, height, previous / latest run_id + commit, both values and their ratio
+        """
+        groups = {}
+        for row in self.get_size_summary():
+            groups.setdefault((row["algorithm"], row["width"], row["height"], row["discount_factor"]), []).append(row)
+
+        regressions = []
+        for (algorithm, width, height, _), rows in groups.items():
+            if(len(rows) < 2 or not rows[-2][metric] or rows[-1][metric] is None):
+                continue
+            previous, latest = rows[-2], rows[-1]
+            ratio = latest[metric] / previous[metric]
+            if(ratio > tolerance):
+                regressions.append({
+                    "algorithm": algorithm, "width": width, "height": height,
+                    "previous_run": previous["run_id"], "previous_commit": previous["git_commit"], "previous": previous[metric],
+                    "latest_run": latest["run_id"], "latest_commit": latest["git_commit"], "latest": latest[metric],
+                    "ratio": ratio,
+                })
+        return regressions
+
+    def get_trials(self, run_id, algorithm, width, height, metric="iterations"):
+        """
+        Returns:
+            List of the metric per trial (ordered by trial) of one run, algorithm and size
+        """
+        if(metric not in ("iterations", "exec_time", "peak_memory")):
+            raise ValueError(f"Unknown metric {metric!r}")
+        rows = self.connection.execute(
+            f"SELECT {metric} FROM results WHERE run_id = ? AND algorithm = ? AND width = ? AND height = ? ORDER BY trial",
+            (run_id, algorithm, width, height),
+        ).fetchall()
+        return [value for (value,) in rows]
+
+    def get_latest_run(self):
+        row = self.connection.execute("SELECT MAX(run_id) FROM results").fetchone()
+        return row[0]
+
+    def get_feature_results(self):
+        """
+        Returns:
+            List of (algorithm, maze features, exec_time) of every result recorded with its maze features (see auto_solver.get_maze_features)
+        """
+        rows = self.connection.execute("SELECT algorithm, stats, exec_time FROM results WHERE stats IS NOT NULL ORDER BY id").fetchall()
+        results = []
+        for algorithm, stats, exec_time in rows:
+            features = json.loads(stats).get("features")
+            if(features is not None):
+                results.append((algorithm, features, exec_time))
+        return results
+
+def run_benchmarks(store, dimensions=None, trials_per_dim=5, max_steps=10000, seed=0, label=None, profile=False, algorithms=None, discount_factor=0.99,
+                   measure_memory=True):
+    """
+    Runs the check_others solves without any plotting and records them, every algorithm solves the same random mazes
+      - The maze features of every trial are stored in the stats of its results, the cost model of auto_solver is fitted on them
+
+    Params:
+        store: BenchmarkStore to record to
+        dimensions: List of (width, height), defaults to main.CHECK_DIMENSIONS
+        trials_per_dim: Number of random mazes per size
+        max_steps: Max. iterations per solve
+        seed: Seed of the maze generator, each trial records its own derived seed
+        label: Free text stored with the run
+        profile: Bool to store the phase profile of every solve in its stats (the exec times then include the profiling overhead)
+        algorithms: Names from ALGORITHMS to run on every maze, defaults to all of them
+        discount_factor: Gamma value of every solve
+        measure_memory: Bool to record the peak memory of every solve (from a second, traced solve, see benchmark_solve)
+
+    Returns:
+        run_id: int
+    """
+    from main import CHECK_DIMENSIONS, generate_maze      # main imports this module for check_others
+    from maze import Maze
+
+    unprofiled = [algorithm for algorithm in algorithms or ALGORITHMS if ALGORITHMS[algorithm][1] not in PROFILED_METHODS]
+    if(profile and unprofiled):
+        raise ValueError(f"{', '.join(unprofiled)} can't be profiled, leave them out with --algorithms")
+
+    seeds = random.Random(seed)
+    run_id = store.start_run(label)
+    for width, height in dimensions or CHECK_DIMENSIONS:
+        print(f"Benchmarking {width}x{height}!")
+        for trial in range(trials_per_dim):
+            maze_seed = seeds.randrange(2 ** 32)
+            random.seed(maze_seed)
+            maze = Maze(generate_maze(width, height, wall_prob=0.2))
+            features = get_maze_features(maze, discount_factor)
+
+            for algorithm in algorithms or ALGORITHMS:
+                agent = make_agent(algorithm, maze, discount_factor)
+                result, peak_memory, stats = benchmark_solve(agent, algorithm, max_steps, profile, measure_memory)
+                store.record(run_id, algorithm, width, height, maze_seed, trial, count_iterations(algorithm, agent, result), result[2], peak_memory,
+                             {**(stats or {}), "features": features})
+
+    return run_id
+
+def print_report(store, tolerance=1.2, last_runs=5):
+    """
+    Prints the mean exec time / iterations per size over the last runs, then the sizes that regressed
+    """
+    for run_id, started_at, commit, dirty, hostname, label in store.get_runs()[-last_runs:]:
+        print(f"run {run_id}: {started_at} {commit[:10]}{'+' if dirty else ''} on {hostname}" + (f" ({label})" if label else ""))
+    print()
+
+    summary = store.get_size_summary()
+    run_ids = sorted({row["run_id"] for row in summary})[-last_runs:]
+    cells = {(row["algorithm"], row["width"], row["height"], row["run_id"]): row for row in summary}
+    sizes = sorted({(row["algorithm"], row["width"], row["height"]) for row in summary}, key=lambda size: (size[0], size[1] * size[2], size[1]))
+
+    lines = [f"{'algo':<8}{'size':>10}" + "".join(f"{f'run {run_id}':>22}" for run_id in run_ids)]
+    for algorithm, width, height in sizes:
+        line = f"{algorithm:<8}{f'{width}x{height}':>10}"
+        for run_id in run_ids:
+            row = cells.get((algorithm, width, height, run_id))
+            line += f"{row['exec_time']:>12.4f}s {row['iterations']:>7.1f}it" if row else f"{'-':>22}"
+        lines.append(line)
+    print("\n".join(lines))
+    print()
+
+    for metric in ("exec_time", "iterations", "peak_memory"):
+        for regression in store.find_regressions(tolerance, metric):
+            print(f"REGRESSION {regression['algorithm']} {regression['width']}x{regression['height']} {metric}: "
+                  f"{regression['previous']:.4g} (run {regression['previous_run']}, {regression['previous_commit'][:10]}) -> "
+                  f"{regression['latest']:.4g} (run {regression['latest_run']}, {regression['latest_commit'][:10]}), x{regression['ratio']:.2f}")
+
+def export_plots(store, run_id=None, folder_path="plots/Benchmarks"):
+    """
+    Draws the per trial iteration / exec time bar plots of check_others from the stored results of one run (defaults to the latest)
+    """
+    run_id = run_id or store.get_latest_run()
+    sizes = sorted({(row["width"], row["height"]) for row in store.get_size_summary() if row["run_id"] == run_id}, key=lambda size: (size[0] * size[1], size[0]))
+    for width, height in sizes:
+        dim_string = f"{width}x{height}"
+        os.makedirs(f"{folder_path}/{dim_string}", exist_ok=True)
+
+        plot_data_per_trial(vi_data=store.get_trials(run_id, "vi", width, height), pi_data=store.get_trials(run_id, "pi", width, height),
+                            title=f"Iterations for Value & Policy iteration in {dim_string} (run {run_id})",
+                            save_filename=f"{folder_path}/{dim_string}/{dim_string}_iterations", show_plot=False)
+        plot_data_per_trial(vi_data=store.get_trials(run_id, "vi", width, height, "exec_time"), pi_data=store.get_trials(run_id, "pi", width, height, "exec_time"),
+                            y_label="Time taken", title=f"Exec time for Value & Policy iteration in {dim_string} (run {run_id})",
+                            save_filename=f"{folder_path}/{dim_string}/{dim_string}_exec_time", show_plot=False)
+    print(f"Exported {len(sizes)} sizes of run {run_id} to {folder_path}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Records solver benchmarks to SQLite and reports trends / regressions")
+    parser.add_argument("--db", default=DEFAULT_DATABASE, help="SQLite database file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the check_others solves (without plots) and record them")
+    run.add_argument("--trials", type=int, default=5)
+    run.add_argument("--max-steps", type=int, default=10000)
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--sizes", type=int, nargs="+", help="square sizes to run instead of the check_others sizes")
+    run.add_argument("--label", help="free text stored with the run")
+    run.add_argument("--profile", action="store_true", help="store the memory / allocation profile of every solve")
+    run.add_argument("--algorithms", nargs="+", choices=list(ALGORITHMS), help="solvers to run, defaults to all of them")
+    run.add_argument("--discount", type=float, nargs="+", default=[0.99],
+                     help="gamma of the solves, several values record one run each (on the same mazes) to calibrate the auto solver")
+    run.add_argument("--no-memory", action="store_true", help="skip the second, traced solve that measures the peak memory")
+
+    report = commands.add_parser("report", help="show trends per size and flag regressions of the latest run")
+    report.add_argument("--tolerance", type=float, default=1.2, help="latest / previous ratio reported as a regression")
+    report.add_argument("--last", type=int, default=5, help="number of runs shown")
+
+    export = commands.add_parser("export", help="draw the per trial bar plots of a run")
+    export.add_argument("--run", type=int, help="run id, defaults to the latest")
+    export.add_argument("--out", default="plots/Benchmarks")
+
+    fit = commands.add_parser("fit", help="refit the cost model of the auto solver on every recorded result")
+    fit.add_argument("--model", default=DEFAULT_MODEL, help="cost model file to write")
+    args = parser.parse_args()
+
+    store = BenchmarkStore(args.db)
+    try:
+        if(args.command == "run"):
+            start_time = time.time()
+            dimensions = [(size, size) for size in args.sizes] if args.sizes else None
+            for discount_factor in args.discount:
+                label = args.label if len(args.discount) == 1 else " ".join(filter(None, [args.label, f"y={discount_factor}"]))
+                run_id = run_benchmarks(store, dimensions, args.trials, args.max_steps, args.seed, label, args.profile, args.algorithms, discount_factor,
+                                        not args.no_memory)
+                print(f"Recorded run {run_id} in {time.time() - start_time:.1f}s")
+        elif(args.command == "report"):
+            print_report(store, args.tolerance, args.last)
+        elif(args.command == "fit"):
+            model = fit_from_store(store, args.model)
+            if(not model.weights):
+                print("No results with maze features to fit on, record some with 'python benchmark.py run' first!")
+            else:
+                print(format_model(model))
+                print(f"Saved cost model to {args.model}")
+        else:
+            export_plots(store, args.run, args.out)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
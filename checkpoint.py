@@ -0,0 +1,83 @@
+import json
+import os
+import random
+
+import numpy as np
+
+def save_checkpoint(path, arrays, meta):
+    """
+    Writes a checkpoint as one compressed .npz file
+      - The file is written next to the target and then renamed over it, so a kill mid-write leaves the last checkpoint intact
+
+    Params:
+        path: File to write (".npz" is appended by NumPy if missing)
+        arrays: Dictionary of name -> ndarray
+        meta: JSON serializable dictionary (hyperparams, counters, RNG state, ...)
+    """
+    if(not path.endswith(".npz")):
+        path += ".npz"
+    tmp_path = path[:-len(".npz")] + ".tmp.npz"
+
+    np.savez_compressed(tmp_path, meta=np.array(json.dumps(meta)), **arrays)
+    os.replace(tmp_path, path)
+
+def load_checkpoint(path):
+    """
+    Reads a checkpoint written by save_checkpoint
+
+    Returns:
+        arrays: Dictionary of name -> ndarray
+        meta: Dictionary
+    """
+    if(not path.endswith(".npz")):
+        path += ".npz"
+
+    with np.load(path) as data:
+        arrays = {name: data[name] for name in data.files if name != "meta"}
+        meta = json.loads(str(data["meta"]))
+
+    return arrays, meta
+
+def append_tables(path, tables, count):
+    """
+    Appends rows to an append-only binary table file (used for the utility history, which would be too slow to rewrite
+    into every checkpoint), after cutting it back to the first count rows
+
+    Params:
+        path: Table file
+        tables: 2D ndarray of the new rows
+        count: Number of rows already in the file that are still valid (0 to start a new file)
+    """
+    with open(path, "ab" if count > 0 else "wb") as file:
+        file.truncate(count * tables.shape[1] * tables.dtype.itemsize)
+        file.seek(0, os.SEEK_END)
+        file.write(np.ascontiguousarray(tables).tobytes())
+
+def load_tables(path, count, width, dtype):
+    """
+    Reads the first count rows of a table file written by append_tables (rows written after the last checkpoint are ignored)
+    """
+    if(count == 0):
+        return np.zeros((0, width), dtype=dtype)
+    return np.fromfile(path, dtype=dtype, count=count * width).reshape(count, width)
+
+def get_rng_state():
+    """
+    Gets the state of the global random (used by generate_maze) and NumPy generators in JSON serializable form
+    """
+    version, internal, gauss_next = random.getstate()
+    name, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    return {
+        "random": [version, list(internal), gauss_next],
+        "numpy": [name, keys.tolist(), int(pos), int(has_gauss), float(cached_gaussian)],
+    }
+
+def set_rng_state(state):
+    """
+    Restores the generator states saved by get_rng_state
+    """
+    version, internal, gauss_next = state["random"]
+    random.setstate((version, tuple(internal), gauss_next))
+
+    name, keys, pos, has_gauss, cached_gaussian = state["numpy"]
+    np.random.set_state((name, np.array(keys, dtype=np.uint32), pos, has_gauss, cached_gaussian))
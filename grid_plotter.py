@@ -1,10 +1,17 @@
+import subprocess
+
 import matplotlib.pyplot as plt
 import numpy as np
+from matplotlib.animation import writers
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image
 
 from helper import MazeCell, Move
+from state_space import StateSpace
 
 class GridPlotter:
-    def __init__(self, utilities, policy, save_path="plots/PartTwo"):
+    def __init__(self, utilities, policy, save_path="plots/PartTwo", deltas=None):
         """
         Initializes the plotter with the agent object
 
@@ -12,10 +19,12 @@ class GridPlotter:
             utilities: The array of grid utilities calculated from either Value/Policy iteration
             policy: The optimal policy derived by the agent
             save_path: The path denoting the main folder to save plotted figures in
+            deltas: Max. utility change of every sweep / loop of the solve (the agent's stats["deltas"]), used by plot_convergence
         """
         self.utilities = utilities
         self.policy = policy
         self.save_path = save_path
+        self.deltas = deltas
 
     def plot_utility_graph(self, maze, save_filename, show_plot=True):
         """
@@ -310,8 +319,325 @@ class GridPlotter:
             plt.savefig(f"{self.save_path}/{save_filename}")
             plt.close()
 
+    def plot_convergence(self, maze, save_filename="new_plot", show_plot=True, max_states=512, max_iterations=1000, percentiles=(5, 25, 50, 75, 95)):
+        """
+        Plots how the utilities converge in a way that scales to big mazes and long runs (linear in the history size)
+          - Bellman residual: max. utility change of every sweep / loop recorded by the solve (self.deltas, log scale),
+            without it the max. change between consecutive history entries (several sweeps apart with a history stride)
+          - Heatmap of history entry x state utilities, both axes block-averaged down to max_iterations x max_states
+          - Percentile bands of the utilities over the floor cells for each history entry
+          - Only floor cells are used, walls and reward / punishment cells never change
+          - The history is read one entry at a time, so a DeltaHistory is never reconstructed as a whole
+
+        Params:
+            maze: Maze object storing maze information like the 2d grid and helper functions
+            save_filename: Specific file name to use when saving the plot
+            show_plot: Bool to control whether or not to display the graph or to save it
+            max_states: Max. number of state columns shown in the heatmap
+            max_iterations: Max. number of history entry rows shown in the heatmap
+            percentiles: Percentiles drawn as bands, symmetric pairs are shaded and the middle one is drawn as a line
+        """
+        floor = np.array(maze.grid) == MazeCell.FLOOR.value
+        num_entries = len(self.utilities)
+        if(num_entries == 0):
+            print("No utility history to plot!")
+            return
+
+        # one pass over the history: block sums of the heatmap rows, percentiles and changes between entries
+        iteration_step = max(1, int(np.ceil(num_entries / max_iterations)))
+        heatmap = None
+        bands = np.zeros((len(percentiles), num_entries))
+        entry_changes = np.zeros(max(0, num_entries - 1))
+        previous = None
+        for entryIdx in range(num_entries):
+            utilities = np.asarray(self.utilities[entryIdx], dtype=np.float64)[floor]
+            row, state_step = downsample_mean(utilities[None, :], max_states, axis=1)
+            if(heatmap is None):
+                heatmap = np.zeros((int(np.ceil(num_entries / iteration_step)), row.shape[1]))
+            heatmap[entryIdx // iteration_step] += row[0]
+            bands[:, entryIdx] = np.percentile(utilities, percentiles) if len(utilities) > 0 else 0
+            if(previous is not None):
+                entry_changes[entryIdx - 1] = np.max(np.abs(utilities - previous), initial=0)
+            previous = utilities
+        heatmap /= np.diff(np.append(np.arange(0, num_entries, iteration_step), num_entries))[:, None]
+        entries = np.arange(num_entries)
+
+        fig, ax = plt.subplots(3, 1, figsize=(10, 14))
+
+        # Bellman residual curve
+        if(self.deltas is not None and len(self.deltas) > 0):
+            ax[0].semilogy(np.arange(1, len(self.deltas) + 1), np.maximum(self.deltas, np.finfo(float).tiny))
+            ax[0].set_xlabel("Number of iterations")
+            ax[0].set_ylabel("Max. utility change")
+        elif(num_entries > 1):
+            ax[0].semilogy(entries[1:], np.maximum(entry_changes, np.finfo(float).tiny))
+            ax[0].set_xlabel("History entry")
+            ax[0].set_ylabel("Max. utility change since the previous entry")
+        ax[0].set_title("Bellman residual")
+        ax[0].grid(True)
+
+        # History entry x state heatmap
+        image = ax[1].imshow(heatmap, aspect="auto", origin="lower", cmap="viridis", interpolation="nearest",
+                             extent=(0, np.count_nonzero(floor), 0, num_entries))
+        fig.colorbar(image, ax=ax[1], label="Utility")
+        ax[1].set_xlabel(f"State (floor cells, row-major, {state_step} per column)")
+        ax[1].set_ylabel(f"History entry ({iteration_step} per row)")
+        ax[1].set_title("Utility estimates per state")
+
+        # Percentile bands
+        for lowIdx in range(len(percentiles) // 2):
+            highIdx = len(percentiles) - 1 - lowIdx
+            ax[2].fill_between(entries, bands[lowIdx], bands[highIdx], alpha=0.2 + 0.2 * lowIdx, color="tab:blue",
+                               label=f"{percentiles[lowIdx]}-{percentiles[highIdx]}th percentile")
+        if(len(percentiles) % 2 == 1):
+            ax[2].plot(entries, bands[len(percentiles) // 2], color="tab:blue", label=f"{percentiles[len(percentiles) // 2]}th percentile")
+        ax[2].set_xlabel("History entry")
+        ax[2].set_ylabel("Utility estimates")
+        ax[2].set_title("Utility estimate percentiles over iterations")
+        ax[2].legend(loc="lower right")
+        ax[2].grid(True)
+
+        fig.tight_layout()
+
+        if(show_plot):
+            plt.show()
+        else:
+            plt.savefig(f"{self.save_path}/{save_filename}")
+            plt.close()
+
+    def export_animation(self, maze, save_filename, stride=1, fps=10, show_policy=True, max_arrows=48, dpi=72):
+        """
+        Exports an animation of the utilities history (GIF, or MP4 when ffmpeg is available)
+          - Matplotlib only draws the static parts once (axes frame, colorbar) and the title per frame. The cells are written
+            straight into the canvas buffer as an upscaled RGBA raster, and the arrows are blended in from one pre-rendered
+            layer per Move, so no artist is re-rendered per frame. The buffer then goes straight to the encoder (see FrameEncoder)
+          - Arrows show the greedy policy w.r.t. the utilities of each frame
+
+        Params:
+            maze: Maze object storing maze information like the 2d grid and helper functions
+            save_filename: File name to save the animation with, the extension (.gif / .mp4) picks the encoder, defaults to .gif
+            stride: Only every stride-th history entry becomes a frame (the last entry is always included)
+            fps: Frames per second of the exported animation
+            show_policy: Bool to control whether the greedy policy arrows are drawn
+            max_arrows: Max. number of arrows per row / col, bigger mazes only get an arrow on every k-th row and col
+            dpi: Resolution of the exported frames (the figure is 8 inches wide)
+
+        Returns:
+            path: Path of the exported file
+        """
+        space = StateSpace(maze)
+        frames = list(range(0, len(self.utilities), max(1, stride)))
+        if(frames[-1] != len(self.utilities) - 1):
+            frames.append(len(self.utilities) - 1)
+
+        frame, floor = get_cell_frame(maze.grid)
+        floor_utilities = [np.asarray(self.utilities[frameIdx])[floor] for frameIdx in frames]     # also avoids materializing a DeltaHistory
+        vmin, vmax = (min(map(np.min, floor_utilities)), max(map(np.max, floor_utilities))) if floor.any() else (-1, 1)
+
+        fig = Figure(figsize=(8, 8 * maze.height / maze.width), dpi=dpi)
+        canvas = FigureCanvasAgg(fig)
+        ax = fig.subplots()
+        ax.set_xticks([])
+        ax.set_yticks([])
+
+        # the image only lays out the axes, its pixels are written by hand each frame
+        mappable = plt.cm.ScalarMappable(norm=plt.Normalize(vmin, vmax), cmap="viridis")
+        ax.imshow(frame, interpolation="nearest", animated=True)
+        fig.colorbar(mappable, ax=ax, label="Utility", fraction=0.046)
+        title = ax.set_title("Iteration", animated=True)
+
+        arrows = None
+        arrow_dir = np.array([(0, 1), (0, -1), (-1, 0), (1, 0)], dtype=float)    # (dx, dy) per Move value, y axis points up on screen
+        step = max(1, int(np.ceil(max(maze.height, maze.width) / max_arrows)))
+        decision = np.flatnonzero((space.rows[:space.num_decision] % step == 0) & (space.cols[:space.num_decision] % step == 0))
+        if(show_policy and len(decision) > 0):
+            arrows = ax.quiver(space.cols[decision], space.rows[decision], np.zeros(len(decision)), np.zeros(len(decision)),
+                               pivot="middle", scale=1.5 / step, scale_units="xy", width=0.003, headwidth=4, color="black", animated=True)
+
+        # animated artists are left out of the full draw, the background is everything else
+        canvas.draw()
+        background = canvas.copy_from_bbox(fig.bbox)
+        buffer = np.asarray(canvas.buffer_rgba())      # view of the canvas pixels, rows top down
+
+        # cell (row, col) under every pixel of the image area, same as the nearest neighbour upscaling of imshow
+        x0, y0, x1, y1 = np.round(ax.bbox.extents).astype(int)
+        top, bottom = buffer.shape[0] - y1, buffer.shape[0] - y0
+        pixel_x, pixel_y = np.meshgrid(np.arange(x0, x1) + 0.5, buffer.shape[0] - (np.arange(top, bottom) + 0.5))
+        data_x, data_y = ax.transData.inverted().transform(np.column_stack([pixel_x.ravel(), pixel_y.ravel()])).T
+        pixel_cols = np.clip(np.round(data_x), 0, maze.width - 1).astype(np.intp).reshape(pixel_x.shape)
+        pixel_rows = np.clip(np.round(data_y), 0, maze.height - 1).astype(np.intp).reshape(pixel_x.shape)
+        image_area = buffer[top:bottom, x0:x1]
+
+        if(arrows is not None):
+            # alpha of the (black) arrows pointing in each direction, every arrow stays within its step x step tile
+            renderer = canvas.get_renderer()
+            arrow_alpha = []
+            for move in Move:
+                renderer.clear()
+                arrows.set_UVC(np.full(len(decision), arrow_dir[move.value, 0]), np.full(len(decision), arrow_dir[move.value, 1]))
+                ax.draw_artist(arrows)
+                arrow_alpha.append(image_area[..., 3].astype(np.float32) / 255)
+            arrow_alpha = np.stack(arrow_alpha)
+
+            # only the pixels some arrow can cover are blended, each knows the arrow of its tile
+            arrow_index = np.full((maze.height, maze.width), -1, dtype=np.intp)
+            arrow_index[space.rows[decision], space.cols[decision]] = np.arange(len(decision))
+            tile_rows = np.clip(np.round(data_y / step) * step, 0, maze.height - 1).astype(np.intp)
+            tile_cols = np.clip(np.round(data_x / step) * step, 0, maze.width - 1).astype(np.intp)
+            arrow_pixels = np.flatnonzero(arrow_alpha.reshape(len(Move), -1).max(axis=0) > 0)
+            pixel_arrows = arrow_index[tile_rows, tile_cols][arrow_pixels]
+            arrow_pixels, pixel_arrows = arrow_pixels[pixel_arrows >= 0], pixel_arrows[pixel_arrows >= 0]
+            arrow_alpha = arrow_alpha.reshape(len(Move), -1)[:, arrow_pixels]
+            canvas.restore_region(background)
+
+        path = f"{self.save_path}/{save_filename}"
+        if(not path.endswith(".gif") and not (path.endswith(".mp4") and writers.is_available("ffmpeg"))):
+            print(f"Saving {save_filename} as a GIF (no ffmpeg encoder for MP4)")
+            path = path.rsplit(".", 1)[0] + ".gif" if path.endswith(".mp4") else path + ".gif"
+
+        width, height = canvas.get_width_height()
+        encoder = FrameEncoder(path, width, height, fps)
+        try:
+            for frameIdx in frames:
+                utilities = self.utilities[frameIdx]
+                frame[floor] = mappable.to_rgba(np.asarray(utilities)[floor])
+                pixels = (frame * 255).round().astype(np.uint8)[pixel_rows, pixel_cols]
+
+                if(arrows is not None):
+                    u_table = np.asarray(utilities)[space.rows, space.cols]
+                    moves = np.argmax(space.expected_utilities(u_table, decision), axis=1)
+                    alpha = arrow_alpha[moves[pixel_arrows], np.arange(len(arrow_pixels))]
+                    flat_pixels = pixels.reshape(-1, 4)
+                    flat_pixels[arrow_pixels, :3] = (flat_pixels[arrow_pixels, :3] * (1 - alpha)[:, np.newaxis]).round().astype(np.uint8)
+
+                canvas.restore_region(background)
+                image_area[...] = pixels
+                title.set_text(f"Iteration {frameIdx}")
+                ax.draw_artist(title)
+
+                encoder.write(buffer)
+        finally:
+            encoder.close()
+
+        return path
+
+
+class FrameEncoder:
+    # palette index of the GIF pixels that keep the color of the previous frame
+    UNCHANGED = 255
+
+    def __init__(self, path, width, height, fps):
+        """
+        Writes raw RGBA frames of a fixed size to a GIF (Pillow) or, for .mp4 paths, straight to an ffmpeg pipe
+          - GIF frames share the palette of the first frame, every later frame only stores the pixels that changed
+            (the others get the transparent UNCHANGED index), which Pillow's own optimize pass does ~20x slower
+
+        Params:
+            path: Output file, .mp4 needs ffmpeg (see matplotlib.animation.writers), anything else is written as a GIF
+            width, height: Frame size in pixels
+            fps: Frames per second
+        """
+        self.path = path
+        self.fps = fps
+        self.frames = []        # palette GIF frames, Pillow only writes an animated GIF in one go
+        self.palette = None
+        self.palette_image = None
+        self.previous = None    # palette indices of the previous frame
+        self.process = None
+        if(path.endswith(".mp4")):
+            command = [plt.rcParams["animation.ffmpeg_path"], "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgba",
+                       "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+                       "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-vcodec", "libx264", "-pix_fmt", "yuv420p", path]
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def write(self, rgba):
+        """
+        Params:
+            rgba: (height, width, 4) uint8 array, only read during the call (e.g. the buffer of a canvas that is redrawn next)
+        """
+        if(self.process is not None):
+            self.process.stdin.write(rgba.tobytes())
+            return
+
+        # the palette of the first frame covers every color of the animation (the colorbar shows the whole colormap),
+        # mapping to a fixed palette is much cheaper than finding a new adaptive one per frame
+        image = Image.fromarray(rgba[..., :3])
+        if(self.palette is None):
+            first = image.quantize(self.UNCHANGED)      # leaves the UNCHANGED index free
+            self.palette = first.getpalette()[:3 * self.UNCHANGED]
+            self.palette += [0] * (3 * (self.UNCHANGED + 1) - len(self.palette))
+            self.palette_image = first
+            indices = np.asarray(first)
+        else:
+            indices = np.asarray(image.quantize(palette=self.palette_image, dither=Image.Dither.NONE))
+
+        changed = indices if self.previous is None else np.where(indices == self.previous, self.UNCHANGED, indices).astype(np.uint8)
+        frame = Image.fromarray(changed, "P")
+        frame.putpalette(self.palette)
+        self.frames.append(frame)
+        self.previous = indices
+
+    def close(self):
+        if(self.process is not None):
+            self.process.stdin.close()
+            if(self.process.wait() != 0):
+                raise RuntimeError(f"ffmpeg failed to encode {self.path}")
+        elif(self.frames):
+            self.frames[0].save(self.path, save_all=True, append_images=self.frames[1:], duration=round(1000 / self.fps), loop=0,
+                                optimize=False, transparency=self.UNCHANGED, disposal=1)
+            self.frames = []
+
 
 # General plotting functions #
+# static colors of the non-floor cells in raster plots
+CELL_RGBA = {
+    MazeCell.WALL.value: (0.5, 0.5, 0.5, 1),
+    MazeCell.GREEN.value: (0, 0.5, 0, 1),
+    MazeCell.ORANGE.value: (1, 0.65, 0, 1)
+}
+
+def get_cell_frame(grid):
+    """
+    Builds the RGBA raster of a maze, non-floor cells get their CELL_RGBA color and floor cells are left to be filled in
+
+    Params:
+        grid: 2D list (or ndarray) of MazeCell values
+
+    Returns:
+        frame: (height, width, 4) float ndarray
+        floor: (height, width) bool mask of the floor cells
+    """
+    grid = np.asarray(grid)
+    frame = np.zeros(grid.shape + (4,))
+    for cell, color in CELL_RGBA.items():
+        frame[grid == cell] = color
+
+    return frame, grid == MazeCell.FLOOR.value
+
+def downsample_mean(data, max_size, axis):
+    """
+    Block-averages a 2D array along one axis so it has at most max_size entries there
+
+    Params:
+        data: 2D ndarray
+        max_size: Max. length of the axis after downsampling
+        axis: Axis to downsample
+
+    Returns:
+        downsampled: 2D ndarray
+        step: Number of original entries averaged into each one
+    """
+    length = data.shape[axis]
+    step = max(1, int(np.ceil(length / max_size)))
+    if(step == 1):
+        return data, step
+
+    starts = np.arange(0, length, step)
+    sums = np.add.reduceat(data, starts, axis=axis)
+    counts = np.diff(np.append(starts, length))
+    counts = counts[:, None] if axis == 0 else counts[None, :]
+    return sums / counts, step
+
 def plot_data_per_trial(vi_data, pi_data, x_label="Trial", y_label="Iterations needed", title="", save_filename="new_plot", show_plot=True):
     """
     Plots bar graphs of the number of iterations needed to attain convergence
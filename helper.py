@@ -6,6 +6,8 @@ class Move(Enum):   # WASDs
     LEFT = 2
     RIGHT = 3
 
+NO_ACTION = -1      # policy entry for cells where no move is chosen (walls, reward and punishment cells)
+
 class MazeCell(Enum):
     FLOOR = ' '
     WALL = 'W'
@@ -0,0 +1,233 @@
+import numpy as np
+
+class HistoryRecorder:
+    def __init__(self, state_space, stride=1, tolerance=None):
+        """
+        Records the utility table over the iterations of a solve
+          - Snapshots are kept as compact 1-D copies and only scattered to H x W when the history is requested
+          - With a tolerance, the snapshots are delta-compressed instead (see DeltaHistory)
+
+        Params:
+            state_space: StateSpace the recorded tables are indexed by
+            stride: Only every stride-th table is kept (the first one always is), to bound memory on long runs
+            tolerance: None to keep full snapshots, else the max. abs. error of the DeltaHistory (0 for lossless)
+        """
+        self.state_space = state_space
+        self.stride = max(1, int(stride))
+
+        self.snapshots = [] if tolerance is None else DeltaHistory(state_space, tolerance=tolerance, value_dtype=state_space.dtype)
+        self.count = 0      # number of tables offered, including the skipped ones
+        self.saved = 0      # number of snapshots already written to the checkpoint history file
+
+    def append(self, u_table):
+        """
+        Records a copy of the given compact utility table (if it falls on the stride)
+        """
+        if(self.count % self.stride == 0):
+            self.snapshots.append(np.array(u_table, copy=True))
+        self.count += 1
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    def get_tables(self, start=0):
+        """
+        Returns:
+            tables: Compact ndarray of shape (num_snapshots - start, num_states) of the kept tables from start on (for checkpoints)
+        """
+        if(len(self.snapshots) <= start):
+            return np.zeros((0, self.state_space.num_states), dtype=self.state_space.dtype)
+        if(isinstance(self.snapshots, DeltaHistory)):
+            return np.stack([self.snapshots.get_table(entry) for entry in range(start, len(self.snapshots))]).astype(self.state_space.dtype)
+        return np.stack(self.snapshots[start:], axis=0)
+
+    def restore(self, tables, count):
+        """
+        Refills the recorder from get_tables() and the number of tables that had been offered (for resuming from a checkpoint)
+        """
+        for table in tables:
+            self.snapshots.append(np.array(table, copy=True))
+        self.count = int(count)
+        self.saved = len(tables)
+
+    def to_array(self):
+        """
+        Returns:
+            utilities: ndarray of shape (num_snapshots, height, width), walls filled with 0 (or the DeltaHistory)
+        """
+        if(isinstance(self.snapshots, DeltaHistory)):
+            return self.snapshots
+        if(len(self.snapshots) == 0):
+            return np.zeros((0, self.state_space.height, self.state_space.width))
+        return self.state_space.scatter(np.stack(self.snapshots, axis=0))
+
+class DeltaHistory:
+    def __init__(self, state_space=None, tolerance=0.0, value_dtype=np.float64, keyframe_interval=128):
+        """
+        Utility history stored as periodic keyframes plus sparse per-iteration deltas
+          - Each delta holds the compact indices whose value moved by more than tolerance since the last recorded value,
+            and their new values, so every reconstructed cell is within tolerance of the real one (0 for lossless)
+          - Behaves like the (iterations, height, width) ndarray it replaces: len(), [k], [-1], [:, r, c], np.asarray()
+          - Reconstructing entry k replays at most keyframe_interval deltas, forward access reuses the last reconstruction
+
+        Params:
+            state_space: StateSpace the recorded tables are indexed by (None when loading)
+            tolerance: Max. abs. error of a reconstructed utility
+            value_dtype: Float type the values are stored with, e.g. np.float16 / np.float32 to quantize them further
+            keyframe_interval: Number of entries between full keyframes
+        """
+        self.tolerance = float(tolerance)
+        self.value_dtype = np.dtype(value_dtype)
+        self.keyframe_interval = max(1, int(keyframe_interval))
+
+        if(state_space is not None):
+            self.height, self.width = state_space.height, state_space.width
+            self.rows, self.cols = state_space.rows, state_space.cols
+
+        self.keyframes = []     # full compact tables of entries 0, interval, 2 * interval, ...
+        self.indices = []       # per entry: int32 compact indices changed since the previous entry (empty for keyframes)
+        self.values = []        # per entry: their new values
+        self.current = None     # reconstruction of the last appended entry
+        self.cached = None      # (entry, compact table) of the last random access
+
+    @property
+    def shape(self):
+        return (len(self), self.height, self.width)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def append(self, u_table):
+        """
+        Records the given compact utility table
+        """
+        values = np.asarray(u_table).astype(self.value_dtype)
+        if(len(self) % self.keyframe_interval == 0):
+            self.keyframes.append(values)
+            self.current = values.copy()
+            self.indices.append(np.zeros(0, dtype=np.int32))
+            self.values.append(np.zeros(0, dtype=self.value_dtype))
+            return
+
+        changed = np.flatnonzero(np.abs(values.astype(np.float64) - self.current) > self.tolerance).astype(np.int32)
+        self.indices.append(changed)
+        self.values.append(values[changed])
+        self.current[changed] = values[changed]
+
+    def get_table(self, k):
+        """
+        Reconstructs the compact utility table of entry k
+        """
+        if(k < 0):
+            k += len(self)
+        if(not 0 <= k < len(self)):
+            raise IndexError(f"history index {k} out of range for {len(self)} entries")
+
+        start = k - k % self.keyframe_interval
+        if(self.cached is not None and start <= self.cached[0] <= k):
+            start, table = self.cached[0], self.cached[1].copy()
+        else:
+            table = self.keyframes[start // self.keyframe_interval].copy()
+
+        for entry in range(start + 1, k + 1):
+            table[self.indices[entry]] = self.values[entry]
+        self.cached = (k, table.copy())
+
+        return table
+
+    def scatter(self, table):
+        """
+        Maps compact tables (leading axes kept) back onto the H x W grid, walls filled with 0
+        """
+        grid = np.zeros(table.shape[:-1] + (self.height, self.width), dtype=np.float64)
+        grid[..., self.rows, self.cols] = table
+        return grid
+
+    def get_trajectory(self, row, col):
+        """
+        Returns:
+            trajectory: 1D ndarray of the utility of cell (row, col) over all entries, without reconstructing whole tables
+        """
+        trajectory = np.zeros(len(self))
+        matches = np.flatnonzero((self.rows == row) & (self.cols == col))
+        if(len(matches) == 0):
+            return trajectory       # walls are never recorded
+
+        state = matches[0]
+        value = 0.0
+        for entry in range(len(self)):
+            if(entry % self.keyframe_interval == 0):
+                value = self.keyframes[entry // self.keyframe_interval][state]
+            else:
+                pos = np.searchsorted(self.indices[entry], state)
+                if(pos < len(self.indices[entry]) and self.indices[entry][pos] == state):
+                    value = self.values[entry][pos]
+            trajectory[entry] = value
+
+        return trajectory
+
+    def __getitem__(self, key):
+        if(not isinstance(key, tuple)):
+            key = (key,)
+        entries, cell = key[0], key[1:]
+
+        if(isinstance(entries, (int, np.integer))):
+            grid = self.scatter(self.get_table(int(entries)))
+            return grid[cell] if cell else grid
+
+        if(len(cell) == 2 and all(isinstance(idx, (int, np.integer)) for idx in cell)):
+            row, col = (int(idx) + size if idx < 0 else int(idx) for idx, size in zip(cell, (self.height, self.width)))
+            return self.get_trajectory(row, col)[entries]
+
+        entries = range(len(self))[entries]
+        if(len(entries) == 0):
+            return np.zeros((0, self.height, self.width))[(slice(None),) + cell]
+        return np.stack([self[(entry,) + cell] for entry in entries])
+
+    def __array__(self, dtype=None, copy=None):
+        tables = np.stack([self.get_table(entry) for entry in range(len(self))]) if len(self) > 0 else np.zeros((0, len(self.rows)))
+        utilities = self.scatter(tables)
+        return utilities if dtype is None else utilities.astype(dtype)
+
+    def nbytes(self):
+        """
+        Returns:
+            Number of bytes held by the keyframes and deltas
+        """
+        return sum(table.nbytes for table in self.keyframes) + sum(idx.nbytes + val.nbytes for idx, val in zip(self.indices, self.values))
+
+    def save(self, path):
+        """
+        Writes the history to a compressed .npz file
+        """
+        counts = np.array([len(idx) for idx in self.indices], dtype=np.int64)
+        np.savez_compressed(
+            path,
+            shape=np.array([self.height, self.width]),
+            rows=self.rows, cols=self.cols,
+            settings=np.array([self.tolerance, self.keyframe_interval]),
+            keyframes=np.stack(self.keyframes) if self.keyframes else np.zeros((0, len(self.rows)), dtype=self.value_dtype),
+            counts=counts,
+            indices=np.concatenate(self.indices) if self.indices else np.zeros(0, dtype=np.int32),
+            values=np.concatenate(self.values) if self.values else np.zeros(0, dtype=self.value_dtype),
+        )
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a history written by save()
+        """
+        with np.load(path) as data:
+            tolerance, keyframe_interval = data["settings"]
+            history = cls(tolerance=tolerance, value_dtype=data["values"].dtype, keyframe_interval=int(keyframe_interval))
+            history.height, history.width = (int(size) for size in data["shape"])
+            history.rows, history.cols = data["rows"], data["cols"]
+
+            history.keyframes = list(data["keyframes"])
+            bounds = np.cumsum(data["counts"])[:-1]
+            history.indices = np.split(data["indices"], bounds) if len(data["counts"]) > 0 else []
+            history.values = np.split(data["values"], bounds) if len(data["counts"]) > 0 else []
+
+        if(len(history) > 0):
+            history.current = history.get_table(len(history) - 1)
+        return history
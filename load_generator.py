@@ -0,0 +1,149 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from main import generate_maze
+
+async def post_json(reader, writer, host, path, payload):
+    """
+    Sends one keep-alive HTTP POST with a JSON body and reads back the JSON response
+
+    Returns:
+        status: int HTTP status code
+        response: Decoded JSON response body
+    """
+    body = json.dumps(payload).encode()
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ")[1])
+    length = 0
+    for line in lines[1:]:
+        if(line.lower().startswith("content-length:")):
+            length = int(line.split(":", 1)[1])
+
+    return status, json.loads(await reader.readexactly(length))
+
+async def run_client(host, port, jobs, latencies, batch_sizes, failures):
+    """
+    Sends requests from the shared job queue one after another over a single connection
+      - Only successful (200) requests record a latency, failed ones only go to failures
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while(True):
+            try:
+                payload = jobs.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+
+            start_time = time.perf_counter()
+            status, response = await post_json(reader, writer, host, "/solve", payload)
+
+            if(status == 200):
+                latencies.append(time.perf_counter() - start_time)
+                batch_sizes.append(response["batch_size"])
+            else:
+                failures.append(response.get("error", status))
+    finally:
+        writer.close()
+
+async def run_load(host, port, payloads, concurrency):
+    """
+    Replays the payloads against the service with the given number of concurrent connections
+
+    Returns:
+        report: Dictionary with the number of requests sent, the failures among them, the throughput of the successful requests,
+                their latency percentiles (None when no request succeeded) and the mean batch size
+    """
+    jobs = asyncio.Queue()
+    for payload in payloads:
+        jobs.put_nowait(payload)
+
+    latencies = []
+    batch_sizes = []
+    failures = []
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*[run_client(host, port, jobs, latencies, batch_sizes, failures) for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start_time
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies) + len(failures),
+        "failures": len(failures),
+        "elapsed": elapsed,
+        "throughput": len(latencies) / elapsed,
+        "latency_p50_ms": float(np.percentile(latencies_ms, 50)) if latencies else None,
+        "latency_p90_ms": float(np.percentile(latencies_ms, 90)) if latencies else None,
+        "latency_p99_ms": float(np.percentile(latencies_ms, 99)) if latencies else None,
+        "mean_batch_size": float(np.mean(batch_sizes)) if batch_sizes else 0.0,
+    }
+
+async def wait_for_service(host, port, timeout=30):
+    """
+    Polls the /health endpoint until the service responds (used with --spawn)
+    """
+    deadline = time.time() + timeout
+    while(True):
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(f"GET /health HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode())
+            await writer.drain()
+            await reader.read()
+            writer.close()
+            return
+        except OSError:
+            if(time.time() > deadline):
+                raise TimeoutError(f"Solve service did not start on {host}:{port}")
+            await asyncio.sleep(0.2)
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for the local maze solve service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--requests", type=int, default=500, help="total number of solve requests")
+    parser.add_argument("--concurrency", type=int, default=32, help="number of concurrent connections")
+    parser.add_argument("--size", type=int, nargs=2, default=(10, 10), metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--algorithm", choices=("vi", "pi"), default="vi")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--spawn", action="store_true", help="start a solve service subprocess for the duration of the run")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    payloads = [
+        {"grid": generate_maze(args.size[0], args.size[1], wall_prob=0.2), "algorithm": args.algorithm}
+        for _ in range(args.requests)
+    ]
+
+    service = None
+    if(args.spawn):
+        service = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "solve_service.py"), "--host", args.host, "--port", str(args.port)])
+
+    try:
+        if(service is not None):
+            asyncio.run(wait_for_service(args.host, args.port))
+        report = asyncio.run(run_load(args.host, args.port, payloads, args.concurrency))
+    finally:
+        if(service is not None):
+            service.send_signal(signal.SIGINT)    # lets the service shut its process pool down
+            service.wait()
+
+    for name, value in report.items():
+        print(f"{name}: {value:.3f}" if isinstance(value, float) else f"{name}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,19 @@
+import argparse
 import random
 import numpy as np
-import os
 
+import checkpoint
+from auto_solver import DEFAULT_MODEL, choose_solver, get_maze_features
+from benchmark import ALGORITHMS, DEFAULT_DATABASE, PROFILED_METHODS, BenchmarkStore, benchmark_solve, get_solve
 from helper import MazeCell, Move
 from maze import Maze
+from profiler import format_profile
 # from val_agent import ValueAgent
 from util_agent import UtilityAgent
-from grid_plotter import GridPlotter, plot_data_per_trial
+from grid_plotter import GridPlotter
+from text_renderer import TextRenderer
+from report import MontageReport, ReportTrial, get_report_trial
+from rtdp import RTDPAgent
 
 def get_p1_maze():
     """
@@ -100,10 +107,10 @@ def run_vi(mazeGrid):
     agent.print_u_table()
     agent.print_policy()
 
-    plotter = GridPlotter(utilities=utilities, policy=policy, save_path="plots/PartOne")
+    plotter = GridPlotter(utilities=utilities, policy=policy, save_path="plots/PartOne", deltas=agent.stats.get("deltas"))
     while(True):
         try:
-            print("=== Plot options ===\n  1. Plot optimal policies\n  2. Plot utilities\n  3. Plot utility estimates\n  4. Plot utility estimates by row")
+            print("=== Plot options ===\n  1. Plot optimal policies\n  2. Plot utilities\n  3. Plot utility estimates\n  4. Plot utility estimates by row\n  5. Plot convergence (any maze size)\n  6. Export convergence animation")
             
             choice = int(input("Plot action: "))
             if(choice == 1):
@@ -114,6 +121,10 @@ def run_vi(mazeGrid):
                 plotter.plot_utility_estimates(maze=maze, save_filename="VI_utility_estimates", show_plot=False)
             elif(choice == 4):
                 plotter.plot_utility_estimates_separate(maze=maze, save_filename="VI_utility_estimates_by_row", show_plot=False)
+            elif(choice == 5):
+                plotter.plot_convergence(maze=maze, save_filename="VI_convergence", show_plot=False)
+            elif(choice == 6):
+                print(f"Saved {plotter.export_animation(maze=maze, save_filename='VI_convergence.gif', stride=max(1, len(utilities) // 300))}")
             else:
                 break
         except:         # non int input string
@@ -132,11 +143,11 @@ def run_pi(mazeGrid):
     agent.print_u_table()
     agent.print_policy()
 
-    plotter = GridPlotter(utilities=utilities, policy=policy, save_path="plots/PartOne")
+    plotter = GridPlotter(utilities=utilities, policy=policy, save_path="plots/PartOne", deltas=agent.stats.get("deltas"))
 
     while(True):
         try:
-            print("=== Plot options ===\n  1. Plot optimal policies\n  2. Plot utilities\n  3. Plot utility estimates\n  4. Plot utility estimates by row")
+            print("=== Plot options ===\n  1. Plot optimal policies\n  2. Plot utilities\n  3. Plot utility estimates\n  4. Plot utility estimates by row\n  5. Plot convergence (any maze size)\n  6. Export convergence animation")
             
             choice = int(input("Plot action: "))
             if(choice == 1):
@@ -147,17 +158,34 @@ def run_pi(mazeGrid):
                 plotter.plot_utility_estimates(maze=maze, save_filename="PI_utility_estimates", show_plot=False)
             elif(choice == 4):
                 plotter.plot_utility_estimates_separate(maze=maze, save_filename="PI_utility_estimates_by_row", show_plot=False)
+            elif(choice == 5):
+                plotter.plot_convergence(maze=maze, save_filename="PI_convergence", show_plot=False)
+            elif(choice == 6):
+                print(f"Saved {plotter.export_animation(maze=maze, save_filename='PI_convergence.gif', stride=max(1, len(utilities) // 300))}")
             else:
                 break
         except:         # non int input string
             print("Exiting!")
             break
 
+def run_rtdp(mazeGrid):
+    """
+    Plans only from the step by step start state with (labeled) RTDP
+    """
+    maze = Maze(mazeGrid)
+    start_pos = (3, 2)
+    if(maze.is_out_of_bounds(start_pos) or maze.grid[start_pos[0]][start_pos[1]] != MazeCell.FLOOR.value):
+        start_pos = next((rowIdx, colIdx) for rowIdx in range(maze.height) for colIdx in range(maze.width) if maze.grid[rowIdx][colIdx] == MazeCell.FLOOR.value)
+
+    agent = RTDPAgent(maze=maze)
+    utility, policy, exec_time = agent.solve(start_pos)
+    _, policy_grid = agent.get_grids(policy)
+
+    print(TextRenderer().render_policy(policy_grid, maze))
+    print(f"Utility of {start_pos}: {utility:.3f} ({agent.stats['touched_states']} states touched, {agent.stats['backups']} backups, {exec_time:.3f}s)")
+
 def print_grid(grid):
-    for row in grid:
-        for item in row:
-            print(f" {item} ", end = "")
-        print()
+    print(TextRenderer().render_maze(Maze(grid)))
     print()
 
 def set_maze():
@@ -184,77 +212,206 @@ def set_maze():
             print("Exiting!")
             break
 
-def check_others():
+# maze sizes (width, height) benchmarked by check_others
+CHECK_DIMENSIONS = [(8, 8), (10, 10), (11, 13), (12, 12), (14, 14), (16, 16), (18, 18), (25, 25), (50, 50), (100, 100)]
+
+def check_others(checkpoint_path=None, resume=False, database=DEFAULT_DATABASE, profile=False):
+    """
+    Benchmarks Value & Policy iteration on random mazes of every CHECK_DIMENSIONS size
+      - The trials of each size are drawn into one montage, see plots/PartTwo/report/index.html
+
+    Params:
+        checkpoint_path: File to checkpoint the results + RNG state to after every trial, None to disable checkpoints
+        resume: Bool to skip the trials already in the checkpoint and continue with the same random mazes
+        database: SQLite file every solve is recorded to (see benchmark.py), None to not record
+        profile: Bool to record the memory / allocation profile of every solve with its result
+    """
     trials_per_dim = 5
     max_steps = 10000
 
-    dimensions = [(8, 8), (10, 10), (11, 13), (12, 12), (14, 14), (16, 16), (18, 18), (25, 25), (50, 50), (100, 100)]
+    dimensions = CHECK_DIMENSIONS
+
+    results = {"pi_iterations": [], "vi_iterations": [], "pi_exectime": [], "vi_exectime": []}    # per dim lists of per trial values
+    report_trials = []      # ReportTrial of every finished trial of the current size, drawn once the size is done
+    store = BenchmarkStore(database) if database is not None else None
+    run_id = None
+    if(resume):
+        arrays, meta = checkpoint.load_checkpoint(checkpoint_path)
+        results = meta["results"]
+        run_id = meta.get("run_id")
+        report_trials = [ReportTrial(*(arrays[f"trial{trialIdx}_{field}"] for field in ReportTrial._fields)) for trialIdx in range(meta.get("report_trials", 0))]
+        checkpoint.set_rng_state(meta["rng"])
+        print(f"Resuming from {checkpoint_path} after {sum(len(trials) for trials in results['vi_iterations'])} trials")
+    if(store is not None and run_id is None):
+        run_id = store.start_run("check_others")
 
-    pi_iterations_per_dim = []
-    vi_iterations_per_dim = []
+    pi_iterations_per_dim = results["pi_iterations"]
+    vi_iterations_per_dim = results["vi_iterations"]
 
-    pi_exectime_per_dim = []
-    vi_exectime_per_dim = []
+    pi_exectime_per_dim = results["pi_exectime"]
+    vi_exectime_per_dim = results["vi_exectime"]
 
 
-    folder_path = 'plots/PartTwo'
-    for dim in dimensions:
+    report = MontageReport(trials_per_dim, save_path="plots/PartTwo/report")
+    for dimIdx, dim in enumerate(dimensions):
         dim_string = f"{dim[0]}x{dim[1]}"
-        os.makedirs(f"{folder_path}/{dim_string}", exist_ok=True)
+
+        if(dimIdx == len(vi_iterations_per_dim)):
+            for per_dim in results.values():
+                per_dim.append([])
+        elif(dimIdx < len(vi_iterations_per_dim) - 1):
+            continue        # finished and drawn before resuming
 
         print(f"Checking {dim_string}!")
-        pi_iterations = []
-        vi_iterations = []
+        pi_iterations = pi_iterations_per_dim[dimIdx]
+        vi_iterations = vi_iterations_per_dim[dimIdx]
 
-        pi_exectime = []
-        vi_exectime = []
+        pi_exectime = pi_exectime_per_dim[dimIdx]
+        vi_exectime = vi_exectime_per_dim[dimIdx]
 
-        for i in range(trials_per_dim):
+        for i in range(len(vi_iterations), trials_per_dim):
             print(f"{dim_string}, Trial {i}")
+            maze_seed = random.randrange(2 ** 32)     # recorded so every benchmarked maze can be regenerated
+            random.seed(maze_seed)
             maze_grid = generate_maze(dim[0], dim[1], wall_prob=0.2)
             maze = Maze(maze_grid)
 
             # Value iteration
             vi_agent = UtilityAgent(maze=maze)
-            vi_utilities, vi_policy, vi_time = vi_agent.value_iteration(max_steps=max_steps)
+            (vi_utilities, vi_policy, vi_time), vi_memory, vi_stats = benchmark_solve(vi_agent, "vi", max_steps, profile)
             vi_iterations.append(len(vi_utilities))
             vi_exectime.append(vi_time)
 
-            vi_plotter = GridPlotter(utilities=vi_utilities, policy=vi_policy, save_path=f"plots/PartTwo/{dim_string}")
-            vi_plotter.plot_optimal_policy(maze, save_filename=f"{dim_string}_VI_policy_{i}", show_plot=False)
-            vi_plotter.plot_utility_graph(maze, save_filename=f"{dim_string}_VI_utility_{i}", show_plot=False)
-
             # Policy iteration
             pi_agent = UtilityAgent(maze=maze)
-            pi_utilities, pi_policy, pi_time = pi_agent.policy_iteration(max_steps=max_steps)
+            (pi_utilities, pi_policy, pi_time), pi_memory, pi_stats = benchmark_solve(pi_agent, "pi", max_steps, profile)
             pi_iterations.append(len(pi_utilities))
             pi_exectime.append(pi_time)
 
-            pi_plotter = GridPlotter(utilities=pi_utilities, policy=pi_policy, save_path=f"plots/PartTwo/{dim_string}")
+            report_trials.append(get_report_trial(maze, vi_utilities, vi_policy, pi_utilities, pi_policy))
 
-            pi_plotter.plot_optimal_policy(maze, save_filename=f"{dim_string}_PI_policy_{i}", show_plot=False)
-            pi_plotter.plot_utility_graph(maze, save_filename=f"{dim_string}_PI_utility_{i}", show_plot=False)
+            if(store is not None):
+                features = get_maze_features(maze, vi_agent.discount_factor, vi_agent.state_space)     # lets the results calibrate the auto solver
+                store.record(run_id, "vi", dim[0], dim[1], maze_seed, i, len(vi_utilities), vi_time, vi_memory, {**(vi_stats or {}), "features": features})
+                store.record(run_id, "pi", dim[0], dim[1], maze_seed, i, len(pi_utilities), pi_time, pi_memory, {**(pi_stats or {}), "features": features})
+            if(checkpoint_path is not None):
+                # the unfinished size keeps its drawn tables in the checkpoint, so its montage is complete after a resume
+                arrays = {f"trial{trialIdx}_{field}": value for trialIdx, trial in enumerate(report_trials) for field, value in trial._asdict().items()}
+                meta = {"results": results, "run_id": run_id, "report_trials": len(report_trials), "rng": checkpoint.get_rng_state()}
+                checkpoint.save_checkpoint(checkpoint_path, arrays, meta)
 
-        pi_iterations_per_dim.append(pi_iterations)
-        vi_iterations_per_dim.append(vi_iterations)
+        report.render_size(dim_string, report_trials, vi_iterations, pi_iterations, vi_exectime, pi_exectime)
+        report_trials = []
 
-        pi_exectime_per_dim.append(pi_exectime)
-        vi_exectime_per_dim.append(vi_exectime)
+    if(store is not None):
+        print(f"Recorded run {run_id} to {database}")
+        store.close()
 
-    # print(pi_iterations_per_dim)
-    # print(vi_iterations_per_dim)
-    for i in range(len(dimensions)):
-        dim_string = f"{dimensions[i][0]}x{dimensions[i][1]}"
-        plot_data_per_trial(vi_data=vi_iterations_per_dim[i], pi_data=pi_iterations_per_dim[i], title=f"Iterations for Value & Policy iteration in {dim_string}", save_filename=f"plots/PartTwo/{dim_string}/{dim_string}_iterations", show_plot=False)
-        
-        plot_data_per_trial(vi_data=vi_exectime_per_dim[i], pi_data=pi_exectime_per_dim[i], y_label="Time taken", title=f"Exec time for Value & Policy iteration in {dim_string}", save_filename=f"plots/PartTwo/{dim_string}/{dim_string}_exec_time", show_plot=False)
+    sections = [(f"{dim[0]}x{dim[1]}",) + tuple(results[key][dimIdx] for key in ("vi_iterations", "pi_iterations", "vi_exectime", "pi_exectime"))
+                for dimIdx, dim in enumerate(dimensions)]
+    print(f"Saved the report to {report.save_index(sections)}")
+    report.close()
 
 
 
+def compare_accelerations(trials_per_dim=3, max_steps=10000):
+    """
+    Reports the mean number of sweeps of accelerated Value Iteration against plain VI over the check_others sizes
+      - Every scheme solves the same mazes, "max err" is the largest utility difference to plain VI
+    """
+    schemes = [("sor", {"relaxation": 1.2}), ("sor", {"relaxation": 1.5}), ("anderson", {"memory": 5})]
+    names = ["plain"] + [f"{acceleration} {list(params.values())[0]}" for acceleration, params in schemes]
+
+    lines = [f"{'size':>8} " + " ".join(f"{name:>14}" for name in names) + f" {'max err':>9} {'fallbacks':>9}"]
+    for dim in CHECK_DIMENSIONS:
+        sweeps = np.zeros((trials_per_dim, len(names)))
+        max_error = 0.0
+        fallbacks = 0
+        for i in range(trials_per_dim):
+            maze = Maze(generate_maze(dim[0], dim[1], wall_prob=0.2))
+
+            agent = UtilityAgent(maze=maze)
+            utilities, _, _ = agent.value_iteration(max_steps=max_steps)
+            sweeps[i, 0] = agent.stats["backups"] / max(1, agent.state_space.num_decision)
+
+            for j, (acceleration, params) in enumerate(schemes):
+                agent = UtilityAgent(maze=maze)
+                accelerated, _, _ = agent.value_iteration(max_steps=max_steps, acceleration=acceleration, **params)
+                sweeps[i, j + 1] = agent.stats["backups"] / max(1, agent.state_space.num_decision)
+                max_error = max(max_error, float(np.max(np.abs(accelerated[-1] - utilities[-1]))))
+                fallbacks += agent.stats["fallbacks"]
+
+        mean_sweeps = sweeps.mean(axis=0)
+        lines.append(f"{dim[0]:>3} x {dim[1]:<3}" + " ".join(f"{count:>14.1f}" for count in mean_sweeps) + f" {max_error:>9.1e} {fallbacks:>9}")
+
+    print("\n".join(lines))
+
 def custom():
     pass
 
+def solve_from_cli(args):
+    """
+    Runs a single VI / PI solve without the menus, resuming it from args.checkpoint if asked to
+      - "auto" lets the cost model of auto_solver pick the solver (only plain UtilityAgent VI / PI can be checkpointed,
+        only the PROFILED_METHODS of benchmark.ALGORITHMS can be profiled)
+    """
+    if(args.resume):
+        agent, algorithm = UtilityAgent.from_checkpoint(args.checkpoint)
+    else:
+        random.seed(args.seed)
+        mazeGrid = get_p1_maze() if args.size is None else generate_maze(args.size[0], args.size[1], wall_prob=0.2)
+        if(args.solve == "auto"):
+            candidates = None
+            if(args.checkpoint is not None):
+                candidates = ["vi", "pi"]
+            elif(args.profile):
+                candidates = [algorithm for algorithm, (_, method, _) in ALGORITHMS.items() if method in PROFILED_METHODS]
+            agent, algorithm = choose_solver(Maze(mazeGrid), model_path=args.model, candidates=candidates)
+        else:
+            agent, algorithm = UtilityAgent(maze=Maze(mazeGrid)), args.solve
+
+    options = {}
+    if(args.profile):
+        options["profile"] = True
+    if(args.checkpoint is not None):
+        options.update(checkpoint_path=args.checkpoint, checkpoint_every=args.checkpoint_every, resume=args.resume)
+    utilities, _, exec_time = get_solve(agent, algorithm, args.max_steps)(**options)
+
+    agent.print_u_table()
+    agent.print_policy()
+    print(f"{len(utilities)} iterations in {exec_time:.3f}s")
+    if(args.profile):
+        print(format_profile(agent.stats["profile"]))
+
 def main():
+    parser = argparse.ArgumentParser(description="Value & Policy iteration on grid mazes, starts the interactive menu without any option")
+    parser.add_argument("--solve", choices=("vi", "pi", "auto"), help="run one solve without the menus, auto picks the solver by the fitted cost model")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="cost model file of --solve auto (see 'python benchmark.py fit')")
+    parser.add_argument("--size", type=int, nargs=2, metavar=("WIDTH", "HEIGHT"), help="solve a random maze of this size instead of the part one maze")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random maze")
+    parser.add_argument("--max-steps", type=int, default=10000)
+    parser.add_argument("--check-others", action="store_true", help="run the check_others benchmark without the menus")
+    parser.add_argument("--checkpoint", help="file to checkpoint the solve / benchmark to")
+    parser.add_argument("--checkpoint-every", type=int, default=100, help="iterations between solve checkpoints")
+    parser.add_argument("--resume", action="store_true", help="continue from --checkpoint instead of starting over")
+    parser.add_argument("--db", default=DEFAULT_DATABASE, help="benchmark database check_others records to")
+    parser.add_argument("--no-db", action="store_true", help="do not record check_others to the benchmark database")
+    parser.add_argument("--profile", action="store_true", help="profile the memory use of each solver phase")
+    args = parser.parse_args()
+
+    if(args.resume and args.checkpoint is None):
+        parser.error("--resume needs --checkpoint")
+    if(args.resume and not args.solve and not args.check_others):
+        # pick up whatever the checkpoint was written by
+        _, meta = checkpoint.load_checkpoint(args.checkpoint)
+        args.check_others = "results" in meta
+    if(args.solve or (args.resume and not args.check_others)):
+        solve_from_cli(args)
+        return
+    if(args.check_others):
+        check_others(checkpoint_path=args.checkpoint, resume=args.resume, database=None if args.no_db else args.db, profile=args.profile)
+        return
+
     # Initialize maze and agent
     mazeGrid = get_p1_maze()
 
@@ -265,6 +422,8 @@ def main():
             print("3. Policy iteration")
             print("4. Set maze")
             print("5. Check other mazes")
+            print("6. RTDP from the start state")
+            print("7. Compare accelerated value iteration")
             choice = int(input("Choice: "))
 
             if(choice == 1):
@@ -277,6 +436,10 @@ def main():
                 mazeGrid = set_maze()
             elif(choice == 5):
                 check_others()
+            elif(choice == 6):
+                run_rtdp(mazeGrid)
+            elif(choice == 7):
+                compare_accelerations()
             else:
                 custom()
 
@@ -1,4 +1,5 @@
 from helper import MazeCell
+from text_renderer import TextRenderer
 
 class Maze:
     def __init__(self, grid):
@@ -42,44 +43,24 @@ class Maze:
         else:  # White square
             return -0.05
         
-    def print_grid(self, current_pos):
-        """Prints the current grid view"""
-        for rowIdx in range(self.height):
-            column_headers = [idx for idx in range(len(self.grid[rowIdx]))]
-            if(rowIdx == 0): # print col index
-                print("   ", end="")
-                for header in column_headers:
-                    print(f" {header} ", end="")
-                print()
-
-            for colIdx in range(self.width):
-                if(colIdx == 0):
-                    print(f"{rowIdx}  ", end="")     # print row index
+    def print_grid(self, current_pos, viewport=None):
+        """
+        Prints the current grid view
 
-                if(rowIdx, colIdx) == current_pos:
-                    print(" X ", end="")
-                else:
-                    print(f" {self.grid[rowIdx][colIdx]} ", end="")
-            print()
+        Params:
+            current_pos: (row, col) of the agent, shown as X
+            viewport: Optional ((row_start, row_stop), (col_start, col_stop)) window, big grids are shown as an overview
+        """
+        print(TextRenderer(viewport=viewport).render_maze(self, current_pos))
         print(f"Current state: {current_pos}")
 
-    def print_grid_rewards(self, current_pos):
-        """Prints the current grid but showing the reward values instead"""
-        for rowIdx in range(self.height):
-            column_headers = [idx for idx in range(len(self.grid[rowIdx]))]
-            if(rowIdx == 0): # print col index
-                print("   ", end="")
-                for header in column_headers:
-                    print(f" {header} ", end="")
-                print()
-
-            for colIdx in range(self.width):
-                if(colIdx == 0):
-                    print(f"{rowIdx}  ", end="")     # print row index
+    def print_grid_rewards(self, current_pos, viewport=None):
+        """
+        Prints the current grid but showing the reward values instead
 
-                if(rowIdx, colIdx) == current_pos:
-                    print(" X ", end="")
-                else:
-                    print(f" {self.get_reward((rowIdx, colIdx))} ", end="")
-            print()
-        print(f"Current state: {current_pos}")
\ No newline at end of file
+        Params:
+            current_pos: (row, col) of the agent, shown as X
+            viewport: Optional ((row_start, row_stop), (col_start, col_stop)) window, big grids are shown as an overview
+        """
+        print(TextRenderer(viewport=viewport).render_maze(self, current_pos, rewards=True))
+        print(f"Current state: {current_pos}")
@@ -0,0 +1,134 @@
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:     # not available on Windows, the peak RSS is then left out
+    resource = None
+
+# phases a solve is split into, in the order they are reported
+SOLVE_PHASES = ["init", "evaluation", "improvement", "history", "policy_extraction"]
+
+def get_rss():
+    """
+    Gets the resident set size of the process in bytes (None where /proc is not available)
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * resource.getpagesize()
+    except (OSError, AttributeError):
+        return None
+
+def get_peak_rss():
+    """
+    Gets the peak resident set size of the process so far in bytes (None where the resource module is not available)
+    """
+    if(resource is None):
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024     # kilobytes everywhere but macOS
+
+class SolveProfiler:
+    def __init__(self):
+        """
+        Opt-in memory profiler of one solve, the solvers wrap each of their SOLVE_PHASES in phase()
+          - tracemalloc traces every Python / NumPy allocation, so the peak of each phase includes the temporaries
+            it frees again before returning (e.g. the expected utilities of a sweep or the np.stack of the history)
+          - CPython keeps no running count of allocations, the block counts are the net number of blocks a phase
+            left allocated (sys.getallocatedblocks), which shows what a phase retains (e.g. one table per history entry)
+          - Slows the solve down a lot, only used when asked for
+        """
+        self.phases = {}
+        self.peak_bytes = 0
+        self.started_tracing = False
+        self.start_time = None
+        self.start_rss = None
+
+    def start(self):
+        self.started_tracing = not tracemalloc.is_tracing()
+        if(self.started_tracing):
+            tracemalloc.start()
+        self.start_rss = get_rss()
+        self.start_time = time.time()
+
+    def update_peak(self):
+        _, peak = tracemalloc.get_traced_memory()
+        self.peak_bytes = max(self.peak_bytes, peak)
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Measures the wrapped code as (another call of) the given phase
+        """
+        self.update_peak()
+        tracemalloc.reset_peak()
+        start_bytes, _ = tracemalloc.get_traced_memory()
+        start_blocks = sys.getallocatedblocks()
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            exec_time = time.time() - start_time
+            end_bytes, peak = tracemalloc.get_traced_memory()
+            self.peak_bytes = max(self.peak_bytes, peak)
+
+            stats = self.phases.setdefault(name, {"calls": 0, "time": 0.0, "peak_bytes": 0, "net_bytes": 0, "net_blocks": 0})
+            stats["calls"] += 1
+            stats["time"] += exec_time
+            stats["peak_bytes"] = max(stats["peak_bytes"], peak - start_bytes)
+            stats["net_bytes"] += end_bytes - start_bytes
+            stats["net_blocks"] += sys.getallocatedblocks() - start_blocks
+
+    def stop(self):
+        """
+        Ends the profile
+
+        Returns:
+            Dictionary with the overall tracemalloc "peak_bytes", the process "rss" at the start / end + "peak_rss",
+            the profiled "time" and per phase "phases" stats (calls, time, peak_bytes above the phase start, net_bytes, net_blocks)
+        """
+        self.update_peak()
+        if(self.started_tracing):
+            tracemalloc.stop()
+
+        end_rss, peak_rss = get_rss(), get_peak_rss()
+        if(end_rss is not None and peak_rss is not None):
+            peak_rss = max(peak_rss, end_rss)       # /proc and getrusage sample the RSS slightly differently
+
+        ordered = sorted(self.phases, key=lambda name: SOLVE_PHASES.index(name) if name in SOLVE_PHASES else len(SOLVE_PHASES))
+        return {
+            "peak_bytes": self.peak_bytes,
+            "start_rss": self.start_rss,
+            "end_rss": end_rss,
+            "peak_rss": peak_rss,
+            "time": time.time() - self.start_time,
+            "phases": {name: self.phases[name] for name in ordered},
+        }
+
+class NullProfiler:
+    """
+    Stand-in used when a solve is not profiled, its phases cost one no-op context manager
+    """
+    def phase(self, name):
+        return nullcontext()
+
+NULL_PROFILER = NullProfiler()
+
+def format_profile(profile):
+    """
+    Formats the stats returned by SolveProfiler.stop as a small table
+    """
+    def megabytes(value):
+        return "-" if value is None else f"{value / 2 ** 20:.2f}MB"
+
+    lines = [
+        f"peak traced {megabytes(profile['peak_bytes'])}, RSS {megabytes(profile['start_rss'])} -> {megabytes(profile['end_rss'])} "
+        f"(peak {megabytes(profile['peak_rss'])}), {profile['time']:.3f}s profiled",
+        f"{'phase':<18}{'calls':>7}{'time':>10}{'peak':>12}{'net':>12}{'blocks':>9}",
+    ]
+    for name, stats in profile["phases"].items():
+        lines.append(f"{name:<18}{stats['calls']:>7}{stats['time']:>9.3f}s{megabytes(stats['peak_bytes']):>12}{megabytes(stats['net_bytes']):>12}{stats['net_blocks']:>9}")
+
+    return "\n".join(lines)
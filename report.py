@@ -0,0 +1,212 @@
+import html
+import os
+from collections import namedtuple
+
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.patches import Patch
+
+from grid_plotter import get_cell_frame
+from helper import Move
+
+# final solution of one check_others trial, every array is laid out on the H x W grid
+#   - maze_grid: ndarray of MazeCell values
+#   - vi_utilities / pi_utilities: float ndarray of the final utilities
+#   - vi_policy / pi_policy: int8 ndarray of Move values (-1 for non-floor cells)
+ReportTrial = namedtuple("ReportTrial", ["maze_grid", "vi_utilities", "vi_policy", "pi_utilities", "pi_policy"])
+
+# raster colors of the policy panels, per Move value (kept apart from the green / orange / grey cells)
+MOVE_RGBA = {
+    Move.UP: (0.12, 0.47, 0.71, 1),
+    Move.DOWN: (0.58, 0.40, 0.74, 1),
+    Move.LEFT: (0.09, 0.75, 0.81, 1),
+    Move.RIGHT: (0.89, 0.47, 0.76, 1)
+}
+
+def get_report_trial(maze, vi_utilities, vi_policy, pi_utilities, pi_policy):
+    """
+    Keeps just what the report draws of a trial (the last utilities and the policy) instead of the whole histories
+
+    Params:
+        maze: Maze object the trial was solved on
+        vi_utilities, pi_utilities: Utility histories returned by the solves (ndarray or DeltaHistory)
+        vi_policy, pi_policy: 2D lists of Move() / None returned by the solves
+
+    Returns:
+        ReportTrial
+    """
+    def get_policy_array(policy_grid):
+        return np.array([[-1 if move is None else move.value for move in row] for row in policy_grid], dtype=np.int8)
+
+    return ReportTrial(np.array(maze.grid), np.asarray(vi_utilities[-1], dtype=float), get_policy_array(vi_policy),
+                       np.asarray(pi_utilities[-1], dtype=float), get_policy_array(pi_policy))
+
+class MontageReport:
+    def __init__(self, trials_per_dim=5, save_path="plots/PartTwo/report", dpi=100):
+        """
+        Renders the check_others trials of each maze size as one montage PNG, plus an index.html over all sizes
+          - One figure and set of axes is created up front and reused for every size: each panel is a single raster
+            image (one pixel per cell) whose data is swapped per size, the bar charts only get new heights
+          - Rows: VI utilities, VI policy, PI utilities, PI policy (one column per trial), then the iterations / exec time bars
+
+        Params:
+            trials_per_dim: Number of trials (columns) per size
+            save_path: Folder the montages and index.html are written to
+            dpi: Resolution of the saved montages
+        """
+        self.trials_per_dim = trials_per_dim
+        self.save_path = save_path
+        self.dpi = dpi
+        self.row_labels = ["VI utilities", "VI policy", "PI utilities", "PI policy"]
+
+        self.figure = plt.figure(figsize=(3 * trials_per_dim + 1.5, 3 * len(self.row_labels) + 3))
+        grid_spec = self.figure.add_gridspec(len(self.row_labels) + 1, trials_per_dim + 1, height_ratios=[1] * len(self.row_labels) + [1.1],
+                                             width_ratios=[1] * trials_per_dim + [0.06], top=0.93, bottom=0.05)
+
+        self.mappable = plt.cm.ScalarMappable(norm=plt.Normalize(-1, 1), cmap="viridis")
+        self.axes = []
+        self.images = []
+        for rowIdx, label in enumerate(self.row_labels):
+            row_axes, row_images = [], []
+            for trialIdx in range(trials_per_dim):
+                ax = self.figure.add_subplot(grid_spec[rowIdx, trialIdx])
+                ax.set_xticks([])
+                ax.set_yticks([])
+                if(trialIdx == 0):
+                    ax.set_ylabel(label)
+                row_axes.append(ax)
+                row_images.append(ax.imshow(np.zeros((1, 1, 4)), interpolation="nearest"))
+            self.axes.append(row_axes)
+            self.images.append(row_images)
+
+        self.figure.colorbar(self.mappable, cax=self.figure.add_subplot(grid_spec[:len(self.row_labels), trials_per_dim]), label="Utility")
+        self.figure.legend(handles=[Patch(color=color, label=move.name.lower()) for move, color in MOVE_RGBA.items()],
+                           loc="upper right", ncol=len(MOVE_RGBA), fontsize="small")
+
+        # bar charts of the iterations and exec time per trial, the bars are created once and resized per size
+        bar_spec = grid_spec[len(self.row_labels), :trials_per_dim].subgridspec(1, 2, wspace=0.3)
+        indices = np.arange(trials_per_dim)
+        bar_width = 0.4
+        self.bar_axes = {}
+        self.bars = {}
+        for columnIdx, (metric, y_label) in enumerate((("iterations", "Iterations needed"), ("exec_time", "Time taken"))):
+            ax = self.figure.add_subplot(bar_spec[0, columnIdx])
+            ax.set_xlabel("Trial")
+            ax.set_ylabel(y_label)
+            ax.set_xticks(indices)
+            self.bar_axes[metric] = ax
+            self.bars[metric] = (
+                ax.bar(indices - bar_width/2, np.zeros(trials_per_dim), width=bar_width, color='skyblue', label="Value iteration"),
+                ax.bar(indices + bar_width/2, np.zeros(trials_per_dim), width=bar_width, color='salmon', label="Policy iteration")
+            )
+            ax.legend(fontsize="small")
+
+        self.title = self.figure.suptitle("")
+
+    def close(self):
+        plt.close(self.figure)
+
+    def get_utility_frame(self, maze_grid, utilities):
+        frame, floor = get_cell_frame(maze_grid)
+        frame[floor] = self.mappable.to_rgba(utilities[floor])
+        return frame
+
+    def get_policy_frame(self, maze_grid, policy):
+        frame, floor = get_cell_frame(maze_grid)
+        frame[floor] = (1, 1, 1, 1)     # floor cells without an action stay white
+        for move, color in MOVE_RGBA.items():
+            frame[floor & (policy == move.value)] = color
+        return frame
+
+    def set_bars(self, metric, vi_data, pi_data):
+        for bars, data in zip(self.bars[metric], (vi_data, pi_data)):
+            for trialIdx, bar in enumerate(bars):
+                bar.set_height(data[trialIdx] if trialIdx < len(data) else 0)
+
+        ax = self.bar_axes[metric]
+        ax.relim()
+        ax.autoscale_view()
+
+    def render_size(self, dim_string, trials, vi_iterations, pi_iterations, vi_exectime, pi_exectime):
+        """
+        Draws the trials of one maze size into the shared figure and saves it as "<dim_string>.png"
+
+        Params:
+            dim_string: Name of the size, e.g. "10x10"
+            trials: List of ReportTrial, at most trials_per_dim
+            vi_iterations, pi_iterations, vi_exectime, pi_exectime: Per trial lists of the results
+
+        Returns:
+            path: Path of the saved montage
+        """
+        floor_values = [table[get_cell_frame(trial.maze_grid)[1]] for trial in trials for table in (trial.vi_utilities, trial.pi_utilities)]
+        floor_values = [values for values in floor_values if len(values) > 0]
+        if(floor_values):
+            self.mappable.set_clim(min(map(np.min, floor_values)), max(map(np.max, floor_values)))     # one color scale per size
+
+        for trialIdx in range(self.trials_per_dim):
+            trial = trials[trialIdx] if trialIdx < len(trials) else None
+            for rowIdx in range(len(self.row_labels)):
+                ax, image = self.axes[rowIdx][trialIdx], self.images[rowIdx][trialIdx]
+                ax.set_visible(trial is not None)
+                if(trial is None):
+                    continue
+
+                if(rowIdx == 0):
+                    image.set_data(self.get_utility_frame(trial.maze_grid, trial.vi_utilities))
+                elif(rowIdx == 1):
+                    image.set_data(self.get_policy_frame(trial.maze_grid, trial.vi_policy))
+                elif(rowIdx == 2):
+                    image.set_data(self.get_utility_frame(trial.maze_grid, trial.pi_utilities))
+                else:
+                    image.set_data(self.get_policy_frame(trial.maze_grid, trial.pi_policy))
+                height, width = trial.maze_grid.shape
+                image.set_extent((-0.5, width - 0.5, height - 0.5, -0.5))
+
+            if(trial is not None):
+                self.axes[0][trialIdx].set_title(f"Trial {trialIdx}: VI {vi_iterations[trialIdx]} it, PI {pi_iterations[trialIdx]} it", fontsize="small")
+
+        self.set_bars("iterations", vi_iterations, pi_iterations)
+        self.set_bars("exec_time", vi_exectime, pi_exectime)
+        self.title.set_text(f"Value & Policy iteration in {dim_string} ({len(trials)} trials)")
+
+        os.makedirs(self.save_path, exist_ok=True)
+        path = f"{self.save_path}/{dim_string}.png"
+        self.figure.savefig(path, dpi=self.dpi)
+
+        return path
+
+    def save_index(self, sections, title="Value & Policy iteration benchmark"):
+        """
+        Writes index.html with a results table and the montage of every size
+
+        Params:
+            sections: List of (dim_string, vi_iterations, pi_iterations, vi_exectime, pi_exectime), sizes without a montage are left out
+
+        Returns:
+            path: Path of index.html
+        """
+        lines = [
+            "<!DOCTYPE html>",
+            f"<html><head><meta charset=\"utf-8\"><title>{html.escape(title)}</title>",
+            "<style>body{font-family:sans-serif} table{border-collapse:collapse;margin-bottom:1em} td,th{border:1px solid #ccc;padding:2px 8px;text-align:right} img{max-width:100%}</style>",
+            f"</head><body><h1>{html.escape(title)}</h1>",
+        ]
+        for dim_string, vi_iterations, pi_iterations, vi_exectime, pi_exectime in sections:
+            if(not os.path.exists(f"{self.save_path}/{dim_string}.png")):
+                continue
+
+            lines.append(f"<h2 id=\"{html.escape(dim_string)}\">{html.escape(dim_string)}</h2>")
+            lines.append("<table><tr><th>Trial</th><th>VI iterations</th><th>VI time (s)</th><th>PI iterations</th><th>PI time (s)</th></tr>")
+            for trialIdx, row in enumerate(zip(vi_iterations, vi_exectime, pi_iterations, pi_exectime)):
+                lines.append(f"<tr><td>{trialIdx}</td><td>{row[0]}</td><td>{row[1]:.4f}</td><td>{row[2]}</td><td>{row[3]:.4f}</td></tr>")
+            lines.append("</table>")
+            lines.append(f"<img src=\"{html.escape(dim_string)}.png\" alt=\"{html.escape(dim_string)} montage\">")
+        lines.append("</body></html>")
+
+        os.makedirs(self.save_path, exist_ok=True)
+        path = f"{self.save_path}/index.html"
+        with open(path, "w") as file:
+            file.write("\n".join(lines))
+
+        return path
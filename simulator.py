@@ -0,0 +1,166 @@
+import math
+import time
+from statistics import NormalDist
+
+import numpy as np
+
+from helper import NO_ACTION
+
+class PolicySimulator:
+    def __init__(self, state_space, policy, discount_factor=0.99, seed=None):
+        """
+        Initializes a Monte-Carlo simulator that rolls out a fixed policy in the maze
+          - Episodes run in parallel as NumPy arrays, slips are sampled from the transition model (0.8 / 0.1 / 0.1)
+          - An episode ends once it enters a reward / punishment cell, matching how the agents fix their utilities to R(s)
+
+        Params:
+            state_space: StateSpace of the maze to simulate
+            policy: Compact int8 policy array (agent.policy) or H x W grid of Move() as returned by the agents
+            discount_factor: Gamma value used to discount the collected rewards
+            seed: Seed for the random number generator, for reproducible runs
+        """
+        self.state_space = state_space
+        self.discount_factor = discount_factor
+        self.rng = np.random.default_rng(seed)
+
+        if(not isinstance(policy, np.ndarray)):
+            policy = state_space.gather_policy(policy)
+        if(np.any(policy[:state_space.num_decision] == NO_ACTION)):
+            raise ValueError("Policy has no action for some floor cells")
+        self.policy = policy.astype(np.intp)
+
+        # flattened transition table, next state = flat_next[(state * len(Move) + action) * 3 + outcome]
+        self.flat_next = state_space.next_states.reshape(-1)
+        self.num_actions = state_space.next_states.shape[1]
+        self.num_outcomes = state_space.next_states.shape[2]
+        self.cum_probabilities = np.cumsum(state_space.probabilities)[:-1]
+
+    def default_horizon(self, tolerance=1e-3):
+        """
+        Gets the number of steps after which the remaining discounted rewards are below the tolerance (per unit reward)
+        """
+        if(self.discount_factor >= 1):
+            return 10000
+        return max(1, math.ceil(math.log(tolerance) / math.log(self.discount_factor)))
+
+    def rollout(self, starts, horizon):
+        """
+        Simulates one episode per entry of starts, all of them in lockstep
+
+        Params:
+            starts: int array of compact start state indices (repeated once per episode)
+            horizon: Max. number of steps before an episode is cut off
+
+        Returns:
+            returns: ndarray of discounted returns for each episode
+            steps: Total number of agent steps simulated
+        """
+        space = self.state_space
+
+        returns = space.rewards[starts].copy()
+        alive = np.flatnonzero(starts < space.num_decision)     # episodes starting on a fixed cell are already over
+        positions = starts[alive]
+        discount = 1.0
+
+        steps = 0
+        for _ in range(horizon):
+            if(len(alive) == 0):
+                break
+
+            slips = self.rng.random(len(alive))
+            outcomes = np.zeros(len(alive), dtype=np.intp)
+            for cum_probability in self.cum_probabilities:
+                outcomes += slips >= cum_probability
+
+            actions = self.policy[positions]
+            positions = self.flat_next[(positions * self.num_actions + actions) * self.num_outcomes + outcomes]
+
+            discount *= self.discount_factor
+            returns[alive] += discount * space.rewards[positions]
+            steps += len(alive)
+
+            # drop the episodes that just reached a terminal (reward / punishment) cell
+            running = positions < space.num_decision
+            if(not np.all(running)):
+                alive = alive[running]
+                positions = positions[running]
+
+        return returns, steps
+
+    def run(self, start_states=None, episodes=1000, horizon=None, confidence=0.95, batch_size=1 << 20):
+        """
+        Runs the given number of episodes from each start state and summarises the empirical discounted returns
+
+        Params:
+            start_states: List of (row, col) start positions, defaults to every non-wall cell
+            episodes: Number of episodes per start state
+            horizon: Max. steps per episode, defaults to when gamma^t drops below 1e-3
+            confidence: Confidence level of the returned intervals (normal approximation)
+            batch_size: Max. number of episodes simulated together, bounds the memory used
+
+        Returns:
+            result: Dictionary with H x W grids "mean", "std", "ci_low" and "ci_high" (NaN for cells that were not simulated),
+                    plus the total "steps" simulated, "exec_time" and "steps_per_second"
+        """
+        space = self.state_space
+        if(start_states is None):
+            starts = np.arange(space.num_states)
+        else:
+            starts = np.array([space.index[state] for state in start_states], dtype=np.intp)
+            if(np.any(starts < 0)):
+                raise ValueError("Start states cannot be walls")
+        if(horizon is None):
+            horizon = self.default_horizon()
+
+        sums = np.zeros(len(starts))
+        square_sums = np.zeros(len(starts))
+        total_steps = 0
+
+        start_time = time.time()
+        starts_per_batch = max(1, batch_size // episodes)
+        for batchStart in range(0, len(starts), starts_per_batch):
+            batch = starts[batchStart:batchStart + starts_per_batch]
+            returns, steps = self.rollout(np.repeat(batch, episodes), horizon)
+            returns = returns.reshape(len(batch), episodes)
+
+            sums[batchStart:batchStart + len(batch)] = returns.sum(axis=1)
+            square_sums[batchStart:batchStart + len(batch)] = np.square(returns).sum(axis=1)
+            total_steps += steps
+        exec_time = time.time() - start_time
+
+        mean = sums / episodes
+        std = np.sqrt(np.maximum(square_sums / episodes - np.square(mean), 0))
+        half_width = NormalDist().inv_cdf(0.5 + confidence / 2) * std / math.sqrt(episodes)
+
+        def to_grid(values):
+            grid = np.full((space.height, space.width), np.nan)
+            grid[space.rows[starts], space.cols[starts]] = values
+            return grid
+
+        return {
+            "mean": to_grid(mean),
+            "std": to_grid(std),
+            "ci_low": to_grid(mean - half_width),
+            "ci_high": to_grid(mean + half_width),
+            "steps": total_steps,
+            "exec_time": exec_time,
+            "steps_per_second": total_steps / exec_time if exec_time > 0 else float("inf"),
+        }
+
+def validate_utilities(utilities, result):
+    """
+    Compares calculated utilities against simulated returns
+
+    Params:
+        utilities: H x W utility table (e.g. the last entry of the utilities returned by an agent)
+        result: Dictionary returned by PolicySimulator.run()
+
+    Returns:
+        max_error: Max. absolute difference between the utilities and the mean simulated returns
+        coverage: Fraction of simulated cells whose utility lies within the confidence interval
+    """
+    simulated = ~np.isnan(result["mean"])
+    error = np.abs(utilities[simulated] - result["mean"][simulated])
+    covered = (utilities[simulated] >= result["ci_low"][simulated]) & (utilities[simulated] <= result["ci_high"][simulated])
+
+    return float(error.max(initial=0)), float(covered.mean()) if covered.size else 1.0
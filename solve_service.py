@@ -0,0 +1,368 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from helper import MazeCell
+from maze import Maze
+from state_space import StateSpace
+from util_agent import UtilityAgent
+
+ALGORITHMS = ("vi", "pi")
+
+def validate_request(payload):
+    """
+    Checks a solve request and fills in the default hyperparams
+
+    Params:
+        payload: Decoded JSON body, {"grid": [[...]], "discount_factor": 0.99, "threshold": 0.0001, "algorithm": "vi", "max_steps": 1000}
+
+    Returns:
+        request: Dictionary with the grid and every hyperparam set
+    """
+    grid = payload.get("grid")
+    if(not isinstance(grid, list) or len(grid) == 0 or not all(isinstance(row, list) for row in grid)):
+        raise ValueError("grid must be a non-empty 2D list")
+
+    width = len(grid[0])
+    cell_values = {cell.value for cell in MazeCell}
+    for row in grid:
+        if(len(row) != width or width == 0):
+            raise ValueError("grid rows must all have the same non-zero length")
+        for cell in row:
+            if(cell not in cell_values):
+                raise ValueError(f"unknown cell {cell!r}, expected one of {sorted(cell_values)}")
+
+    request = {
+        "grid": grid,
+        "discount_factor": float(payload.get("discount_factor", 0.99)),
+        "threshold": float(payload.get("threshold", 0.0001)),
+        "algorithm": str(payload.get("algorithm", "vi")).lower(),
+        "max_steps": int(payload.get("max_steps", 1000)),
+    }
+    if(request["algorithm"] not in ALGORITHMS):
+        raise ValueError(f"algorithm must be one of {ALGORITHMS}")
+    if(not 0 < request["discount_factor"] < 1):
+        raise ValueError("discount_factor must be in (0, 1)")
+    if(request["max_steps"] < 1):
+        raise ValueError("max_steps must be positive")
+
+    return request
+
+def parse_head(head):
+    """
+    Parses the request line and headers of an HTTP request
+
+    Params:
+        head: Bytes up to and including the blank line after the headers
+
+    Returns:
+        method, path: From the request line
+        headers: Dictionary of lower-case header name -> value
+        length: int Content-Length of the body (0 without the header)
+    """
+    lines = head.decode("latin-1").split("\r\n")
+    request_line = lines[0].split(" ")
+    if(len(request_line) != 3):
+        raise ValueError(f"malformed request line {lines[0]!r}")
+    method, path, _ = request_line
+
+    headers = {}
+    for line in lines[1:]:
+        if(":" in line):
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise ValueError(f"invalid content-length {headers['content-length']!r}") from None
+    if(length < 0):
+        raise ValueError(f"invalid content-length {length}")
+
+    return method, path, headers, length
+
+def format_result(state_space, utilities, policy, iterations, exec_time):
+    """
+    Converts compact solver output into the JSON response body
+
+    Params:
+        state_space: StateSpace of the solved maze
+        utilities: Final compact utility table
+        policy: Compact int8 policy
+        iterations: Number of iterations the solve took
+        exec_time: Time taken for the solve
+
+    Returns:
+        Dictionary with H x W "utilities" and "policy" (move names, null for non-floor cells)
+    """
+    policy_grid = state_space.scatter_policy(policy)
+    return {
+        "utilities": state_space.scatter(utilities).tolist(),
+        "policy": [[move.name if move is not None else None for move in row] for row in policy_grid],
+        "iterations": iterations,
+        "exec_time": exec_time,
+    }
+
+def solve_vi_batch(grids, discount_factor, threshold, max_steps):
+    """
+    Solves several mazes with one vectorized Value Iteration over the union of their state spaces
+      - Each maze keeps its own convergence check and is no longer swept once it has converged,
+        the loop stops once the slowest one has converged
+      - Same results as solving each maze alone with UtilityAgent.value_iteration: the last sweep of a maze only decides
+        that it is done, its utilities are the table that sweep started from and the policy is greedy w.r.t. them
+
+    Params:
+        grids: List of 2D maze grids
+        discount_factor: Gamma value shared by the whole batch
+        threshold: Convergence threshold shared by the whole batch
+        max_steps: Max. number of value iterations
+
+    Returns:
+        List of result dictionaries (see format_result), in the order of grids
+    """
+    start_time = time.time()
+    spaces = [StateSpace(Maze(grid)) for grid in grids]
+
+    # stack the compact spaces into one block-diagonal problem
+    offsets = np.cumsum([0] + [space.num_states for space in spaces])
+    next_states = np.concatenate([space.next_states + offset for space, offset in zip(spaces, offsets)])
+    rewards = np.concatenate([space.rewards for space in spaces])
+    decision = np.concatenate([np.arange(space.num_decision) + offset for space, offset in zip(spaces, offsets)])
+    owner = np.repeat(np.arange(len(spaces)), [space.num_decision for space in spaces])   # maze each decision state belongs to
+    probabilities = spaces[0].probabilities
+
+    u_table = rewards.copy()
+    iterations = np.zeros(len(spaces), dtype=int)
+    converged = np.array([space.num_decision == 0 for space in spaces])
+    iterations[converged] = 1
+
+    iteration = 0
+    swept = ~converged[owner]      # decision states of the mazes still being solved
+    while(not np.all(converged) and iteration < max_steps):
+        states = decision[swept]
+        next_utils = u_table[next_states[states]]
+        q_values = probabilities[0] * next_utils[..., 0]
+        for j in range(1, len(probabilities)):
+            q_values += probabilities[j] * next_utils[..., j]
+
+        new_utils = rewards[states] + discount_factor * q_values.max(axis=1)
+        deltas = np.zeros(len(spaces))
+        np.maximum.at(deltas, owner[swept], np.abs(new_utils - u_table[states]))
+
+        iteration += 1
+        newly_converged = ~converged & (deltas < threshold * (1 - discount_factor) / discount_factor)
+        finished = newly_converged if iteration < max_steps else ~converged
+        iterations[finished] = iteration
+        converged |= newly_converged
+
+        # finished mazes keep the table their last sweep started from, like the agent's u_table
+        update = ~finished[owner[swept]]
+        u_table[states[update]] = new_utils[update]
+        swept &= ~finished[owner]
+
+    exec_time = time.time() - start_time
+
+    results = []
+    for space, offset, steps in zip(spaces, offsets, iterations):
+        utilities = u_table[offset:offset + space.num_states]
+        policy = space.new_policy()     # greedy w.r.t. the table the last sweep started from
+        policy[:space.num_decision] = np.argmax(space.expected_utilities(utilities, slice(0, space.num_decision)), axis=1)
+        results.append(format_result(space, utilities, policy, int(steps), exec_time))
+
+    return results
+
+def solve_batch(grids, discount_factor, threshold, algorithm, max_steps):
+    """
+    Worker entry point, solves a batch of same-shape mazes sharing the same hyperparams
+
+    Returns:
+        List of result dictionaries (see format_result), in the order of grids
+    """
+    if(algorithm == "vi"):
+        return solve_vi_batch(grids, discount_factor, threshold, max_steps)
+
+    results = []
+    for grid in grids:
+        agent = UtilityAgent(Maze(grid), discount_factor=discount_factor, threshold=threshold)
+        utilities, _, exec_time = agent.policy_iteration(max_steps=max_steps)
+        results.append(format_result(agent.state_space, agent.u_table, agent.policy, len(utilities), exec_time))
+    return results
+
+def warm_up(_=None):
+    """
+    No-op run in every worker at startup so the interpreter + NumPy import cost is not paid by the first requests
+    """
+    return solve_vi_batch([[[MazeCell.FLOOR.value, MazeCell.GREEN.value]]], 0.99, 0.0001, 10) is not None
+
+class SolveService:
+    def __init__(self, workers=None, batch_window=0.005, max_batch=32):
+        """
+        Local HTTP/JSON service that solves mazes in a process pool
+          - Concurrent requests with the same grid shape and hyperparams are coalesced into one batched solve
+
+        Params:
+            workers: Number of worker processes, defaults to the CPU count
+            batch_window: Seconds to wait for more requests to join a batch
+            max_batch: Max. number of mazes per batch, a full batch is dispatched immediately
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+
+        self.pool = None
+        self.pending = {}   # batch key -> list of (grid, future)
+        self.stats = {"requests": 0, "batches": 0, "errors": 0}
+
+    def start_pool(self):
+        """
+        Starts the worker processes and waits until each has imported the solver modules
+        """
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        list(self.pool.map(warm_up, range(self.workers)))
+
+    async def solve(self, request):
+        """
+        Queues a validated request to be solved in the next batch with matching key
+
+        Returns:
+            Result dictionary (see format_result) plus the size of the batch it was solved in
+        """
+        grid = request["grid"]
+        key = (len(grid), len(grid[0]), request["discount_factor"], request["threshold"], request["algorithm"], request["max_steps"])
+        future = asyncio.get_running_loop().create_future()
+
+        batch = self.pending.setdefault(key, [])
+        batch.append((grid, future))
+        self.stats["requests"] += 1
+
+        if(len(batch) == 1):
+            asyncio.get_running_loop().call_later(self.batch_window, self.dispatch, key, batch)
+        if(len(batch) >= self.max_batch):
+            self.dispatch(key, batch)
+
+        return await future
+
+    def dispatch(self, key, batch):
+        """
+        Sends a batch to the process pool (no-op if the batch was already dispatched)
+        """
+        if(self.pending.get(key) is not batch):
+            return
+        del self.pending[key]
+        self.stats["batches"] += 1
+
+        _, _, discount_factor, threshold, algorithm, max_steps = key
+        grids = [grid for grid, _ in batch]
+        task = asyncio.get_running_loop().run_in_executor(self.pool, solve_batch, grids, discount_factor, threshold, algorithm, max_steps)
+        task.add_done_callback(lambda done: self.resolve(batch, done))
+
+    def resolve(self, batch, done):
+        """
+        Hands the results (or the error) of a finished batch back to the waiting requests
+        """
+        if(done.exception() is not None):
+            for _, future in batch:
+                if(not future.done()):
+                    future.set_exception(done.exception())
+            return
+
+        for (_, future), result in zip(batch, done.result()):
+            result["batch_size"] = len(batch)
+            if(not future.done()):
+                future.set_result(result)
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serves HTTP/1.1 requests (with keep-alive) on one client connection
+          - A malformed request head gets a 400 response and closes the connection (its body can't be skipped reliably)
+        """
+        try:
+            while(True):
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                try:
+                    method, path, headers, length = parse_head(head)
+                except ValueError as error:
+                    self.stats["errors"] += 1
+                    status, response, keep_alive = "400 Bad Request", {"error": str(error)}, False
+                else:
+                    body = await reader.readexactly(length)
+                    status, response = await self.route(method, path, body)
+                    keep_alive = headers.get("connection", "").lower() != "close"
+
+                data = json.dumps(response).encode()
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+
+                if(not keep_alive):
+                    break
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        """
+        Returns:
+            status: HTTP status line, e.g. "200 OK"
+            response: JSON serializable response body
+        """
+        if(method == "GET" and path == "/health"):
+            return "200 OK", {"status": "ok"}
+        if(method == "GET" and path == "/stats"):
+            return "200 OK", self.stats
+        if(method != "POST" or path != "/solve"):
+            return "404 Not Found", {"error": f"no route for {method} {path}"}
+
+        try:
+            request = validate_request(json.loads(body))
+        except (ValueError, TypeError, AttributeError) as error:
+            self.stats["errors"] += 1
+            return "400 Bad Request", {"error": str(error)}
+
+        try:
+            return "200 OK", await self.solve(request)
+        except Exception as error:
+            self.stats["errors"] += 1
+            return "500 Internal Server Error", {"error": str(error)}
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        """
+        Starts the process pool and serves requests until cancelled
+        """
+        self.start_pool()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Solve service listening on http://{host}:{port} with {self.workers} workers")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.pool.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description="Local HTTP/JSON maze solve service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=None, help="number of solver processes (default: CPU count)")
+    parser.add_argument("--batch-window", type=float, default=0.005, help="seconds to wait for requests to batch together")
+    parser.add_argument("--max-batch", type=int, default=32, help="max. number of mazes per batched solve")
+    args = parser.parse_args()
+
+    service = SolveService(workers=args.workers, batch_window=args.batch_window, max_batch=args.max_batch)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("Exiting!")
+
+
+if __name__ == "__main__":
+    main()
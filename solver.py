@@ -0,0 +1,830 @@
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from helper import Move
+from history import HistoryRecorder
+from profiler import NULL_PROFILER
+from state_space import StateSpace
+
+# outcome of a functional solve, every table is 1-D over the compact state index of the StateSpace
+#   - u_table: utilities the policy is greedy w.r.t. (the table the last sweep / loop started from)
+#   - u_prime_table: utilities after the last sweep / loop (the final utilities)
+#   - history: (iterations, height, width) ndarray or DeltaHistory, same entries as UtilityAgent returns
+SolveResult = namedtuple("SolveResult", ["u_table", "u_prime_table", "policy", "history", "iterations", "converged", "exec_time", "stats"])
+
+def compile_maze(maze, dtype=np.float64):
+    """
+    Compiles a maze into a read-only StateSpace that any number of concurrent solves can share without copies or locks
+
+    Params:
+        maze: Custom Maze type with helper functions to describe the cells present in the given maze
+        dtype: Float type of the rewards and transition probabilities
+
+    Returns:
+        state_space: Frozen StateSpace
+    """
+    return StateSpace(maze, dtype=dtype).freeze()
+
+def bellman_residual(state_space, u_table, discount_factor):
+    """
+    Finds the Bellman residual max|B(U)(s) - U(s)| of a compact utility table over the decision states
+    """
+    decision = slice(0, state_space.num_decision)
+    backup = state_space.rewards[decision] + discount_factor * state_space.expected_utilities(u_table, decision).max(axis=1, initial=-np.inf)
+    return float(np.max(np.abs(backup - u_table[decision]), initial=0))
+
+def error_bounds(state_space, u_table, u_prime_table, discount_factor):
+    """
+    Gets the Bellman-residual based quality guarantees of a solution (see UtilityAgent.add_error_bounds)
+
+    Returns:
+        Dictionary with "bellman_residual", "error_bound" and "policy_loss_bound"
+    """
+    residual = bellman_residual(state_space, u_prime_table, discount_factor)
+    return {
+        "bellman_residual": residual,
+        "error_bound": residual / (1 - discount_factor),
+        "policy_loss_bound": 2 * discount_factor * bellman_residual(state_space, u_table, discount_factor) / (1 - discount_factor),
+    }
+
+# action elimination only tests the bounds again once the residual fell to this fraction of the last tested one,
+# the bounds shrink with the residual so testing every sweep mostly repeats the last test
+ELIMINATION_RATIO = 0.5
+
+# lightweight per-sweep view handed out by the iterator solvers
+SweepSnapshot = namedtuple("SweepSnapshot", ["iteration", "delta", "changed", "utilities", "done"])
+
+class SolveTables:
+    def __init__(self, state_space, u_table=None, u_prime_table=None, policy=None, frontier=None, propagated=None):
+        """
+        Mutable tables of one solve, the iterators below only ever write to the tables object they are handed
+          - value_iteration / policy_iteration create a fresh one per call, UtilityAgent hands over itself (same attributes)
+
+        Params:
+            state_space: Compiled maze (see compile_maze)
+            u_table, u_prime_table, policy: State to continue from (copied), defaults to a fresh solve
+            frontier, propagated: Incremental PI state to continue from when resuming (see iter_policy_iteration)
+        """
+        self.u_table = np.zeros(state_space.num_states, dtype=state_space.dtype) if u_table is None else np.array(u_table, dtype=state_space.dtype)
+        self.u_prime_table = state_space.rewards.copy() if u_prime_table is None else np.array(u_prime_table, dtype=state_space.dtype)
+        self.policy = state_space.new_policy() if policy is None else np.array(policy, dtype=np.int8)
+        self.active_actions = None      # (num_decision, len(Move)) mask of actions not yet eliminated (only used with action elimination)
+        self.frontier = None if frontier is None else np.array(frontier, dtype=np.intp)     # states incremental PI evaluates next
+        self.propagated = None if propagated is None else np.array(propagated, dtype=state_space.dtype)
+        self.stats = {}
+
+def read_only_view(table):
+    """
+    Gets a read-only view of a compact table, handed out to callers of the iterator solvers without copying
+    """
+    view = table.view()
+    view.flags.writeable = False
+    return view
+
+def greedy_q_values(state_space, tables):
+    """
+    Gets the expected utilities the policy is picked from: w.r.t. tables.u_table, without the eliminated actions
+    """
+    q_values = state_space.expected_utilities(tables.u_table, slice(0, state_space.num_decision))
+    if(tables.active_actions is not None):
+        q_values[~tables.active_actions] = -np.inf      # only pick from the actions not eliminated
+    return q_values
+
+def init_action_pairs(state_space):
+    """
+    Sets up action elimination: every (state, action) pair of the decision states starts out active, the per-state
+    bounds on the optimal utility U* start out unbounded (exact for the reward / punishment cells)
+
+    Returns:
+        Dictionary carried between sweeps with the active pairs ("states", "actions", "flat" index into the
+        (num_decision, len(Move)) Q table and their (P, 3) "next_states"), plus the "lower" / "upper" bounds on U*
+    """
+    space = state_space
+    states, actions = np.divmod(np.arange(space.num_decision * len(Move)), len(Move))
+    lower, upper = space.rewards.copy(), space.rewards.copy()
+    lower[:space.num_decision] = -np.inf
+    upper[:space.num_decision] = np.inf
+
+    return {"states": states, "actions": actions, "flat": states * len(Move) + actions, "next_states": space.next_states[states, actions],
+            "lower": lower, "upper": upper, "tested_delta": np.inf}
+
+def best_actions(q_values):
+    """
+    Gets the row-wise max and argmax of a (n, len(Move)) Q table, taken column by column
+    (numpy's reductions along a 4 wide axis cost more than the whole pruned sweep)
+
+    Returns:
+        best_values: ndarray of the max expected utility of each row
+        best_moves: int8 ndarray of the first action reaching it, same as np.argmax
+    """
+    best_values = q_values[:, 0].copy()
+    for action in range(1, q_values.shape[1]):
+        np.maximum(best_values, q_values[:, action], out=best_values)
+
+    best_moves = np.full(len(q_values), q_values.shape[1] - 1, dtype=np.int8)
+    for action in range(q_values.shape[1] - 2, -1, -1):
+        best_moves[q_values[:, action] == best_values] = action
+    return best_values, best_moves
+
+def pruned_sweep(state_space, tables, pairs, discount_factor):
+    """
+    One plain VI sweep that only computes the expected utilities of the active (state, action) pairs
+
+    Params:
+        state_space: Compiled maze (see compile_maze)
+        tables: Tables of the solve
+        pairs: Dictionary from init_action_pairs
+        discount_factor: Gamma value of the solve
+
+    Returns:
+        q_values: (num_decision, len(Move)) expected utilities w.r.t. u_table, -inf for the eliminated actions
+        pair_values: Expected utilities of the active pairs (same order as pairs["states"])
+        best_values, best_moves: Max expected utility and greedy action of each decision state (see best_actions)
+    """
+    space = state_space
+    decision = slice(0, space.num_decision)
+
+    pair_values = space.outcome_expectation(tables.u_table, pairs["next_states"])
+    q_values = np.full((space.num_decision, len(Move)), -np.inf, dtype=pair_values.dtype)
+    q_values.ravel()[pairs["flat"]] = pair_values
+    best_values, best_moves = best_actions(q_values)
+    tables.u_prime_table[decision] = space.rewards[decision] + discount_factor * best_values
+
+    tables.stats["backups"] += space.num_decision
+    tables.stats["q_evaluations"] += len(pair_values)
+    return q_values, pair_values, best_values, best_moves
+
+def eliminate_actions(state_space, tables, pairs, pair_values, best_values, discount_factor):
+    """
+    Tightens the per-state bounds on the optimal utility after a sweep and permanently drops the (state, action) pairs
+    that provably can't be optimal
+      - With c = U' - U the change over the sweep, U' + y * min(c, 0) / (1 - y) <= U* <= U' + y * max(c, 0) / (1 - y)
+        holds on the decision states (MacQueen's bounds), each state keeps the tightest bounds seen so far
+      - The best action of s has EU*(s, a*) = (U*(s) - R(s)) / y >= (lower(s) - R(s)) / y, while any action has
+        EU*(s, a) <= sum(P(s' | s, a) * upper(s')). An action whose upper bound falls below that lower bound is dropped,
+        the greedy action of each state is always kept
+      - Only the pairs that can pass the test judging by the smallest gap between upper and u_table get their upper bound computed
+
+    Params:
+        state_space: Compiled maze (see compile_maze)
+        tables: Tables of the solve, tables.active_actions is updated
+        pairs: Dictionary from init_action_pairs, compacted in place
+        pair_values: Expected utilities of the active pairs from the last sweep
+        best_values: Max expected utility of each decision state from the last sweep
+        discount_factor: Gamma value of the solve
+    """
+    space = state_space
+    decision = slice(0, space.num_decision)
+    scale = discount_factor / (1 - discount_factor)
+
+    change = tables.u_prime_table[decision] - tables.u_table[decision]
+    lower, upper = pairs["lower"][decision], pairs["upper"][decision]
+    np.maximum(lower, tables.u_prime_table[decision] + scale * float(change.min(initial=0)), out=lower)     # min(c, 0)
+    np.minimum(upper, tables.u_prime_table[decision] + scale * float(change.max(initial=0)), out=upper)     # max(c, 0)
+
+    # sum(P * upper(s')) >= EU(s, a) + min(upper - u_table), so most pairs are ruled out without another gather
+    best_lower = ((lower - space.rewards[decision]) / discount_factor)[pairs["states"]]
+    min_gap = float(np.min(pairs["upper"] - tables.u_table, initial=np.inf))
+    candidates = np.flatnonzero(pair_values + min_gap < best_lower)
+    if(len(candidates) == 0):
+        return
+
+    upper_values = space.outcome_expectation(pairs["upper"], pairs["next_states"][candidates])
+    greedy = pair_values[candidates] == best_values[pairs["states"][candidates]]
+    drop = candidates[(upper_values < best_lower[candidates]) & ~greedy]
+    if(len(drop) == 0):
+        return
+
+    tables.active_actions[pairs["states"][drop], pairs["actions"][drop]] = False
+    keep = np.ones(len(pair_values), dtype=bool)
+    keep[drop] = False
+    for key in ("states", "actions", "flat", "next_states"):
+        pairs[key] = pairs[key][keep]
+
+def relaxed_sweep(state_space, tables, colors, omega, discount_factor):
+    """
+    One successive over-relaxation (SOR) sweep in red-black order, in place on tables.u_prime_table
+      - Red states are backed up first, the black ones then already see the new red utilities (Gauss-Seidel)
+      - Each utility moves omega times its Bellman update, omega > 1 overshoots along the direction of convergence
+
+    Params:
+        state_space: Compiled maze (see compile_maze)
+        tables: Tables of the solve
+        colors: [red, black] compact indices of the decision states, no two neighbours share a color
+        omega: Relaxation factor, 1 for plain Gauss-Seidel backups
+        discount_factor: Gamma value of the solve
+
+    Returns:
+        q_values: (num_decision, len(Move)) expected utilities seen by each backup
+        residual: Max. abs. Bellman update over the sweep (before relaxation)
+    """
+    space = state_space
+    q_values = np.empty((space.num_decision, len(Move)), dtype=space.dtype)
+    residual = 0.0
+    for states in colors:
+        q_values[states] = space.expected_utilities(tables.u_prime_table, states)
+        update = space.rewards[states] + discount_factor * q_values[states].max(axis=1, initial=-np.inf) - tables.u_prime_table[states]
+        tables.u_prime_table[states] += omega * update
+        residual = max(residual, float(np.max(np.abs(update), initial=0)))
+
+    tables.stats["backups"] += space.num_decision
+    tables.stats["q_evaluations"] += q_values.size
+    return q_values, residual
+
+def anderson_sweep(state_space, tables, mixing, memory, epsilon, discount_factor):
+    """
+    One Anderson-accelerated sweep: tables.u_prime_table becomes the combination of the last memory + 1 Bellman updates
+    that minimizes the (linearized) residual, instead of just the latest update
+      - Safeguard: if the residual grew since the last accelerated step, that step is thrown away and the
+        plain update of the previous iterate is used instead (costs one more backup), the memory is cleared
+
+    Params:
+        state_space: Compiled maze (see compile_maze)
+        tables: Tables of the solve
+        mixing: Dictionary carried between sweeps with the past updates "g", residuals "f", the last "residual" and
+                whether the current u_table came from an "accelerated" step
+        memory: Number of past iterates mixed
+        epsilon: Convergence residual, the final step is always a plain update
+        discount_factor: Gamma value of the solve
+
+    Returns:
+        q_values: (num_decision, len(Move)) expected utilities at the current u_table
+        residual: Max. abs. Bellman residual of the current u_table
+    """
+    space = state_space
+    decision = slice(0, space.num_decision)
+
+    def bellman_update():
+        q_values = space.expected_utilities(tables.u_table, decision)
+        update = space.rewards[decision] + discount_factor * q_values.max(axis=1, initial=-np.inf)
+        tables.stats["backups"] += space.num_decision
+        tables.stats["q_evaluations"] += q_values.size
+        return q_values, update, update - tables.u_table[decision]
+
+    q_values, update, difference = bellman_update()
+    residual = float(np.max(np.abs(difference), initial=0))
+    if(mixing["accelerated"] and residual > mixing["residual"]):
+        tables.u_table[decision] = mixing["g"][-1]
+        mixing["g"], mixing["f"] = [], []
+        q_values, update, difference = bellman_update()
+        residual = float(np.max(np.abs(difference), initial=0))
+        tables.stats["fallbacks"] += 1
+
+    mixing["g"] = (mixing["g"] + [update.astype(np.float64)])[-(memory + 1):]
+    mixing["f"] = (mixing["f"] + [difference.astype(np.float64)])[-(memory + 1):]
+    mixing["residual"] = residual
+    mixing["accelerated"] = len(mixing["g"]) > 1 and residual >= epsilon
+
+    if(mixing["accelerated"]):
+        delta_f = np.diff(np.stack(mixing["f"], axis=1), axis=1)
+        delta_g = np.diff(np.stack(mixing["g"], axis=1), axis=1)
+        weights = np.linalg.lstsq(delta_f, mixing["f"][-1], rcond=None)[0]
+        tables.u_prime_table[decision] = update - delta_g @ weights
+    else:
+        tables.u_prime_table[decision] = update
+
+    return q_values, residual
+
+def iter_value_iteration(state_space, tables, discount_factor=0.99, threshold=0.0001, max_steps=1, action_elimination=False, acceleration=None,
+                         relaxation=1.2, memory=5, start_iteration=0, profiler=None):
+    """
+    Performs Value Iteration on the given tables one sweep at a time, yielding a SweepSnapshot after every sweep
+    (the one loop every VI solve runs, UtilityAgent and value_iteration just drive it)
+      - The caller may stop iterating at any point, the policy is calculated from the latest utilities once the loop ends
+      - snapshot.changed counts the states whose greedy action changed in the sweep
+      - snapshot.utilities is a read-only view of the updated compact utility table, it is overwritten by the next sweep
+      - With action elimination, actions that are provably suboptimal (see eliminate_actions) are dropped from all later sweeps:
+        a sweep only computes the expected utilities of the active (state, action) pairs, their number per sweep is
+        stored in stats["active_pairs"]
+      - stats["backups"] counts the single-state Bellman backups, stats["q_evaluations"] the expected utilities EU(s, a) computed
+      - stats["deltas"] holds the max. utility change of every sweep (the convergence curve, whatever the history stride)
+      - With an acceleration ("sor" or "anderson", see relaxed_sweep / anderson_sweep) delta is the residual of the sweep,
+        and stats["fallbacks"] counts how often the safeguard stepped back towards plain backups because the residual grew
+        (SOR halves its over-relaxation, Anderson discards the mixed step)
+
+    Params:
+        state_space: Compiled maze (see compile_maze)
+        tables: SolveTables (or UtilityAgent) to solve in place, its stats are replaced
+        discount_factor: Gamma value to reduce the "importance" of future state utilities
+        threshold: Threshold to check for convergence
+        max_steps: int, controls the maximum number of value iterations
+        action_elimination: Bool to enable pruning of suboptimal actions using upper/lower utility bounds
+        acceleration: None for plain sweeps, "sor" or "anderson"
+        relaxation: Relaxation factor of SOR (1 is plain Gauss-Seidel)
+        memory: Number of past iterates mixed by Anderson acceleration
+        start_iteration: Number of sweeps already done (when resuming from a checkpoint), counted towards max_steps
+        profiler: Optional profiler.SolveProfiler the phases are measured with
+
+    Yields:
+        SweepSnapshot(iteration, delta, changed, utilities, done)
+    """
+    if(acceleration not in (None, "sor", "anderson")):
+        raise ValueError(f"Unknown acceleration {acceleration!r}, expected None, 'sor' or 'anderson'")
+    if(acceleration is not None and action_elimination):
+        raise ValueError("Action elimination relies on plain VI sweeps and can't be combined with an acceleration")
+
+    space = state_space
+    profile = NULL_PROFILER if profiler is None else profiler
+    decision = slice(0, space.num_decision)     # decision states come first in the compact index
+    epsilon = threshold * (1 - discount_factor) / discount_factor
+
+    iteration = start_iteration
+    tables.stats = {"backups": 0, "q_evaluations": 0}     # number of single-state Bellman backups / EU(s, a) computed
+    tables.stats["deltas"] = []
+    if(acceleration is not None):
+        tables.stats["fallbacks"] = 0
+        parity = (space.rows[decision] + space.cols[decision]) % 2
+        colors = [np.flatnonzero(parity == 0), np.flatnonzero(parity == 1)]    # neighbours always have the other color
+        mixing = {"residual": np.inf, "omega": relaxation, "accelerated": False, "g": [], "f": []}
+    if(action_elimination):
+        tables.active_actions = np.ones((space.num_decision, len(Move)), dtype=bool)
+        tables.stats["active_pairs"] = []
+        pairs = init_action_pairs(space)
+    else:
+        tables.active_actions = None
+    greedy_moves = tables.policy[decision].copy()
+    q_values = None     # expected utilities w.r.t. u_table of the last plain sweep, reused for the policy
+
+    try:
+        while(True):
+            with profile.phase("evaluation"):
+                tables.u_table = tables.u_prime_table.copy()    # assign u_table as a copy of u_prime_table
+
+                if(acceleration == "sor"):
+                    sweep_q_values, delta = relaxed_sweep(space, tables, colors, mixing["omega"], discount_factor)
+                    if(delta > mixing["residual"]):
+                        # residual grew: halve the over-relaxation, falling back towards plain Gauss-Seidel backups
+                        mixing["omega"] = 1 + (mixing["omega"] - 1) / 2
+                        tables.stats["fallbacks"] += 1
+                    mixing["residual"] = delta
+                elif(acceleration == "anderson"):
+                    sweep_q_values, delta = anderson_sweep(space, tables, mixing, memory, epsilon, discount_factor)
+                else:
+                    # for each state s in S, R(s) + y * max(EU(s') for all s')
+                    if(action_elimination):
+                        q_values, pair_values, best_values, new_greedy_moves = pruned_sweep(space, tables, pairs, discount_factor)
+                    else:
+                        q_values = space.expected_utilities(tables.u_table, decision)
+                        tables.u_prime_table[decision] = space.rewards[decision] + discount_factor * q_values.max(axis=1, initial=-np.inf)
+                        tables.stats["backups"] += space.num_decision
+                        tables.stats["q_evaluations"] += q_values.size
+                    sweep_q_values = q_values
+                    delta = float(np.max(np.abs(tables.u_prime_table[decision] - tables.u_table[decision]), initial=0))     # max difference in updated values
+
+                if(not action_elimination):
+                    new_greedy_moves = np.argmax(sweep_q_values, axis=1).astype(np.int8)
+                changed = int(np.count_nonzero(new_greedy_moves != greedy_moves))
+                greedy_moves = new_greedy_moves
+
+            iteration += 1
+            tables.stats["iterations"] = iteration
+            tables.stats["deltas"].append(delta)
+
+            if(action_elimination):
+                with profile.phase("improvement"):
+                    tables.stats["active_pairs"].append(len(pair_values))
+                    if(delta <= ELIMINATION_RATIO * pairs["tested_delta"]):
+                        pairs["tested_delta"] = delta
+                        eliminate_actions(space, tables, pairs, pair_values, best_values, discount_factor)
+
+            done = delta < epsilon or iteration == max_steps
+            yield SweepSnapshot(iteration, delta, changed, read_only_view(tables.u_prime_table), done)
+
+            if(done):
+                break
+    finally:
+        # calculate actual policy using new utilities (also when the caller stops early), the plain sweeps already
+        # computed the expected utilities w.r.t. u_table (eliminated actions can never be the argmax)
+        with profile.phase("policy_extraction"):
+            if(q_values is None or acceleration is not None):
+                q_values = greedy_q_values(space, tables)
+            tables.policy[decision] = np.argmax(q_values, axis=1)
+
+def iter_policy_iteration(state_space, tables, discount_factor=0.99, threshold=0.0001, max_steps=1, incremental=False, start_iteration=0, profiler=None):
+    """
+    Performs Policy Iteration on the given tables one loop at a time, yielding a SweepSnapshot after every loop
+    (the one loop every PI solve runs, UtilityAgent and policy_iteration just drive it)
+      - The caller may stop iterating at any point, u_table and policy are always left in a consistent state
+      - snapshot.utilities is a read-only view of the updated compact utility table, it is overwritten by the next loop
+      - In incremental mode only the "dirty" frontier is evaluated and improved: states whose action changed plus the
+        predecessors of states whose utility moved by more than the VI stopping tolerance threshold * (1 - y) / y since
+        it was last propagated. The utilities every other state was evaluated with are within that tolerance of the
+        current ones, so the results match the full loop up to the tolerance (a near-tie may pick another action).
+        The next frontier and the propagated utilities are kept in tables.frontier / tables.propagated, so a solve resumed
+        from a checkpoint continues with the same frontier
+      - stats["touched_states"] holds the number of states evaluated + improved in every loop, stats["backups"] their total
+        (every decision state on every loop without incremental), stats["deltas"] the max. utility change of every loop
+
+    Params:
+        state_space: Compiled maze (see compile_maze)
+        tables: SolveTables (or UtilityAgent) to solve in place, its stats are replaced
+        discount_factor: Gamma value to reduce the "importance" of future state utilities
+        threshold: Sets the tolerance of the incremental mode (unused by the full loop, which stops once the policy is stable)
+        max_steps: int, controls the maximum number of policy iterations
+        incremental: Bool to only re-evaluate / re-improve the states affected by the last loop
+        start_iteration: Number of loops already done (when resuming from a checkpoint), counted towards max_steps
+        profiler: Optional profiler.SolveProfiler the phases are measured with
+
+    Yields:
+        SweepSnapshot(iteration, delta, changed, utilities, done)
+    """
+    space = state_space
+    profile = NULL_PROFILER if profiler is None else profiler
+    tolerance = threshold * (1 - discount_factor) / discount_factor
+
+    iteration = start_iteration
+    tables.stats = {"policy_changes": [], "touched_states": [], "backups": 0, "deltas": []}
+    tables.active_actions = None
+
+    if(incremental and start_iteration > 0 and tables.frontier is not None):
+        frontier = tables.frontier      # continue the frontier of the solve the checkpoint was taken of
+    else:
+        frontier = np.arange(space.num_decision)      # states to evaluate + improve in the current loop, the first loop is a full one
+        tables.frontier, tables.propagated = None, None
+    while(True):
+        # Policy evaluation (using cur policy, eval utilities)
+        with profile.phase("evaluation"):
+            tables.u_table = tables.u_prime_table.copy()    # assign u_table as a copy of u_prime_table
+            if(incremental and tables.propagated is None):
+                tables.propagated = tables.u_table.copy()      # utilities the predecessors were last evaluated with
+
+            q_values = space.expected_utilities(tables.u_table, frontier)
+            cur_moves = tables.policy[frontier]
+            tables.u_prime_table[frontier] = space.rewards[frontier] + discount_factor * q_values[np.arange(len(frontier)), cur_moves]
+            delta = float(np.max(np.abs(tables.u_prime_table[frontier] - tables.u_table[frontier]), initial=0))
+
+        # Policy improvement (both steps use the same u_table, so the expected utilities are shared)
+        with profile.phase("improvement"):
+            best_moves = np.argmax(q_values, axis=1).astype(np.int8)
+            action_changed = frontier[best_moves != cur_moves]      # states where a more optimal move has been found
+            tables.policy[frontier] = best_moves
+
+            if(incremental):
+                # next frontier: the changed actions + the predecessors of utilities that moved by more than the tolerance
+                value_changed = frontier[np.abs(tables.u_prime_table[frontier] - tables.propagated[frontier]) > tolerance]
+                tables.propagated[value_changed] = tables.u_prime_table[value_changed]
+                dirty = space.predecessor_mask(value_changed)
+                dirty[action_changed] = True
+                tables.frontier = np.flatnonzero(dirty)
+
+        changed = len(action_changed)
+        tables.stats["policy_changes"].append(changed)
+        tables.stats["touched_states"].append(len(frontier))
+        tables.stats["backups"] += len(frontier)
+        tables.stats["deltas"].append(delta)
+
+        iteration += 1
+        tables.stats["iterations"] = iteration
+
+        done = changed == 0 or iteration == max_steps
+        yield SweepSnapshot(iteration, delta, changed, read_only_view(tables.u_prime_table), done)
+
+        if(done):
+            break
+        if(incremental):
+            frontier = tables.frontier
+
+def state_components(state_space):
+    """
+    Finds the strongly connected components of the graph between decision states (iterative Tarjan's algorithm)
+      - There is an edge s -> s' whenever some move from s can land in s'
+      - Reward / punishment cells keep fixed utilities so they are left out of the graph
+
+    Returns:
+        components: List of components (int arrays of state indices) in reverse topological order, i.e. successors come first
+    """
+    num_decision = state_space.num_decision
+    successors = []
+    for stateIdx in range(num_decision):
+        next_states = np.unique(state_space.next_states[stateIdx])
+        successors.append([int(nextIdx) for nextIdx in next_states if nextIdx != stateIdx and nextIdx < num_decision])
+
+    index = [-1] * num_decision     # order in which each state was discovered
+    low_link = [0] * num_decision
+    on_stack = [False] * num_decision
+    stack = []
+    components = []
+    discovered = -1
+
+    for root in range(num_decision):
+        if(index[root] != -1):
+            continue
+
+        work = [(root, iter(successors[root]))]    # explicit DFS stack, avoids recursion limits on big mazes
+        discovered += 1
+        index[root] = low_link[root] = discovered
+        stack.append(root)
+        on_stack[root] = True
+
+        while(work):
+            state, children = work[-1]
+            for child in children:
+                if(index[child] == -1):
+                    discovered += 1
+                    index[child] = low_link[child] = discovered
+                    stack.append(child)
+                    on_stack[child] = True
+                    work.append((child, iter(successors[child])))
+                    break
+                elif(on_stack[child]):
+                    low_link[state] = min(low_link[state], index[child])
+            else:
+                work.pop()
+                if(work):
+                    parent = work[-1][0]
+                    low_link[parent] = min(low_link[parent], low_link[state])
+
+                if(low_link[state] == index[state]):   # state is the root of a component
+                    component = []
+                    while(True):
+                        member = stack.pop()
+                        on_stack[member] = False
+                        component.append(member)
+                        if(member == state):
+                            break
+                    components.append(np.array(component, dtype=np.intp))
+
+    return components
+
+def iter_decomposed_value_iteration(state_space, tables, discount_factor=0.99, threshold=0.0001, max_steps=1, profiler=None):
+    """
+    Performs Value Iteration one strongly connected component of the state graph at a time (see state_components),
+    yielding a SweepSnapshot after every sweep of a component (UtilityAgent and decomposed_value_iteration just drive it)
+      - Components are solved in reverse topological order, so every state a component can reach is already converged
+      - Each component runs its own sweep loop until convergence, which avoids re-sweeping converged regions of fragmented mazes,
+        max_steps caps the sweeps of every single component
+      - The sweeps update u_table in place, snapshot.utilities is a read-only view of it and snapshot.changed counts the
+        states of the component whose greedy action changed in the sweep
+      - The caller may stop iterating at any point, u_prime_table and the policy are set from the latest utilities once the loop ends
+      - stats["component_sweeps"] gets the number of sweeps of every finished component, stats["unconverged"] counts the
+        components stopped by max_steps, stats["deltas"] holds the max. utility change of every sweep
+
+    Params:
+        state_space: Compiled maze (see compile_maze)
+        tables: SolveTables (or UtilityAgent) to solve in place, its stats are replaced
+        discount_factor: Gamma value to reduce the "importance" of future state utilities
+        threshold: Threshold to check for convergence
+        max_steps: int, controls the maximum number of value iterations per component
+        profiler: Optional profiler.SolveProfiler the phases are measured with
+
+    Yields:
+        SweepSnapshot(iteration, delta, changed, utilities, done), iteration counts the sweeps over all components
+    """
+    space = state_space
+    profile = NULL_PROFILER if profiler is None else profiler
+    decision = slice(0, space.num_decision)
+    epsilon = threshold * (1 - discount_factor) / discount_factor
+
+    with profile.phase("init"):
+        components = state_components(space)
+    tables.stats = {"components": len(components), "sweeps": 0, "backups": 0, "unconverged": 0}    # backups: single-state Bellman backups
+    tables.stats["component_sweeps"] = []
+    tables.stats["deltas"] = []
+    tables.active_actions = None
+    tables.u_table = tables.u_prime_table.copy()
+    greedy_moves = tables.policy[decision].copy()
+
+    try:
+        for componentIdx, component in enumerate(components):
+            iteration = 0
+            while(True):
+                with profile.phase("evaluation"):
+                    q_values = space.expected_utilities(tables.u_table, component)
+                    new_utils = space.rewards[component] + discount_factor * q_values.max(axis=1)
+                    delta = float(np.max(np.abs(new_utils - tables.u_table[component])))   # max difference in updated values
+                    tables.u_table[component] = new_utils
+
+                    new_greedy_moves = np.argmax(q_values, axis=1).astype(np.int8)
+                    changed = int(np.count_nonzero(new_greedy_moves != greedy_moves[component]))
+                    greedy_moves[component] = new_greedy_moves
+
+                iteration += 1
+                tables.stats["sweeps"] += 1
+                tables.stats["backups"] += len(component)
+                tables.stats["deltas"].append(delta)
+
+                finished = delta < epsilon or iteration == max_steps
+                if(finished):
+                    tables.stats["component_sweeps"].append(iteration)
+                    if(delta >= epsilon):
+                        tables.stats["unconverged"] += 1
+
+                done = finished and componentIdx == len(components) - 1
+                yield SweepSnapshot(tables.stats["sweeps"], delta, changed, read_only_view(tables.u_table), done)
+
+                if(finished):
+                    break
+    finally:
+        # calculate actual policy using new utilities (also when the caller stops early)
+        with profile.phase("policy_extraction"):
+            tables.u_prime_table = tables.u_table.copy()
+            tables.policy[decision] = np.argmax(greedy_q_values(space, tables), axis=1)
+
+def run_sweeps(sweeps, tables, history, record, deadline=None, on_sweep=None, profiler=None):
+    """
+    Drives an iterator solver: records the table every sweep / loop ends with (except the last one), then hands the
+    sweep to on_sweep and checks the deadline
+      - The iterator is always closed before returning, which extracts the VI policy
+
+    Params:
+        sweeps: Generator from iter_value_iteration / iter_policy_iteration
+        tables: Tables the generator works on
+        history: HistoryRecorder of the solve
+        record: Name of the table kept in the history, "u_prime_table" (VI) or "u_table" (PI, the table a loop starts from)
+        deadline: Wall-clock budget in seconds, None to only stop on convergence / max_steps
+        on_sweep: Optional callback(snapshot, tables, history), e.g. to checkpoint the solve
+        profiler: Optional profiler.SolveProfiler the history is measured with
+
+    Returns:
+        snapshot: SweepSnapshot of the last sweep / loop
+        deadline_hit: Bool, whether the deadline cut the solve short
+    """
+    profile = NULL_PROFILER if profiler is None else profiler
+    start_time = time.time()
+
+    snapshot, deadline_hit = None, False
+    try:
+        for snapshot in sweeps:
+            if(snapshot.done):
+                break
+            with profile.phase("history"):
+                history.append(getattr(tables, record))
+
+            if(on_sweep is not None):
+                on_sweep(snapshot, tables, history)
+            if(deadline is not None and time.time() - start_time >= deadline):
+                deadline_hit = True
+                break
+    finally:
+        sweeps.close()
+
+    return snapshot, deadline_hit
+
+def finish_solve(state_space, tables, history, snapshot, converged, deadline_hit, discount_factor, start_time, profiler):
+    """
+    Adds the error bounds to the stats of a driven solve and packs it into a SolveResult
+    """
+    with (NULL_PROFILER if profiler is None else profiler).phase("policy_extraction"):
+        tables.stats["deadline_hit"] = deadline_hit
+        tables.stats.update(error_bounds(state_space, tables.u_table, tables.u_prime_table, discount_factor))
+    with (NULL_PROFILER if profiler is None else profiler).phase("history"):
+        utilities = history.to_array()
+
+    exec_time = time.time() - start_time
+    if(profiler is not None):
+        tables.stats["profile"] = profiler.stop()
+
+    return SolveResult(tables.u_table, tables.u_prime_table, tables.policy, utilities, snapshot.iteration, converged, exec_time, tables.stats)
+
+def value_iteration(state_space, discount_factor=0.99, threshold=0.0001, max_steps=1, history_stride=1, history_tolerance=None, u_prime_table=None,
+                    policy=None, action_elimination=False, acceleration=None, relaxation=1.2, memory=5, deadline=None, history=None, start_iteration=0,
+                    on_sweep=None, profiler=None):
+    """
+    Value Iteration as a pure function: nothing but locally created arrays is written to, so it is safe to run
+    concurrently on one shared (frozen) StateSpace, e.g. from a thread pool
+      - Drives iter_value_iteration, see there for the action elimination / acceleration modes
+      - With a deadline, the best policy found so far is returned once the time is up (see error_bounds for the guarantees)
+
+    Params:
+        state_space: Compiled maze (see compile_maze)
+        discount_factor: Gamma value to reduce the "importance" of future state utilities
+        threshold: Threshold to check for convergence
+        max_steps: int, controls the maximum number of value iterations
+        history_stride: Only keep every n-th utility table in the returned history
+        history_tolerance: None to return the history as an ndarray, else a DeltaHistory with this max. abs. error (0 for lossless)
+        u_prime_table: Utilities to continue from (copied, never written), defaults to R(s) for a fresh solve
+        policy: Greedy policy of u_prime_table (copied), only used to count the changed actions of the first sweep
+        action_elimination: Bool to enable pruning of suboptimal actions using upper/lower utility bounds
+        acceleration: None for plain sweeps, "sor" (successive over-relaxation) or "anderson" (Anderson mixing)
+        relaxation: Relaxation factor of SOR
+        memory: Number of past iterates mixed by Anderson acceleration
+        deadline: Wall-clock budget in seconds, None to only stop on convergence / max_steps
+        history: HistoryRecorder to continue (when resuming from a checkpoint), None to start one with u_prime_table
+        start_iteration: Number of sweeps already done, counted towards max_steps
+        on_sweep: Optional callback(snapshot, tables, history) after every sweep that does not end the solve
+        profiler: Optional profiler.SolveProfiler, its stats are returned as stats["profile"]
+
+    Returns:
+        SolveResult
+    """
+    space = state_space
+    if(profiler is not None):
+        profiler.start()
+    start_time = time.time()
+
+    with (NULL_PROFILER if profiler is None else profiler).phase("init"):
+        tables = SolveTables(space, u_prime_table=u_prime_table, policy=policy)
+        if(history is None):
+            history = HistoryRecorder(space, stride=history_stride, tolerance=history_tolerance)
+            history.append(tables.u_prime_table)
+
+    sweeps = iter_value_iteration(space, tables, discount_factor, threshold, max_steps, action_elimination, acceleration, relaxation, memory,
+                                  start_iteration, profiler)
+    snapshot, deadline_hit = run_sweeps(sweeps, tables, history, "u_prime_table", deadline, on_sweep, profiler)
+    converged = snapshot.delta < threshold * (1 - discount_factor) / discount_factor
+
+    return finish_solve(space, tables, history, snapshot, converged, deadline_hit, discount_factor, start_time, profiler)
+
+def policy_iteration(state_space, discount_factor=0.99, threshold=0.0001, max_steps=1, history_stride=1, history_tolerance=None, incremental=False,
+                     u_table=None, u_prime_table=None, policy=None, deadline=None, history=None, start_iteration=0, on_sweep=None, profiler=None,
+                     frontier=None, propagated=None):
+    """
+    Policy Iteration as a pure function (see value_iteration for the thread safety)
+      - Drives iter_policy_iteration, see there for the incremental mode
+      - With a deadline, the best policy found so far is returned once the time is up (see error_bounds for the guarantees)
+
+    Params:
+        state_space: Compiled maze (see compile_maze)
+        discount_factor: Gamma value to reduce the "importance" of future state utilities
+        threshold: Sets the tolerance of the incremental mode (see iter_policy_iteration), unused by the full loop
+        max_steps: int, controls the maximum number of policy iterations
+        history_stride: Only keep every n-th utility table in the returned history
+        history_tolerance: None to return the history as an ndarray, else a DeltaHistory with this max. abs. error (0 for lossless)
+        incremental: Bool to only re-evaluate / re-improve the states affected by the last loop
+        u_table, u_prime_table, policy: State to continue from (copied, never written), defaults to a fresh solve
+        deadline: Wall-clock budget in seconds, None to only stop on convergence / max_steps
+        history: HistoryRecorder to continue (when resuming from a checkpoint), None to start one with u_table
+        start_iteration: Number of loops already done, counted towards max_steps
+        on_sweep: Optional callback(snapshot, tables, history) after every loop that does not end the solve
+        profiler: Optional profiler.SolveProfiler, its stats are returned as stats["profile"]
+        frontier, propagated: Incremental state of the solve a checkpoint was taken of (see iter_policy_iteration)
+
+    Returns:
+        SolveResult
+    """
+    space = state_space
+    if(profiler is not None):
+        profiler.start()
+    start_time = time.time()
+
+    # each entry is the u_table a loop starts from, the evaluated utilities of a loop are first used by the next one
+    with (NULL_PROFILER if profiler is None else profiler).phase("init"):
+        tables = SolveTables(space, u_table=u_table, u_prime_table=u_prime_table, policy=policy, frontier=frontier, propagated=propagated)
+        if(history is None):
+            history = HistoryRecorder(space, stride=history_stride, tolerance=history_tolerance)
+            history.append(tables.u_table)
+
+    sweeps = iter_policy_iteration(space, tables, discount_factor, threshold, max_steps, incremental, start_iteration, profiler)
+    snapshot, deadline_hit = run_sweeps(sweeps, tables, history, "u_table", deadline, on_sweep, profiler)
+
+    # the policy is already greedy, only its error bounds are left to work out
+    return finish_solve(space, tables, history, snapshot, snapshot.changed == 0, deadline_hit, discount_factor, start_time, profiler)
+
+def decomposed_value_iteration(state_space, discount_factor=0.99, threshold=0.0001, max_steps=1, history_stride=1, history_tolerance=None,
+                               u_prime_table=None, policy=None, profiler=None):
+    """
+    Decomposed Value Iteration as a pure function (see value_iteration for the thread safety)
+      - Drives iter_decomposed_value_iteration, the history keeps u_prime_table and the utilities after every solved component
+
+    Params:
+        state_space: Compiled maze (see compile_maze)
+        discount_factor: Gamma value to reduce the "importance" of future state utilities
+        threshold: Threshold to check for convergence
+        max_steps: int, controls the maximum number of value iterations per component
+        history_stride: Only keep every n-th utility table in the returned history
+        history_tolerance: None to return the history as an ndarray, else a DeltaHistory with this max. abs. error (0 for lossless)
+        u_prime_table: Utilities to start from (copied, never written), defaults to R(s) for a fresh solve
+        policy: Greedy policy of u_prime_table (copied), only used to count the changed actions of the first sweeps
+        profiler: Optional profiler.SolveProfiler, its stats are returned as stats["profile"]
+
+    Returns:
+        SolveResult, converged when no component was stopped by max_steps
+    """
+    space = state_space
+    if(profiler is not None):
+        profiler.start()
+    start_time = time.time()
+
+    with (NULL_PROFILER if profiler is None else profiler).phase("init"):
+        tables = SolveTables(space, u_prime_table=u_prime_table, policy=policy)
+        history = HistoryRecorder(space, stride=history_stride, tolerance=history_tolerance)
+        history.append(tables.u_prime_table)
+
+    snapshot = SweepSnapshot(0, 0.0, 0, read_only_view(tables.u_prime_table), True)     # a maze without decision states has no sweeps
+    solved = 0
+    sweeps = iter_decomposed_value_iteration(space, tables, discount_factor, threshold, max_steps, profiler)
+    try:
+        for snapshot in sweeps:
+            if(len(tables.stats["component_sweeps"]) > solved):
+                solved += 1
+                with (NULL_PROFILER if profiler is None else profiler).phase("history"):
+                    history.append(tables.u_table)
+    finally:
+        sweeps.close()
+
+    return finish_solve(space, tables, history, snapshot, tables.stats["unconverged"] == 0, False, discount_factor, start_time, profiler)
+
+def solve(state_space, algorithm="vi", **params):
+    """
+    Runs value_iteration ("vi") or policy_iteration ("pi") on a compiled maze
+
+    Returns:
+        SolveResult
+    """
+    if(algorithm == "vi"):
+        return value_iteration(state_space, **params)
+    if(algorithm == "pi"):
+        return policy_iteration(state_space, **params)
+    raise ValueError(f"Unknown algorithm {algorithm!r}, expected 'vi' or 'pi'")
@@ -0,0 +1,263 @@
+import numpy as np
+
+from helper import MazeCell, Move, NO_ACTION
+
+class StateSpace:
+    def __init__(self, maze, dtype=np.float64):
+        """
+        Compiles a maze into a compact state space where only non-wall cells get a (contiguous) 1-D index
+          - Decision states (floor cells) come first, followed by the fixed reward / punishment cells,
+            so solver loops can work on the slice [:num_decision] without any per-cell checks
+          - Transition tables are built once here, walls never show up in any solver array
+
+        Params:
+            maze: Custom Maze type with helper functions to describe the cells present in the given maze
+            dtype: Float type of the rewards and transition probabilities (and so of every utility computed from them)
+        """
+        self.maze = maze
+        self.dtype = np.dtype(dtype)
+        self.height = maze.height
+        self.width = maze.width
+
+        grid = np.array(maze.grid)
+        is_wall = grid == MazeCell.WALL.value
+        is_fixed = (grid == MazeCell.GREEN.value) | (grid == MazeCell.ORANGE.value)
+
+        # row-major order inside each group: decision states first, then fixed states
+        decision_rows, decision_cols = np.nonzero(~is_wall & ~is_fixed)
+        fixed_rows, fixed_cols = np.nonzero(is_fixed)
+        self.rows = np.concatenate([decision_rows, fixed_rows])
+        self.cols = np.concatenate([decision_cols, fixed_cols])
+
+        self.num_states = len(self.rows)
+        self.num_decision = len(decision_rows)
+
+        # maps (row, col) to the compact index, -1 for walls
+        self.index = np.full((self.height, self.width), -1, dtype=np.intp)
+        self.index[self.rows, self.cols] = np.arange(self.num_states)
+
+        self.cells = grid[self.rows, self.cols]     # MazeCell value of every state
+        self.rewards = np.array([maze.get_reward((row, col)) for row, col in zip(self.rows, self.cols)], dtype=self.dtype)
+
+        self.probabilities = np.array([0.8, 0.1, 0.1], dtype=self.dtype)  # intended move, then the 2 lateral moves
+        self.next_states = self.build_transitions()
+
+        self.predecessor_ptr = None     # reverse transition graph (CSR), see build_predecessors
+        self.predecessor_idx = None
+
+    def freeze(self):
+        """
+        Makes the arrays of the compiled maze read-only, so one StateSpace can be shared by concurrent solves
+          - The predecessor graph is still built on first use, its pointer array is assigned last so a concurrent
+            build can at worst be done twice
+
+        Returns:
+            self
+        """
+        for array in (self.rows, self.cols, self.index, self.cells, self.rewards, self.probabilities, self.next_states):
+            array.flags.writeable = False
+        return self
+
+    def build_transitions(self):
+        """
+        Builds the transition table for every state and action
+          - Bumping into a wall or the edge of the maze leaves the agent in the same state
+
+        Returns:
+            next_states: int ndarray of shape (num_states, len(Move), 3), the resulting state index for the
+                         intended move and both lateral moves (same order as self.probabilities)
+        """
+        offsets = {
+            Move.UP: (-1, 0),
+            Move.DOWN: (1, 0),
+            Move.LEFT: (0, -1),
+            Move.RIGHT: (0, 1)
+        }
+        lateral_actions = {
+            Move.UP: [Move.RIGHT, Move.LEFT],
+            Move.DOWN: [Move.RIGHT, Move.LEFT],
+            Move.LEFT: [Move.UP, Move.DOWN],
+            Move.RIGHT: [Move.UP, Move.DOWN]
+        }
+
+        # resulting state for each single (deterministic) move
+        move_targets = np.empty((self.num_states, len(Move)), dtype=np.intp)
+        for move in Move:
+            dy, dx = offsets[move]
+            rows = self.rows + dy
+            cols = self.cols + dx
+
+            in_bounds = (rows >= 0) & (rows < self.height) & (cols >= 0) & (cols < self.width)
+            targets = np.full(self.num_states, -1, dtype=np.intp)
+            targets[in_bounds] = self.index[rows[in_bounds], cols[in_bounds]]
+
+            move_targets[:, move.value] = np.where(targets >= 0, targets, np.arange(self.num_states))
+
+        next_states = np.empty((self.num_states, len(Move), 3), dtype=np.intp)
+        for move in Move:
+            outcomes = [move] + lateral_actions[move]
+            next_states[:, move.value, :] = move_targets[:, [outcome.value for outcome in outcomes]]
+
+        return next_states
+
+    def rewards_for(self, green, orange, floor):
+        """
+        Builds the reward vector of an alternative reward scheme (instead of the +1 / -1 / -0.05 from Maze.get_reward)
+
+        Params:
+            green: Reward of the green (reward) cells
+            orange: Reward of the orange (punishment) cells
+            floor: Reward of the white floor cells
+
+        Returns:
+            rewards: ndarray over the compact state index
+        """
+        rewards = np.full(self.num_states, floor, dtype=self.dtype)
+        rewards[self.cells == MazeCell.GREEN.value] = green
+        rewards[self.cells == MazeCell.ORANGE.value] = orange
+        return rewards
+
+    def build_predecessors(self):
+        """
+        Builds the reverse transition graph in CSR form: the decision states that can land in each state with some move
+          - Built on first use and cached, only incremental solvers need it
+        """
+        if(self.predecessor_ptr is not None):
+            return
+
+        sources = np.repeat(np.arange(self.num_decision), len(Move) * 3)
+        targets = self.next_states[:self.num_decision].reshape(-1)
+        edges = np.unique(targets * self.num_states + sources)     # drop duplicate edges, sorted by target then source
+
+        predecessor_idx = edges % self.num_states
+        predecessor_ptr = np.searchsorted(edges // self.num_states, np.arange(self.num_states + 1))
+        predecessor_idx.flags.writeable = False
+        predecessor_ptr.flags.writeable = False
+
+        self.predecessor_idx = predecessor_idx
+        self.predecessor_ptr = predecessor_ptr      # assigned last, it marks the graph as built
+
+    def predecessor_mask(self, states):
+        """
+        Marks every decision state that can land in one of the given states with some move
+          - A mask instead of np.unique keeps this linear, add more states to it and np.flatnonzero gives the sorted frontier
+
+        Params:
+            states: int array of compact state indices
+
+        Returns:
+            mask: bool ndarray over the decision states
+        """
+        self.build_predecessors()
+        mask = np.zeros(self.num_decision, dtype=bool)
+        starts = self.predecessor_ptr[states]
+        counts = self.predecessor_ptr[states + 1] - starts
+        if(counts.sum() == 0):
+            return mask
+
+        # positions of all the CSR ranges [start, start + count) in one go
+        offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+        mask[self.predecessor_idx[offsets + np.arange(counts.sum())]] = True
+        return mask
+
+    def predecessors_of(self, states):
+        """
+        Finds every decision state that can land in one of the given states with some move
+
+        Params:
+            states: int array of compact state indices
+
+        Returns:
+            Sorted int array of unique decision state indices
+        """
+        return np.flatnonzero(self.predecessor_mask(states))
+
+    def expected_utilities(self, u_table, states=slice(None)):
+        """
+        Calculates the expected utility of every action for the given states
+
+        Params:
+            u_table: 1-D array of utilities over the compact state index
+            states: Slice / index array selecting the states to compute, defaults to all of them
+
+        Returns:
+            ndarray of shape (len(states), len(Move))
+        """
+        return self.outcome_expectation(u_table, self.next_states[states])
+
+    def outcome_expectation(self, table, next_states):
+        """
+        Calculates sum(P(s' | s, a) * table(s')) for any array of outcome states, e.g. a compacted list of (state, action) pairs
+
+        Params:
+            table: 1-D array over the compact state index
+            next_states: int ndarray whose last axis holds the 3 outcomes (same order as self.probabilities)
+
+        Returns:
+            ndarray of next_states.shape[:-1]
+        """
+        next_utils = table[next_states]
+
+        # accumulated one outcome at a time so results match the per-cell calculation exactly
+        util = self.probabilities[0] * next_utils[..., 0]
+        for j in range(1, len(self.probabilities)):
+            util += self.probabilities[j] * next_utils[..., j]
+        return util
+
+    def scatter(self, values, fill=0):
+        """
+        Scatters compact values back onto the H x W grid (only needed for plotting and printing)
+
+        Params:
+            values: ndarray whose last axis is the compact state index, any leading axes are kept
+            fill: Value to use for the wall cells
+
+        Returns:
+            ndarray of shape (..., height, width)
+        """
+        values = np.asarray(values)
+        grid = np.full(values.shape[:-1] + (self.height, self.width), fill, dtype=values.dtype)
+        grid[..., self.rows, self.cols] = values
+        return grid
+
+    def new_policy(self):
+        """
+        Creates the compact int8 policy array with a "placeholder" move for every decision state
+
+        Returns:
+            policy: int8 ndarray of Move values over the compact state index, NO_ACTION for reward / punishment cells
+        """
+        policy = np.full(self.num_states, NO_ACTION, dtype=np.int8)
+        policy[:self.num_decision] = Move.UP.value
+        return policy
+
+    def scatter_policy(self, policy):
+        """
+        Converts a compact int8 policy back to the H x W grid of Move() used by the plotter and printing
+
+        Params:
+            policy: int8 ndarray over the compact state index (see new_policy)
+
+        Returns:
+            2D list with the Move() for floor cells and None everywhere else
+        """
+        grid = [[None for _ in range(self.width)] for _ in range(self.height)]
+        for stateIdx in np.flatnonzero(policy != NO_ACTION):
+            grid[self.rows[stateIdx]][self.cols[stateIdx]] = Move(int(policy[stateIdx]))
+        return grid
+
+    def gather_policy(self, policy_grid):
+        """
+        Converts an H x W grid of Move() (None for non-floor cells) to the compact int8 policy array
+
+        Params:
+            policy_grid: 2D list of Move() / None, as returned by the agents
+
+        Returns:
+            policy: int8 ndarray over the compact state index (see new_policy)
+        """
+        policy = np.full(self.num_states, NO_ACTION, dtype=np.int8)
+        for stateIdx in range(self.num_decision):
+            move = policy_grid[self.rows[stateIdx]][self.cols[stateIdx]]
+            policy[stateIdx] = move.value if move is not None else NO_ACTION
+        return policy
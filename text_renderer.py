@@ -0,0 +1,152 @@
+import math
+from collections import Counter
+
+import numpy as np
+
+from helper import MazeCell, Move
+
+class TextRenderer:
+    def __init__(self, viewport=None, max_cells=32):
+        """
+        Renders grids as text, building each frame in a single buffer that is printed with one call
+          - A viewport restricts the output to a window of the grid
+          - Windows bigger than max_cells in either direction are shown as a downsampled overview,
+            each character then stands for a block of cells (labels show the first row / col of each block)
+
+        Params:
+            viewport: ((row_start, row_stop), (col_start, col_stop)) window to render, None for the whole grid
+            max_cells: Max. number of rows / cols rendered before switching to the overview
+        """
+        self.viewport = viewport
+        self.max_cells = max_cells
+
+    def get_window(self, height, width):
+        """
+        Clips the viewport to the grid
+
+        Returns:
+            (row_start, row_stop), (col_start, col_stop)
+        """
+        if(self.viewport is None):
+            return (0, height), (0, width)
+
+        (row_start, row_stop), (col_start, col_stop) = self.viewport
+        row_start, col_start = max(0, row_start), max(0, col_start)
+        row_stop, col_stop = min(height, row_stop), min(width, col_stop)
+        if(row_start >= row_stop or col_start >= col_stop):
+            raise ValueError(f"Viewport {self.viewport} does not overlap the {height} x {width} grid")
+        return (row_start, row_stop), (col_start, col_stop)
+
+    def render(self, values, format_cell, reduce_block, title=None):
+        """
+        Renders a 2D array with row / col index labels
+
+        Params:
+            values: 2D ndarray (numeric or object) of the cell values
+            format_cell: Function turning a (possibly reduced) cell value into its text
+            reduce_block: Function turning a block of values (2D ndarray) into one value for the overview
+            title: Optional line printed above the grid
+
+        Returns:
+            frame: The rendered text, without a trailing newline
+        """
+        (row_start, row_stop), (col_start, col_stop) = self.get_window(*values.shape)
+        window = values[row_start:row_stop, col_start:col_stop]
+
+        factor = max(1, math.ceil(max(window.shape) / self.max_cells))
+        row_labels = list(range(row_start, row_stop, factor))
+        col_labels = list(range(col_start, col_stop, factor))
+        if(factor == 1):
+            cells = [[format_cell(value) for value in row] for row in window]
+        else:
+            cells = [
+                [format_cell(reduce_block(window[r:r + factor, c:c + factor])) for c in range(0, window.shape[1], factor)]
+                for r in range(0, window.shape[0], factor)
+            ]
+
+        cell_width = max([len(str(label)) for label in col_labels] + [len(cell) for row in cells for cell in row])
+        label_width = len(str(row_labels[-1]))
+
+        lines = []
+        if(title is not None):
+            lines.append(title)
+        if(factor > 1):
+            lines.append(f"(overview, 1 char = {factor} x {factor} cells)")
+        lines.append(" " * (label_width + 2) + " ".join(f"{label:>{cell_width}}" for label in col_labels))
+        for label, row in zip(row_labels, cells):
+            lines.append(f"{label:>{label_width}}  " + " ".join(f"{cell:>{cell_width}}" for cell in row))
+
+        return "\n".join(lines)
+
+    def render_maze(self, maze, current_pos=None, rewards=False):
+        """
+        Renders the maze layout (or its reward values), marking the current position with an X
+
+        Params:
+            maze: Maze object storing maze information like the 2d grid and helper functions
+            current_pos: Optional (row, col) of the agent
+            rewards: Bool to show the reward values instead of the cell types
+        """
+        cells = np.empty((maze.height, maze.width), dtype=object)
+        for rowIdx in range(maze.height):
+            for colIdx in range(maze.width):
+                cells[rowIdx, colIdx] = maze.get_reward((rowIdx, colIdx)) if rewards and not maze.is_wall((rowIdx, colIdx)) else maze.grid[rowIdx][colIdx]
+        if(current_pos is not None):
+            cells[current_pos] = "X"
+
+        return self.render(cells, format_cell=str, reduce_block=most_common)
+
+    def render_utilities(self, u_grid, maze=None, decimals=3):
+        """
+        Renders a H x W utility table, the overview shows the mean utility of each block
+
+        Params:
+            u_grid: 2D ndarray of utilities
+            maze: Optional Maze object, walls are then shown as W
+            decimals: Number of decimals shown
+        """
+        values = np.array(u_grid, dtype=float)
+        if(maze is not None):
+            walls = np.array(maze.grid) == MazeCell.WALL.value
+            values[walls] = np.nan
+
+        def format_cell(value):
+            return MazeCell.WALL.value if np.isnan(value) else f"{value:.{decimals}f}"
+
+        def block_mean(block):
+            return np.nan if np.all(np.isnan(block)) else np.nanmean(block)
+
+        return self.render(values, format_cell=format_cell, reduce_block=block_mean)
+
+    def render_policy(self, policy_grid, maze=None):
+        """
+        Renders a H x W grid of Move() as arrows, the overview shows the most common move of each block
+
+        Params:
+            policy_grid: 2D list of Move() / None, as returned by the agents (no policy is recalculated)
+            maze: Optional Maze object, non-floor cells then show their cell type instead of a dot
+        """
+        cells = np.empty((len(policy_grid), len(policy_grid[0])), dtype=object)
+        for rowIdx, row in enumerate(policy_grid):
+            for colIdx, move in enumerate(row):
+                if(move is not None):
+                    cells[rowIdx, colIdx] = MOVE_SYMBOLS[move]
+                elif(maze is not None):
+                    cells[rowIdx, colIdx] = maze.grid[rowIdx][colIdx]
+                else:
+                    cells[rowIdx, colIdx] = "."
+
+        return self.render(cells, format_cell=str, reduce_block=most_common)
+
+MOVE_SYMBOLS = {
+    Move.UP: "^",
+    Move.DOWN: "v",
+    Move.LEFT: "<",
+    Move.RIGHT: ">"
+}
+
+def most_common(block):
+    """
+    Reduces a block of cells to its most common value (used for the overview of categorical grids)
+    """
+    return Counter(block.ravel().tolist()).most_common(1)[0][0]
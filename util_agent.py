@@ -1,189 +1,428 @@
 import numpy as np
 import time
 
+import checkpoint
+import solver
 from helper import Move
+from history import HistoryRecorder
+from maze import Maze
+from profiler import SolveProfiler
+from text_renderer import TextRenderer
+
+# stats that add up over the sweeps / loops of a solve, checkpoints carry them over so a resumed solve reports the same as
+# an uninterrupted one: per-sweep lists are prepended, counters are summed
+SWEEP_STATS = ("deltas", "policy_changes", "touched_states")
+COUNTER_STATS = ("backups", "q_evaluations")
+
+def merge_stats(earlier, stats):
+    """
+    Combines the stats of the sweeps before a checkpoint with the stats of the resumed solve
+
+    Params:
+        earlier: Dictionary of SWEEP_STATS / COUNTER_STATS restored from the checkpoint (empty for a new solve)
+        stats: Stats of the sweeps since the checkpoint
+
+    Returns:
+        Dictionary of the stats over the whole solve
+    """
+    merged = dict(stats)
+    for key in SWEEP_STATS:
+        if(key in earlier and key in stats):
+            merged[key] = list(earlier[key]) + list(stats[key])
+    for key in COUNTER_STATS:
+        if(key in earlier and key in stats):
+            merged[key] = earlier[key] + stats[key]
+    return merged
 
 class UtilityAgent:
-    def __init__(self, maze, discount_factor=0.99, threshold=0.0001):
+    def __init__(self, maze, discount_factor=0.99, threshold=0.0001, dtype=np.float64):
         """
         Initializes the agent to have knowledge of the maze + relevant hyperparams
+          - All tables are 1-D over the compact state index of StateSpace (walls are left out),
+            results are only scattered back to the H x W grid for plotting and printing
+          - value_iteration / policy_iteration run the stateless functions of solver.py and keep the result,
+            use those functions directly to solve one compiled maze from several threads
         
         Params:
             maze: Custom Maze type with helper functions to describe the cells present in the given maze
             discount_factor: Gamma value to reduce the "importance" of future state utilities
             threshold: Threshold to check for convergence
+            dtype: Float type of the utility tables, history and transition probabilities (np.float32 halves the memory traffic)
         """
         self.maze = maze
+        self.state_space = solver.compile_maze(maze, dtype=dtype)     # read-only, may be shared with other agents / solves
         self.discount_factor = discount_factor  # Discount factor (gamma)
 
         self.threshold = threshold
         
-        self.u_table = np.zeros((maze.height, maze.width))  # stores utility values
-        self.u_prime_table = np.zeros((maze.height, maze.width))    # stores updated utility values, then updates u_table at the end of a loop
+        self.u_table = np.zeros(self.state_space.num_states, dtype=self.state_space.dtype)  # stores utility values
+        self.u_prime_table = np.zeros(self.state_space.num_states, dtype=self.state_space.dtype)    # stores updated utility values, then updates u_table at the end of a loop
+
+        self.active_actions = None  # (num_decision, len(Move)) mask of actions not yet eliminated (only used with action elimination)
+        self.frontier = None        # incremental PI state restored from a checkpoint (see solver.iter_policy_iteration)
+        self.propagated = None
+        self.stats = {}             # extra statistics gathered during the last solve
 
         self.init_policy()
         self.init_u_prime_table()
 
     def init_policy(self):
         """
-        Initializes the policy table at the start with a "placeholder" move
+        Initializes the policy of every decision state at the start with a "placeholder" move
+          - The policy is an int8 array of Move values over the compact state index (NO_ACTION for non-decision cells)
         """
-        self.policy = []
-
-        # init policies
-        for rowIdx in range(len(self.u_table)):
-            row = self.u_table[rowIdx]
-            policy_row = []
-            for colIdx in range(len(row)):
-                state = (rowIdx, colIdx)
-                if(self.maze.is_wall(state) or self.maze.is_reward(state) or self.maze.is_punishment(state)):
-                    policy_row.append(None)
-                else:
-                    policy_row.append(Move(0))
-            self.policy.append(policy_row)
+        self.policy = self.state_space.new_policy()
 
     def init_u_prime_table(self):
         """
         Initializes utility values of reward/punish states based on reward values
           - Basically the u_table is initialized to show the R(s) values for each state
         """
-        for rowIdx in range(self.maze.height):
-            for colIdx in range(self.maze.width):
-                state = (rowIdx, colIdx)
-                if(self.maze.is_wall(state)):
-                    self.u_prime_table[state] = 0
-                else:
-                    self.u_prime_table[state] = self.maze.get_reward(state)
+        self.u_prime_table = self.state_space.rewards.copy()
+
+    def get_policy_grid(self):
+        """
+        Gets the current policy as Move() laid out on the H x W grid (None for non-floor cells)
+        """
+        return self.state_space.scatter_policy(self.policy)
 
     def calculate_policy(self):
         """
         Calculates the new optimal policy based on the calculated utilities 
+
+        Returns:
+            changed: Number of decision states whose action changed
+        """
+        return self.improve_policy(solver.greedy_q_values(self.state_space, self))
+
+    def improve_policy(self, q_values):
         """
-        for rowIdx in range(self.maze.height):
-            for colIdx in range(self.maze.width):
-                state = (rowIdx, colIdx)
+        Sets every decision state to its greedy action with one argmax over the expected utilities
 
-                # no calc needed for these cells
-                if(self.maze.is_wall(state) or self.maze.is_reward(state) or self.maze.is_punishment(state)):
-                    continue
+        Params:
+            q_values: (num_decision, len(Move)) expected utilities of each action
 
-                self.policy[rowIdx][colIdx] = Move(np.argmax([self.get_expected_utility(state, Move(i)) for i in range(len(Move))]))
-                    
+        Returns:
+            changed: Number of decision states whose action changed
+        """
+        num_decision = self.state_space.num_decision
+        best_moves = np.argmax(q_values, axis=1).astype(np.int8)
+        changed = int(np.count_nonzero(best_moves != self.policy[:num_decision]))
+        self.policy[:num_decision] = best_moves
 
+        return changed
 
-    def policy_iteration(self, max_steps=1):
+    def iter_policy_iteration(self, max_steps=1, incremental=False, start_iteration=0):
+        """
+        Performs Policy Iteration on this agent's tables one loop at a time, yielding a SweepSnapshot after every loop
+          - See solver.iter_policy_iteration, the agent is handed over as the tables to update in place
+
+        Params:
+            max_steps: int, controls the maximum number of policy iterations
+            incremental: Bool to only re-evaluate / re-improve the states affected by the last loop
+            start_iteration: Number of loops already done (when resuming from a checkpoint), counted towards max_steps
+
+        Yields:
+            SweepSnapshot(iteration, delta, changed, utilities, done)
+        """
+        return solver.iter_policy_iteration(self.state_space, self, self.discount_factor, self.threshold, max_steps, incremental, start_iteration)
+
+    def policy_iteration(self, max_steps=1, history_stride=1, history_tolerance=None, deadline=None, incremental=False,
+                         checkpoint_path=None, checkpoint_every=100, resume=False, profile=False):
         """
         Performs Policy Iteration to update u_table and policy accordingly
           - Policy is updated on each loop (if necessary) and the loop terminates when there are no updates left to make
+          - Runs solver.policy_iteration from the agent's tables and keeps its result
+          - With a deadline, the best policy found so far is returned once the time is up (see add_error_bounds for the guarantees)
+          - See solver.iter_policy_iteration for the incremental mode
+          - See save_checkpoint for checkpointing, a resumed solve gives the same results as an uninterrupted one
+          - With profile, stats["profile"] gets the memory / allocation profile of the solve (see profiler.SolveProfiler)
 
         Params:
             max_steps: int, controls the maximum number of policy iterations
+            incremental: Bool to only re-evaluate / re-improve the states affected by the last loop
+            history_stride: Only keep every n-th utility table in the returned history
+            history_tolerance: None to return the history as an ndarray, else a DeltaHistory with this max. abs. error (0 for lossless)
+            deadline: Wall-clock budget in seconds, None to only stop on convergence / max_steps
+            checkpoint_path: File to checkpoint the solve to, None to disable checkpoints
+            checkpoint_every: Number of loops between checkpoints
+            resume: Bool to continue from the checkpoint at checkpoint_path instead of starting over
+            profile: Bool to profile the memory use of each phase
 
         Returns:
             utilities: ndarray of utility values calculated over each iteration (last entry would just be the final utility values)
             policy: the resulting optimal policies for each grid cell
             exec_time: time taken to execute the iteration function
         """
-        utilities = []
-        iteration = 0
-        start_time = time.time()
-        while(True):
-            utilities.append(np.copy(self.u_table))
-            self.u_table = self.u_prime_table.copy()    # assign u_table as a copy of u_prime_table
-
-            # Policy evaluation (using cur policy, eval utilities)
-            for rowIdx in range(self.maze.height):
-                for colIdx in range(self.maze.width):
-                    state = (rowIdx, colIdx)
-
-                    # no calc needed for these cells
-                    if(self.maze.is_wall(state) or self.maze.is_reward(state) or self.maze.is_punishment(state)):
-                        continue
-
-                    action = self.policy[rowIdx][colIdx]
-                    self.u_prime_table[state] = self.maze.get_reward(state) + self.discount_factor * self.get_expected_utility(state, action)
-
-            # Policy improvement
-            policy_stable = True
-            for rowIdx in range(self.maze.height):
-                for colIdx in range(self.maze.width):
-                    state = (rowIdx, colIdx)
-                    if(self.maze.is_wall(state) or self.maze.is_reward(state) or self.maze.is_punishment(state)):
-                        continue
-
-                    cur_move: Move = self.policy[rowIdx][colIdx]
-                    best_move = Move(np.argmax([self.get_expected_utility(state, Move(i)) for i in range(len(Move))]))
-
-                    if cur_move != best_move:     # a new move has been found to be more optimal
-                        self.policy[rowIdx][colIdx] = best_move
-                        policy_stable = False
-
-            iteration += 1
-
-            if(policy_stable):
-                print(f"Policy Iteration converged after {iteration} loops!")
-                break
-
-            if(iteration == max_steps):
-                print(f"Policy Iteration did not converge! Terminating after {iteration} loops!")
-                break
-        
-        utilities = np.stack(utilities, axis=0)
-        exec_time = time.time() - start_time    # time taken for execution
+        history, start_iteration, earlier_stats, on_sweep = self.prepare_checkpoints("pi", history_stride, history_tolerance, checkpoint_path, checkpoint_every, resume)
+        result = solver.policy_iteration(self.state_space, self.discount_factor, self.threshold, max_steps, history_stride, history_tolerance,
+                                         incremental=incremental, u_table=self.u_table, u_prime_table=self.u_prime_table, policy=self.policy,
+                                         deadline=deadline, history=history, start_iteration=start_iteration, on_sweep=on_sweep,
+                                         profiler=SolveProfiler() if profile else None, frontier=self.frontier, propagated=self.propagated)
+        self.keep_result(result, earlier_stats)
+        if(result.stats["deadline_hit"]):
+            print(f"Policy Iteration hit the {deadline}s deadline after {result.iterations} loops!")
+        elif(result.converged):
+            print(f"Policy Iteration converged after {result.iterations} loops!")
+        else:
+            print(f"Policy Iteration did not converge! Terminating after {result.iterations} loops!")
+
+        return result.history, self.get_policy_grid(), result.exec_time
+
+    def iter_value_iteration(self, max_steps=1, action_elimination=False, acceleration=None, relaxation=1.2, memory=5, start_iteration=0):
+        """
+        Performs Value Iteration on this agent's tables one sweep at a time, yielding a SweepSnapshot after every sweep
+          - See solver.iter_value_iteration (action elimination, SOR / Anderson acceleration), the agent is handed over
+            as the tables to update in place
 
-        return utilities, self.policy, exec_time
+        Params:
+            max_steps: int, controls the maximum number of value iterations
+            action_elimination: Bool to enable pruning of suboptimal actions using upper/lower utility bounds
+            acceleration: None for plain sweeps, "sor" or "anderson"
+            relaxation: Relaxation factor of SOR (1 is plain Gauss-Seidel)
+            memory: Number of past iterates mixed by Anderson acceleration
+            start_iteration: Number of sweeps already done (when resuming from a checkpoint), counted towards max_steps
+
+        Yields:
+            SweepSnapshot(iteration, delta, changed, utilities, done)
+        """
+        return solver.iter_value_iteration(self.state_space, self, self.discount_factor, self.threshold, max_steps, action_elimination, acceleration,
+                                           relaxation, memory, start_iteration)
 
-    def value_iteration(self, max_steps=1):
+    def value_iteration(self, max_steps=1, action_elimination=False, history_stride=1, history_tolerance=None, deadline=None, acceleration=None, relaxation=1.2, memory=5,
+                        checkpoint_path=None, checkpoint_every=100, resume=False, profile=False):
         """
         Performs Value Iteration to update u_table and policy accordingly
           - Policy is updated AFTER the VI step when convergence has been attained
+          - Runs solver.value_iteration from the agent's tables and keeps its result
+          - See solver.iter_value_iteration for the action elimination and acceleration modes
+          - With a deadline, the best policy found so far is returned once the time is up (see add_error_bounds for the guarantees)
+          - See save_checkpoint for checkpointing (plain sweeps only), a resumed solve gives the same results as an uninterrupted one
+          - With profile, stats["profile"] gets the memory / allocation profile of the solve (see profiler.SolveProfiler)
         
         Params:
             max_steps: int, controls the maximum number of value iterations
+            action_elimination: Bool to enable pruning of suboptimal actions using upper/lower utility bounds
+            history_stride: Only keep every n-th utility table in the returned history
+            history_tolerance: None to return the history as an ndarray, else a DeltaHistory with this max. abs. error (0 for lossless)
+            deadline: Wall-clock budget in seconds, None to only stop on convergence / max_steps
+            acceleration: None for plain sweeps, "sor" (successive over-relaxation) or "anderson" (Anderson mixing)
+            relaxation: Relaxation factor of SOR
+            memory: Number of past iterates mixed by Anderson acceleration
+            checkpoint_path: File to checkpoint the solve to, None to disable checkpoints
+            checkpoint_every: Number of sweeps between checkpoints
+            resume: Bool to continue from the checkpoint at checkpoint_path instead of starting over
+            profile: Bool to profile the memory use of each phase
 
         Returns:
             utilities: ndarray of utility values calculated over each iteration (last entry would just be the final utility values)
             policy: the resulting optimal policies for each grid cell
             exec_time: time taken to execute the iteration function
         """
-        utilities = []
-        iteration = 0
-        start_time = time.time()
-        while(True):
-            delta = 0   # to track the max difference in updated values
-            utilities.append(np.copy(self.u_prime_table))
-            self.u_table = self.u_prime_table.copy()    # assign u_table as a copy of u_prime_table
+        if(checkpoint_path is not None and (action_elimination or acceleration is not None)):
+            raise ValueError("Checkpoints only capture plain VI sweeps (the elimination masks / mixing memory are not saved)")
+
+        history, start_iteration, earlier_stats, on_sweep = self.prepare_checkpoints("vi", history_stride, history_tolerance, checkpoint_path, checkpoint_every, resume)
+        result = solver.value_iteration(self.state_space, self.discount_factor, self.threshold, max_steps, history_stride, history_tolerance,
+                                        u_prime_table=self.u_prime_table, policy=self.policy, action_elimination=action_elimination,
+                                        acceleration=acceleration, relaxation=relaxation, memory=memory, deadline=deadline, history=history,
+                                        start_iteration=start_iteration, on_sweep=on_sweep, profiler=SolveProfiler() if profile else None)
+        self.keep_result(result, earlier_stats)
+        if(result.stats["deadline_hit"]):
+            print(f"Value Iteration hit the {deadline}s deadline after {result.iterations} sweeps!")
+        elif(result.converged):
+            print(f"Value iteration converged after {result.iterations} loops!")
+        else:
+            print(f"Value Iteration did not converge! Terminating after {result.iterations} loops!")
+
+        return result.history, self.get_policy_grid(), result.exec_time
+
+    def keep_result(self, result, earlier_stats=None):
+        """
+        Takes over the tables and stats of a solver.SolveResult (its arrays are owned by the result alone, so no copies)
+
+        Params:
+            result: solver.SolveResult
+            earlier_stats: Stats of the sweeps before the checkpoint a solve resumed from (see merge_stats)
+        """
+        self.u_table = result.u_table
+        self.u_prime_table = result.u_prime_table
+        self.policy = result.policy
+        self.active_actions = None
+        self.frontier = self.propagated = None
+        self.stats = merge_stats(earlier_stats or {}, result.stats)
+
+    def prepare_checkpoints(self, algorithm, history_stride, history_tolerance, checkpoint_path, checkpoint_every, resume):
+        """
+        Sets up the checkpointing of a solve: restores the agent and its history when resuming and builds the on_sweep
+        callback of the solver that writes a checkpoint every checkpoint_every sweeps / loops
+
+        Returns:
+            history: HistoryRecorder restored from the checkpoint, None to let the solver start a new one
+            start_iteration: Number of sweeps / loops done before the checkpoint (0 for a new solve)
+            earlier_stats: Stats of the sweeps before the checkpoint (empty for a new solve, see merge_stats)
+            on_sweep: Callback for the solver, None without checkpoint_path
+        """
+        if(checkpoint_path is None):
+            return None, 0, {}, None
+
+        history, start_iteration, earlier_stats = None, 0, {}
+        if(resume):
+            history = HistoryRecorder(self.state_space, stride=history_stride, tolerance=history_tolerance)
+            start_iteration, earlier_stats = self.load_checkpoint(checkpoint_path, algorithm, history)
+
+        def on_sweep(snapshot, tables, history):
+            if(snapshot.iteration % checkpoint_every == 0):
+                self.save_checkpoint(checkpoint_path, algorithm, snapshot.iteration, history, tables, earlier_stats)
+
+        return history, start_iteration, earlier_stats, on_sweep
+
+    def save_checkpoint(self, path, algorithm, iteration, history, tables=None, earlier_stats=None):
+        """
+        Saves everything needed to continue a solve to a compressed .npz file: the utility tables, policy, iteration counter,
+        RNG state, hyperparams and the maze itself (so from_checkpoint can rebuild the agent)
+          - The history only grows, so just its new tables are appended to a "<path>.history" file next to it
+
+        Params:
+            path: File to write
+            algorithm: "vi" or "pi"
+            iteration: Number of sweeps / loops done
+            history: HistoryRecorder of the solve
+            tables: solver.SolveTables of the running solve, defaults to the agent's own tables
+            earlier_stats: Stats of the sweeps before the checkpoint the running solve resumed from (see merge_stats)
+        """
+        tables = self if tables is None else tables
+        stats = merge_stats(earlier_stats or {}, tables.stats)
+        checkpoint.append_tables(f"{path}.history", history.get_tables(start=history.saved), history.saved)
+        history.saved = len(history)
+
+        arrays = {
+            "u_table": tables.u_table,
+            "u_prime_table": tables.u_prime_table,
+            "policy": tables.policy,
+        }
+        if(getattr(tables, "frontier", None) is not None):
+            arrays["frontier"] = tables.frontier
+            arrays["propagated"] = tables.propagated
+        for key in SWEEP_STATS:
+            if(key in stats):
+                arrays[f"stats_{key}"] = np.asarray(stats[key])
+        meta = {
+            "algorithm": algorithm,
+            "iteration": int(iteration),
+            "history_count": history.count,
+            "history_rows": len(history),
+            "grid": ["".join(row) for row in self.maze.grid],
+            "discount_factor": self.discount_factor,
+            "threshold": self.threshold,
+            "dtype": self.state_space.dtype.name,
+            "rng": checkpoint.get_rng_state(),
+            "stats": {key: stats[key] for key in COUNTER_STATS if key in stats},
+        }
+        checkpoint.save_checkpoint(path, arrays, meta)
+
+    def load_checkpoint(self, path, algorithm, history):
+        """
+        Restores a checkpoint written by save_checkpoint into this agent and the given history
+
+        Returns:
+            iteration: Number of sweeps / loops done before the checkpoint
+            earlier_stats: SWEEP_STATS / COUNTER_STATS of those sweeps / loops (see merge_stats)
+        """
+        arrays, meta = checkpoint.load_checkpoint(path)
+        if(meta["algorithm"] != algorithm):
+            raise ValueError(f"Checkpoint {path} is for {meta['algorithm']!r}, not {algorithm!r}")
+        if(meta["grid"] != ["".join(row) for row in self.maze.grid]):
+            raise ValueError(f"Checkpoint {path} was written for a different maze")
+
+        dtype = self.state_space.dtype
+        self.u_table = arrays["u_table"].astype(dtype)
+        self.u_prime_table = arrays["u_prime_table"].astype(dtype)
+        self.policy = arrays["policy"].astype(np.int8)
+        self.frontier = arrays.get("frontier")
+        self.propagated = arrays["propagated"].astype(dtype) if "propagated" in arrays else None
+        history.restore(checkpoint.load_tables(f"{path}.history", meta["history_rows"], self.state_space.num_states, dtype), meta["history_count"])
+        checkpoint.set_rng_state(meta["rng"])
+
+        earlier_stats = dict(meta.get("stats", {}))
+        for key in SWEEP_STATS:
+            if(f"stats_{key}" in arrays):
+                earlier_stats[key] = arrays[f"stats_{key}"].tolist()
+
+        print(f"Resuming from {path} after {meta['iteration']} iterations")
+        return meta["iteration"], earlier_stats
+
+    @classmethod
+    def from_checkpoint(cls, path):
+        """
+        Creates an agent for the maze and hyperparams stored in a checkpoint (the solve state itself is restored by resume=True)
 
-            # for each state s in S,
-            for rowIdx in range(self.maze.height):
-                for colIdx in range(self.maze.width):
-                    state = (rowIdx, colIdx)
+        Returns:
+            agent: UtilityAgent
+            algorithm: "vi" or "pi"
+        """
+        _, meta = checkpoint.load_checkpoint(path)
+        maze = Maze([list(row) for row in meta["grid"]])
+        agent = cls(maze, discount_factor=meta["discount_factor"], threshold=meta["threshold"], dtype=np.dtype(meta["dtype"]))
+        return agent, meta["algorithm"]
 
-                    # no calc needed for these cells
-                    if(self.maze.is_wall(state) or self.maze.is_reward(state) or self.maze.is_punishment(state)):
-                        continue
+    def get_bellman_residual(self, u_table):
+        """
+        Finds the Bellman residual max|B(U)(s) - U(s)| of a compact utility table over the decision states
 
-                    # update U' table with new utility value
-                    self.u_prime_table[state] = self.get_max_expected_utility(state)
-                    delta = max(delta, abs(self.u_prime_table[state] - self.u_table[state]))
+        Params:
+            u_table: 1-D array of utilities over the compact state index
 
-            iteration += 1
+        Returns:
+            residual: float
+        """
+        return solver.bellman_residual(self.state_space, u_table, self.discount_factor)
+
+    def add_error_bounds(self, deadline_hit=False):
+        """
+        Adds the Bellman-residual based quality guarantees of the current solution to stats
+          - "error_bound": max|U(s) - U*(s)| <= residual / (1 - gamma) for the final utilities (u_prime_table)
+          - "policy_loss_bound": the policy is greedy w.r.t. u_table, so its utilities are within 2 * gamma * residual / (1 - gamma) of optimal
+
+        Params:
+            deadline_hit: Bool, whether the solve was cut short by its deadline
+        """
+        self.stats["deadline_hit"] = deadline_hit
+        self.stats.update(solver.error_bounds(self.state_space, self.u_table, self.u_prime_table, self.discount_factor))
+
+    def decomposed_value_iteration(self, max_steps=1):
+        """
+        Performs Value Iteration one strongly connected component of the state graph at a time (see solver.iter_decomposed_value_iteration)
+
+        Params:
+            max_steps: int, controls the maximum number of value iterations per component
 
-            if(delta < self.threshold * (1 - self.discount_factor) / self.discount_factor):
-                print(f"Value iteration converged after {iteration} loops!")
-                break
+        Returns:
+            utilities: ndarray of utility values after each solved component (last entry would just be the final utility values)
+            policy: the resulting optimal policies for each grid cell
+            exec_time: time taken to execute the iteration function
+        """
+        result = solver.decomposed_value_iteration(self.state_space, self.discount_factor, self.threshold, max_steps,
+                                                   u_prime_table=self.u_prime_table, policy=self.policy)
+        self.keep_result(result)
 
-            if(iteration == max_steps):
-                print(f"Value Iteration did not converge! Terminating after {iteration} loops!")
-                break
+        if(result.stats["unconverged"] > 0):
+            print(f"{result.stats['unconverged']} components did not converge! Terminating each after {max_steps} loops!")
+        print(f"Decomposed value iteration solved {result.stats['components']} components with {result.stats['sweeps']} sweeps!")
 
-        utilities = np.stack(utilities, axis=0)
+        return result.history, self.get_policy_grid(), result.exec_time
 
-        # calculate actual policy using new utilities
-        self.calculate_policy()
-        exec_time = time.time() - start_time
+    def iter_decomposed_value_iteration(self, max_steps=1):
+        """
+        Decomposed Value Iteration on the agent's tables one component sweep at a time (see solver.iter_decomposed_value_iteration)
+        """
+        return solver.iter_decomposed_value_iteration(self.state_space, self, self.discount_factor, self.threshold, max_steps)
 
-        return utilities, self.policy, exec_time
+    def get_state_components(self):
+        """
+        Finds the strongly connected components of the graph between decision states (see solver.state_components)
+        """
+        return solver.state_components(self.state_space)
 
     def get_max_expected_utility(self, state):
         """
@@ -203,23 +442,35 @@ class UtilityAgent:
     def get_expected_utility(self, state, action):
         """
         Finds expected utility for a given state + action
+          - Walls have no compact index, their expected utility is summed over the cells the moves lead to (walls count as 0),
+            the same as the per-cell calculation did before the compact state space
 
         Params:
             state: Tuple[int, int] representing CURRENT state
             action: Move() representing the policy(state) value
         """
-        probabilities = [0.8, 0.1, 0.1]
-        util = 0
+        if(self.maze.is_out_of_bounds(state)):
+            raise IndexError(f"state {state} is outside the {self.maze.height} x {self.maze.width} maze")
 
-        actions = [action]    # stores all the possible action(s) given the initial action choice
-        actions.extend(self.get_lateral_moves(action))  # get the sideways movement options
-
-        # calculate the utility for this particular chosen action
-        for j in range(len(actions)):
-            next_state = self.get_next_state(state, actions[j])  
-            util += probabilities[j] * self.u_table[next_state]
+        stateIdx = self.state_space.index[state]
+        if(stateIdx >= 0):
+            return self.get_state_expected_utility(stateIdx, action)
 
+        util = 0
+        for probability, move in zip(self.state_space.probabilities, [action] + self.get_lateral_moves(action)):
+            nextIdx = self.state_space.index[self.get_next_state(state, move)]
+            util += probability * (self.u_table[nextIdx] if nextIdx >= 0 else 0)
         return util
+
+    def get_state_expected_utility(self, stateIdx, action):
+        """
+        Finds expected utility for a given state + action using the compact transition table
+
+        Params:
+            stateIdx: int, compact index of the CURRENT state
+            action: Move() representing the policy(state) value
+        """
+        return self.state_space.expected_utilities(self.u_table, stateIdx)[action.value]
     
     def get_next_state(self, cur_state, action):
         """
@@ -263,44 +514,54 @@ class UtilityAgent:
 
         return lateral_actions[action]
     
-    def print_u_table(self):
+    def print_u_table(self, viewport=None):
         """
         Helper function to show the utility table stored so far
+
+        Params:
+            viewport: Optional ((row_start, row_stop), (col_start, col_stop)) window, big grids are shown as an overview
         """
-        for i in range(len(self.u_table)):
-            row = self.u_table[i]
-            column_headers = [idx for idx in range(len(row))]
-            if(i == 0): # print col index
-                print("   ", end="")
-                for header in column_headers:
-                    print(f"  {header}  ", end="")
-                print()
-             
-            for j in range(len(row)):
-                if(j == 0):
-                    print(f"{i}  ", end="")     # print row index
-                print(f" {row[j]} ", end="")
-            print()
+        print(TextRenderer(viewport=viewport).render_utilities(self.state_space.scatter(self.u_table), maze=self.maze))
         print()
 
-    def print_policy(self):
+    def print_policy(self, viewport=None):
         """
         Helper function to print the optimal action (policy) so far
+          - Only shows the current policy, call calculate_policy first to recompute it from the utilities
+
+        Params:
+            viewport: Optional ((row_start, row_stop), (col_start, col_stop)) window, big grids are shown as an overview
         """
-        self.calculate_policy()
+        print(TextRenderer(viewport=viewport).render_policy(self.get_policy_grid(), maze=self.maze))
+        print()
 
-        for rowIdx in range(self.maze.height):
-            column_headers = [idx for idx in range(len(self.maze.grid[rowIdx]))]
-            if(rowIdx == 0): # print col index
-                print("   ", end="")
-                for header in column_headers:
-                    print(f" {header} ", end="")
-                print()
+def check_precision(maze, dtype=np.float32, algorithm="vi", max_steps=10000, **agent_kwargs):
+    """
+    Solves the maze in both float64 and the given dtype to check whether the lower precision is good enough
+
+    Params:
+        maze: Custom Maze type with helper functions to describe the cells present in the given maze
+        dtype: Float type to compare against the float64 reference
+        algorithm: "vi" or "pi"
+        max_steps: int, controls the maximum number of iterations
+        agent_kwargs: Extra hyperparams passed to both agents (discount_factor, threshold)
+
+    Returns:
+        Dictionary with the "max_deviation" of the final utilities, whether the "policy_changed"
+        and the number of "changed_states"
+    """
+    agents = [UtilityAgent(maze, dtype=np.float64, **agent_kwargs), UtilityAgent(maze, dtype=dtype, **agent_kwargs)]
+    for agent in agents:
+        if(algorithm == "vi"):
+            agent.value_iteration(max_steps)
+        else:
+            agent.policy_iteration(max_steps)
 
-            for colIdx in range(self.maze.width):
-                if(colIdx == 0):
-                    print(f"{rowIdx}  ", end="")     # print row index
+    reference, candidate = agents
+    changed_states = int(np.count_nonzero(reference.policy != candidate.policy))
 
-                print(f" {self.policy[rowIdx][colIdx]} ", end="")
-            print()
-        print()
\ No newline at end of file
+    return {
+        "max_deviation": float(np.max(np.abs(reference.u_prime_table - candidate.u_prime_table.astype(np.float64)), initial=0)),
+        "policy_changed": changed_states > 0,
+        "changed_states": changed_states,
+    }
@@ -1,217 +1,278 @@
 import numpy as np
-import sys
+import time
 
-from helper import Move
+from helper import MazeCell, Move, NO_ACTION
+from profiler import NULL_PROFILER, SolveProfiler
+from text_renderer import TextRenderer
 
 class ValueAgent:
     """
-    !!! NOT IN USE !!!
-
     Implements Value and Policy Iteration by calculating state values V(s) and the Q table Q(s, a), taught in SC3000
-      - Achieves more or less the same end result as the Utility function in SC4003, but the calculation is quite different even though they do look fairly similar
+      - Rewards are collected on the transition: Q(s, a) = sum(P(s' | s, a) * (R(s') + y * V(s'))) and V(s) = max_a Q(s, a),
+        walls, reward and punishment cells keep V = 0
+      - Achieves the same end result as the Utility function in SC4003: U(s) = R(s) + y * V(s) on the floor cells,
+        so Q(s, a) is the expected utility EU(s, a) of UtilityAgent. Q is accumulated in the same order as StateSpace,
+        which makes both agents take the same sweeps / loops and pick the same policies
+      - Every sweep materializes the full (H, W, 4) Q table with a handful of whole-grid NumPy operations
+      - u_table holds V, the returned histories hold U = R + y * V (walls 0) like the histories of UtilityAgent
     """
-    def __init__(self, maze, discount_factor=0.99, threshold=0.01):
+    def __init__(self, maze, discount_factor=0.99, threshold=0.0001, dtype=np.float64):
         """
         Initializes the agent to have knowledge of the maze + relevant hyperparams
-        
+
         Params:
             maze: Custom Maze type with helper functions to describe the cells present in the given maze
             discount_factor: Gamma value to reduce the "importance" of future state utilities
-            threshold: Threshold to check for convergence
+            threshold: Threshold to check for convergence (same stopping test as UtilityAgent)
+            dtype: Float type of the value tables, Q table, history and transition probabilities
         """
         self.maze = maze
         self.discount_factor = discount_factor  # Discount factor (gamma)
 
         self.threshold = threshold
-        
-        self.u_table = np.zeros((maze.height, maze.width))
+
+        self.dtype = np.dtype(dtype)
+        self.floor = np.array(maze.grid) == MazeCell.FLOOR.value     # cells an action is chosen in
+        self.walls = np.array(maze.grid) == MazeCell.WALL.value
+        self.rewards = np.array([[maze.get_reward((rowIdx, colIdx)) for colIdx in range(maze.width)] for rowIdx in range(maze.height)], dtype=self.dtype)
+        self.probabilities = np.array([0.8, 0.1, 0.1], dtype=self.dtype)     # intended move, then the 2 lateral moves
+        self.next_cells = self.get_next_cells()
+
+        self.u_table = np.zeros((maze.height, maze.width), dtype=self.dtype)     # V(s)
+        self.stats = {}             # extra statistics gathered during the last solve
         self.init_policy()
 
     def init_policy(self):
         """
         Initializes the policy table at the start with a "placeholder" move
+          - The policy is an H x W int8 array of Move values (NO_ACTION for walls, reward and punishment cells)
         """
-        self.policy = []
-
-        # init policies
-        for rowIdx in range(len(self.u_table)):
-            row = self.u_table[rowIdx]
-            policy_row = []
-            for colIdx in range(len(row)):
-                state = (rowIdx, colIdx)
-                if(self.maze.is_wall(state) or self.maze.is_reward(state) or self.maze.is_punishment(state)):
-                    policy_row.append(None)
-                else:
-                    policy_row.append(Move(0))
-            self.policy.append(policy_row)
-
-    def policy_iteration(self, min_steps=1):
-        """
-        Performs Policy Iteration to update u_table and policy accordingly
+        self.policy = np.where(self.floor, Move.UP.value, NO_ACTION).astype(np.int8)
 
-        Params:
-            min_steps: int, controls the number of policy iterations
+    def get_next_cells(self):
         """
-        print("Policy iteration!")
-
-        iteration = 0
-        while(True):
-            # Policy evaluation
-            delta = 0   # to track the max difference in updated values
-            for rowIdx in range(self.maze.height):
-                for colIdx in range(self.maze.width):
-                    state = (rowIdx, colIdx)
+        Finds the cells every action can lead to from every cell (the cell itself when bumping into a wall / the border)
 
-                    # no calc needed for these cells
-                    if(self.maze.is_wall(state) or self.maze.is_reward(state) or self.maze.is_punishment(state)):
-                        continue
-
-                    cur_util = self.u_table[state]
-                    action = self.policy[state[0]][state[1]]
+        Returns:
+            next_cells: (H, W, len(Move), 3) array of flat cell indices (row * W + col), indexed by Move value, then the outcome
+                        (intended move and both lateral moves, same order as self.probabilities)
+        """
+        rows, cols = np.indices((self.maze.height, self.maze.width))
+        walls = np.array(self.maze.grid) == MazeCell.WALL.value
+        offsets = {
+            Move.UP: (-1, 0),
+            Move.DOWN: (1, 0),
+            Move.LEFT: (0, -1),
+            Move.RIGHT: (0, 1)
+        }
 
-                    util = self.get_expected_utility(state, action)
-                    self.u_table[state] = util
+        move_cells = {}
+        for move, (dy, dx) in offsets.items():
+            target_rows, target_cols = rows + dy, cols + dx
+            inside = (target_rows >= 0) & (target_rows < self.maze.height) & (target_cols >= 0) & (target_cols < self.maze.width)
+            blocked = ~inside
+            blocked[inside] = walls[target_rows[inside], target_cols[inside]]
 
-            # Policy improvement
-            policy_stable = True
-            for rowIdx in range(self.maze.height):
-                for colIdx in range(self.maze.width):
-                    state = (rowIdx, colIdx)
-                    if(self.maze.is_wall(state) or self.maze.is_reward(state) or self.maze.is_punishment(state)):
-                        continue
+            move_cells[move] = np.where(blocked, rows, target_rows) * self.maze.width + np.where(blocked, cols, target_cols)
 
-                    _, best_move, has_updated = self.get_max_expected_utility(state)
+        outcomes = [[action] + self.get_lateral_moves(action) for action in Move]
+        return np.stack([np.stack([move_cells[move] for move in moves], axis=-1) for moves in outcomes], axis=-2)
 
-                    if has_updated:     # a new move has been found to be more optimal
-                        self.policy[rowIdx][colIdx] = best_move
-                        policy_stable = False
+    def get_gains(self, v_table):
+        """
+        Gets R(s') + y * V(s') of landing in each cell (the utility U(s') of UtilityAgent)
+        """
+        return self.rewards + self.discount_factor * v_table
 
-            iteration += 1
-            if(iteration == min_steps):
-                if policy_stable:
-                    print("Policy Iteration converged!")
-                else:
-                    print("Policy Iteration did not converge!")
-                break
+    def get_utilities(self, gains):
+        """
+        Gets the utilities U(s) = R(s) + y * V(s) kept in the history from get_gains, walls are 0 like in UtilityAgent's history
+        """
+        return np.where(self.walls, 0, gains).astype(self.dtype)
 
-    def value_iteration(self, min_steps=1):
+    def check_options(self, checkpoint_path):
         """
-        Performs Value Iteration to update u_table and policy accordingly
+        Refuses the UtilityAgent solve options this agent does not support
+        """
+        if(checkpoint_path is not None):
+            raise ValueError("ValueAgent solves can't be checkpointed, use UtilityAgent for checkpoint_path")
 
-        Params:
-            min_steps: int, controls the number of value iterations
+    def get_q_table(self, gains):
         """
-        print("Value iteration!")
+        Calculates the full Q table
 
-        iteration = 0
-        while(True):
-            delta = 0   # to track the max difference in updated values
+        Params:
+            gains: H x W array of R(s') + y * V(s'), see get_gains
 
-            # for each state s in S,
-            for rowIdx in range(self.maze.height):
-                for colIdx in range(self.maze.width):
-                    state = (rowIdx, colIdx)
+        Returns:
+            q_table: (H, W, len(Move)) array of Q(s, a)
+        """
+        next_gains = gains.ravel()[self.next_cells]
 
-                    # no calc needed for these cells
-                    if(self.maze.is_wall(state) or self.maze.is_reward(state) or self.maze.is_punishment(state)):
-                        continue
+        # accumulated one outcome at a time, in the same order as StateSpace.expected_utilities
+        q_table = self.probabilities[0] * next_gains[..., 0]
+        for j in range(1, len(self.probabilities)):
+            q_table += self.probabilities[j] * next_gains[..., j]
+        return q_table
 
-                    cur_util = self.u_table[state]
+    def get_policy_grid(self):
+        """
+        Gets the current policy as Move() laid out on the H x W grid (None for non-floor cells)
+        """
+        return [[None if action == NO_ACTION else Move(int(action)) for action in row] for row in self.policy]
 
-                    max_util, best_move, _ = self.get_max_expected_utility(state)
-                    self.u_table[state] = max_util
+    def policy_iteration(self, max_steps=1, history_stride=1, deadline=None, checkpoint_path=None, profile=False):
+        """
+        Performs Policy Iteration to update u_table and policy accordingly
+          - Same loop as UtilityAgent.policy_iteration: one evaluation backup with the current policy, then a greedy improvement,
+            until no action changes
+          - With a deadline, the policy found so far is returned once the time is up (stats["deadline_hit"])
+          - With profile, stats["profile"] gets the memory / allocation profile of the solve (see profiler.SolveProfiler)
 
-                    self.policy[rowIdx][colIdx] = best_move     # update policy
-                    delta = max(delta, abs(cur_util - max_util))
-            iteration += 1
-            if(iteration == min_steps):
-                if delta <= self.threshold:
-                    print("Value iteration converged!")
-                else:
-                    print("Value iteration did not converge!")
-                break
+        Params:
+            max_steps: int, controls the maximum number of policy iterations
+            history_stride: Only keep every n-th utility table in the returned history
+            deadline: Wall-clock budget in seconds, None to only stop on convergence / max_steps
+            checkpoint_path: Not supported, must be None (see check_options)
+            profile: Bool to profile the memory use of each phase
 
-    def get_max_expected_utility(self, state):
+        Returns:
+            utilities: ndarray of utilities U = R + y * V over each iteration (last entry would just be the final utilities)
+            policy: the resulting optimal policies for each grid cell
+            exec_time: time taken to execute the iteration function
         """
-            Finds max. expected utility and the corresponding optimal move for a given state (goes through all possible actions)
+        self.check_options(checkpoint_path)
+        profiler = SolveProfiler() if profile else NULL_PROFILER
+        if(profile):
+            profiler.start()
+        start_time = time.time()
+
+        # each entry is the utility table a loop starts from
+        with profiler.phase("history"):
+            history = [self.get_utilities(self.get_gains(self.u_table))]
+        self.stats = {"policy_changes": [], "deltas": []}
+        deadline_hit = False
 
-            Params:
-                state: Tuple[int, int] indicating the position
+        iteration = 0
+        while(True):
+            # Policy evaluation (using cur policy, eval values)
+            with profiler.phase("evaluation"):
+                q_table = self.get_q_table(self.get_gains(self.u_table))
+                cur_moves = np.where(self.floor, self.policy, 0)[..., np.newaxis]
+                v_prime_table = np.where(self.floor, np.take_along_axis(q_table, cur_moves, axis=2)[..., 0], 0)
+
+            # Policy improvement (both steps use the same Q table)
+            with profiler.phase("improvement"):
+                best_moves = np.where(self.floor, np.argmax(q_table, axis=2), NO_ACTION).astype(np.int8)
+                changed = int(np.count_nonzero(best_moves != self.policy))
+                self.policy = best_moves
+
+            # the change of the utilities R + y * V, i.e. the delta of UtilityAgent
+            delta = self.discount_factor * float(np.max(np.abs(v_prime_table - self.u_table)[self.floor], initial=0))
+            self.u_table = v_prime_table
+            self.stats["policy_changes"].append(changed)
+            self.stats["deltas"].append(delta)
+            iteration += 1
 
-            Returns:
-                max_util: Max. possible utility (float)
-                best_move: Move.[UP/DOWN/LEFT/RIGHT]
-                new_optimal_move: boolean (whether or not a new move is selected)
-        """
-        cur_move = self.policy[state[0]][state[1]]      # get the existing policy
-        best_move = None
+            if(changed == 0):
+                print(f"Policy Iteration converged after {iteration} loops!")
+                break
+            elif(iteration == max_steps):
+                print(f"Policy Iteration did not converge! Terminating after {iteration} loops!")
+                break
 
-        max_util = sys.float_info.min
+            if(iteration % max(1, history_stride) == 0):
+                with profiler.phase("history"):
+                    history.append(self.get_utilities(self.get_gains(self.u_table)))
 
-        for i in range(len(Move)):
-            util = self.get_expected_utility(state, Move(i))
+            if(deadline is not None and time.time() - start_time >= deadline):
+                deadline_hit = True
+                print(f"Policy Iteration hit the {deadline}s deadline after {iteration} loops!")
+                break
 
-            if(util > max_util):
-                max_util = util
-                best_move = Move(i)
+        self.stats["iterations"] = iteration
+        self.stats["deadline_hit"] = deadline_hit
+        with profiler.phase("history"):
+            utilities = np.stack(history, axis=0)
+        exec_time = time.time() - start_time
+        if(profile):
+            self.stats["profile"] = profiler.stop()
 
-        new_optimal_move = False    # tracks whether a new move has been selected or not
-        if best_move != None and best_move != cur_move:
-            new_optimal_move = True
-        
-        if best_move == None:
-            best_move = cur_move
+        return utilities, self.get_policy_grid(), exec_time
 
-        return max_util, best_move, new_optimal_move
-            
-    def get_expected_utility(self, state, action):
+    def value_iteration(self, max_steps=1, history_stride=1, deadline=None, checkpoint_path=None, profile=False):
         """
-        Finds expected utility for a given state + action
+        Performs Value Iteration to update u_table and policy accordingly
+          - Same stopping test as UtilityAgent.value_iteration, the policy is greedy w.r.t. the Q table of the last sweep
+          - With a deadline, the policy found so far is returned once the time is up (stats["deadline_hit"])
+          - With profile, stats["profile"] gets the memory / allocation profile of the solve (see profiler.SolveProfiler)
 
         Params:
-            state: Tuple[int, int] representing CURRENT state
-            action: Move() representing the policy(state) value
+            max_steps: int, controls the maximum number of value iterations
+            history_stride: Only keep every n-th utility table in the returned history
+            deadline: Wall-clock budget in seconds, None to only stop on convergence / max_steps
+            checkpoint_path: Not supported, must be None (see check_options)
+            profile: Bool to profile the memory use of each phase
+
+        Returns:
+            utilities: ndarray of utilities U = R + y * V over each iteration (last entry would just be the final utilities)
+            policy: the resulting optimal policies for each grid cell
+            exec_time: time taken to execute the iteration function
         """
+        self.check_options(checkpoint_path)
+        profiler = SolveProfiler() if profile else NULL_PROFILER
+        if(profile):
+            profiler.start()
+        start_time = time.time()
+        epsilon = self.threshold * (1 - self.discount_factor) / self.discount_factor
+
+        gains = self.get_gains(self.u_table)
+        with profiler.phase("history"):
+            history = [self.get_utilities(gains)]
+
+        deltas = []
+        deadline_hit = False
+        iteration = 0
+        while(True):
+            # for each state s, max over a of sum(P(s' | s, a) * (R(s') + y * V(s')))
+            with profiler.phase("evaluation"):
+                q_table = self.get_q_table(gains)
+                self.u_table = np.where(self.floor, q_table.max(axis=2), 0)
+
+                # the change is measured on the gains R + y * V, i.e. the utilities UtilityAgent tests
+                new_gains = self.get_gains(self.u_table)
+                delta = float(np.max(np.abs(new_gains - gains)[self.floor], initial=0))     # max difference in updated values
+                gains = new_gains
+            deltas.append(delta)
+            iteration += 1
 
-        print("Get expected utility!")
-        probabilities = [0.8, 0.1, 0.1]
-        util = 0
+            if(delta < epsilon):
+                print(f"Value iteration converged after {iteration} loops!")
+                break
+            elif(iteration == max_steps):
+                print(f"Value Iteration did not converge! Terminating after {iteration} loops!")
+                break
 
-        actions = [action]    # stores all the possible action(s) given the initial action choice
-        actions.extend(self.get_lateral_moves(action))  # get the sideways movement options
+            if(iteration % max(1, history_stride) == 0):
+                with profiler.phase("history"):
+                    history.append(self.get_utilities(gains))
 
-        # calculate the utility for this particular chosen action
-        for j in range(len(actions)):
-            next_state = self.get_next_state(state, actions[j])  
-            util += probabilities[j] * (self.maze.get_reward(next_state) + self.discount_factor * self.u_table[next_state])
+            if(deadline is not None and time.time() - start_time >= deadline):
+                deadline_hit = True
+                print(f"Value Iteration hit the {deadline}s deadline after {iteration} sweeps!")
+                break
 
-        return util
-    
-    def get_next_state(self, cur_state, action):
-        """
-        Get the next state based on the current state + action.
-        Also accounts for the possibility of going out of bounds / into a wall.
+        with profiler.phase("policy_extraction"):
+            self.policy = np.where(self.floor, np.argmax(q_table, axis=2), NO_ACTION).astype(np.int8)
+        self.stats = {"iterations": iteration, "backups": iteration * int(self.floor.sum()), "deltas": deltas, "deadline_hit": deadline_hit}
 
-        Returns:
-            next_state: Tuple[int, int] for the resulting state
-        """
-        y, x = cur_state
-
-        if action == Move.UP:
-            next_state = (y - 1, x)
-        elif action == Move.RIGHT:
-            next_state = (y, x + 1)
-        elif action == Move.DOWN:
-            next_state = (y + 1, x)
-        elif action == Move.LEFT:
-            next_state = (y, x - 1)
-        else:
-            next_state = cur_state  # Invalid action
-        
-        # if state val is out of bounds of the env, or is a wall - return the original position (no state transition)
-        if (self.maze.is_out_of_bounds(next_state) or self.maze.is_wall(next_state)):
-            return cur_state
-        return next_state
+        with profiler.phase("history"):
+            utilities = np.stack(history, axis=0)
+        exec_time = time.time() - start_time
+        if(profile):
+            self.stats["profile"] = profiler.stop()
+
+        return utilities, self.get_policy_grid(), exec_time
 
     def get_lateral_moves(self, action):
         """
@@ -228,43 +289,23 @@ class ValueAgent:
         }
 
         return lateral_actions[action]
-    
-    def print_u_table(self):
+
+    def print_u_table(self, viewport=None):
         """
-        Helper function to show the utility table stored so far
+        Helper function to show the value table stored so far
+
+        Params:
+            viewport: Optional ((row_start, row_stop), (col_start, col_stop)) window, big grids are shown as an overview
         """
-        for i in range(len(self.u_table)):
-            row = self.u_table[i]
-            column_headers = [idx for idx in range(len(row))]
-            if(i == 0): # print col index
-                print("   ", end="")
-                for header in column_headers:
-                    print(f"  {header}  ", end="")
-                print()
-             
-            for j in range(len(row)):
-                if(j == 0):
-                    print(f"{i}  ", end="")     # print row index
-                print(f" {row[j]} ", end="")
-            print()
+        print(TextRenderer(viewport=viewport).render_utilities(self.u_table, maze=self.maze))
         print()
 
-    def print_policy(self):
+    def print_policy(self, viewport=None):
         """
         Helper function to print the optimal action (policy) so far
+
+        Params:
+            viewport: Optional ((row_start, row_stop), (col_start, col_stop)) window, big grids are shown as an overview
         """
-        for rowIdx in range(self.maze.height):
-            column_headers = [idx for idx in range(len(self.maze.grid[rowIdx]))]
-            if(rowIdx == 0): # print col index
-                print("   ", end="")
-                for header in column_headers:
-                    print(f" {header} ", end="")
-                print()
-
-            for colIdx in range(self.maze.width):
-                if(colIdx == 0):
-                    print(f"{rowIdx}  ", end="")     # print row index
-
-                print(f" {self.policy[rowIdx][colIdx]} ", end="")
-            print()
-        print()
\ No newline at end of file
+        print(TextRenderer(viewport=viewport).render_policy(self.get_policy_grid(), maze=self.maze))
+        print()